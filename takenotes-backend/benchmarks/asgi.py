@@ -0,0 +1,62 @@
+"""
+Sustained throughput and p99 latency: WSGI vs ASGI, sync vs async views.
+
+Runs the app under gunicorn (config/wsgi.py) and uvicorn (config/asgi.py)
+against an on-disk copy of the benchmark database, and drives the notes list
+with many concurrent keep-alive connections:
+
+- wsgi  + DRF view    GET /api/notes/
+- asgi  + DRF view    GET /api/notes/        (each request on a worker thread)
+- asgi  + async view  GET /api/async/notes/
+
+    python -m benchmarks.asgi [--concurrency 256] [--duration 15] [--workers 1]
+"""
+import argparse
+
+from .harness import setup_django, test_database, report, create_user, seed_notes
+from .loadgen import free_port, run_load, serve, server_command
+
+SCENARIOS = [
+    ('wsgi', '/api/notes/'),
+    ('asgi', '/api/notes/'),
+    ('asgi', '/api/async/notes/'),
+]
+
+
+def run(connection, notes, concurrency, duration, workers):
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    user = create_user()
+    seed_notes(user, notes)
+    headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+    env = {'DATABASE_URL': f"sqlite:///{connection.settings_dict['NAME']}"}
+
+    results = []
+    for kind, path in SCENARIOS:
+        port = free_port()
+        with serve(server_command(kind, port, workers=workers), port, env=env) as base_url:
+            url = f'{path}?page_size=20'
+            # warm up connections, caches and the user cache
+            run_load(base_url, url, headers, concurrency=8, duration=2)
+            stats = run_load(base_url, url, headers, concurrency=concurrency, duration=duration)
+        results.append({'server': kind, 'path': path, 'concurrency': concurrency, **stats})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--notes', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=256)
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database(on_disk=True) as connection:
+        # the servers open their own connections to the database file
+        connection.close()
+        report('asgi', run(connection, args.notes, args.concurrency, args.duration, args.workers))
+
+
+if __name__ == '__main__':
+    main()
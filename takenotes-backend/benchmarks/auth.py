@@ -0,0 +1,65 @@
+"""
+Per-request cost of resolving the JWT user, with and without the user cache.
+
+Sends the same Bearer-authenticated GET /api/notes/ request through the notes
+list view with plain JWTAuthentication and with CachedJWTAuthentication, and
+reports the queries and time per request for each.
+
+    python -m benchmarks.auth [--requests 2000]
+"""
+import argparse
+
+from .harness import setup_django, test_database, timed, summarize, report, create_user, seed_notes
+
+
+def run(requests, notes, repeat):
+    from django.db import connection, reset_queries
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.test import APIRequestFactory
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.tokens import AccessToken
+    from notes.views import NoteViewSet
+    from users.authentication import CachedJWTAuthentication
+
+    user = create_user()
+    seed_notes(user, notes)
+    auth = f'Bearer {AccessToken.for_user(user)}'
+    factory = APIRequestFactory()
+
+    results = []
+    for authentication_class in (JWTAuthentication, CachedJWTAuthentication):
+        view = NoteViewSet.as_view({'get': 'list'}, authentication_classes=[authentication_class])
+
+        def fetch():
+            response = view(factory.get('/api/notes/', {'page_size': 20}, HTTP_AUTHORIZATION=auth))
+            response.render()
+            assert response.status_code == 200, response.status_code
+
+        fetch()
+        reset_queries()
+        with CaptureQueriesContext(connection) as ctx:
+            fetch()
+        timings = timed(lambda: [fetch() for _ in range(requests)], repeat)
+        results.append({
+            'authentication': authentication_class.__name__,
+            'queries_per_request': len(ctx.captured_queries),
+            'per_request_us': round(min(timings) * 1000 / requests, 1),
+            f'{requests}_requests': summarize(timings),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--notes', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database():
+        report('auth', run(args.requests, args.notes, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
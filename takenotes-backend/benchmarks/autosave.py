@@ -0,0 +1,77 @@
+"""
+Autosave PUTs through NoteViewSet.update: unchanged and edited payloads.
+
+Sends ``--requests`` full PUTs of one note's title, content and category,
+either resending what is stored (an idle autosave) or with the content
+changed each time, and reports queries, UPDATE statements and time per
+request. ``full save`` is the old behaviour, where every PUT saved all
+columns; ``changed fields`` is the current NoteSerializer.update. Runs on an
+on-disk database, so each write pays for its commit.
+
+    python -m benchmarks.autosave [--requests 1000]
+"""
+import argparse
+from unittest import mock
+
+from .harness import setup_django, test_database, timed, summarize, report, create_user
+
+
+def run(requests, repeat):
+    from django.db import connection, reset_queries
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework import serializers
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    from notes.models import Category, Note
+    from notes.serializers import NoteSerializer
+    from notes.views import NoteViewSet
+
+    user = create_user()
+    category = Category.objects.create(user=user, name='Work')
+    note = Note.objects.create(user=user, category=category, title='Draft', content='Lorem ipsum ' * 200)
+    view = NoteViewSet.as_view({'put': 'update'})
+    factory = APIRequestFactory()
+    counter = iter(range(10 ** 9))
+
+    def put(edited):
+        content = 'Lorem ipsum ' * 200 + (str(next(counter)) if edited else '')
+        body = {'title': 'Draft', 'content': content, 'category': str(category.pk)}
+        request = factory.put(f'/api/notes/{note.pk}/', body, format='json')
+        force_authenticate(request, user=user)
+        response = view(request, pk=note.pk)
+        assert response.status_code == 200, response.status_code
+
+    results = []
+    for mode, update in (('full save', serializers.ModelSerializer.update), ('changed fields', NoteSerializer.update)):
+        with mock.patch.object(NoteSerializer, 'update', update):
+            for payload, edited in (('unchanged', False), ('edited', True)):
+                put(edited)
+                reset_queries()
+                with CaptureQueriesContext(connection) as ctx:
+                    put(edited)
+                updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+                timings = timed(lambda: [put(edited) for _ in range(requests)], repeat)
+                results.append({
+                    'mode': mode,
+                    'payload': payload,
+                    'queries_per_request': len(ctx.captured_queries),
+                    'updates_per_request': len(updates),
+                    'columns_written': updates[0].split(' SET ', 1)[1].count('= ') if updates else 0,
+                    'per_request_us': round(min(timings) * 1000 / requests, 1),
+                    f'{requests}_requests': summarize(timings),
+                })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database(on_disk=True):
+        report('autosave', run(args.requests, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
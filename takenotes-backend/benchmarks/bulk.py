@@ -0,0 +1,62 @@
+"""
+One request per note vs a single batch request.
+
+Creates the same notes through POST /api/notes/ one at a time and through
+POST /api/notes/bulk-create/ in one go. Requests carry a real JWT, so each
+single-note request pays token decoding and the user lookup as in production.
+
+    python -m benchmarks.bulk [--notes 1000]
+"""
+import argparse
+
+from .harness import setup_django, test_database, timed, summarize, report, create_user
+
+
+def run(notes, repeat):
+    from rest_framework.test import APIRequestFactory
+    from rest_framework_simplejwt.tokens import AccessToken
+    from notes.models import Category, Note
+    from notes.views import NoteViewSet
+
+    user = create_user()
+    Category.objects.create(user=user, name='Random Thoughts')
+    auth = f'Bearer {AccessToken.for_user(user)}'
+    single_view = NoteViewSet.as_view({'post': 'create'})
+    bulk_view = NoteViewSet.as_view({'post': 'bulk_create'}, **NoteViewSet.bulk_create.kwargs)
+    factory = APIRequestFactory()
+    payload = [{'title': f'Note {i}', 'content': 'Lorem ipsum dolor sit amet. ' * 8} for i in range(notes)]
+
+    def post(view, path, data):
+        request = factory.post(path, data, format='json', HTTP_AUTHORIZATION=auth)
+        response = view(request)
+        response.render()
+        assert response.status_code == 201, response.status_code
+
+    def one_by_one():
+        for item in payload:
+            post(single_view, '/api/notes/', item)
+
+    def batched():
+        post(bulk_view, '/api/notes/bulk-create/', payload)
+
+    results = []
+    for name, fn in (('single_requests', one_by_one), ('bulk_request', batched)):
+        timings = timed(fn, repeat)
+        results.append({'notes': notes, 'mode': name, **summarize(timings)})
+        Note.objects.all().delete()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--notes', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database():
+        report('bulk', run(args.notes, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
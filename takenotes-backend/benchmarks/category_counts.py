@@ -0,0 +1,84 @@
+"""
+Category list with counted against stored note counts, and what the counters cost writes.
+
+Seeds ``--notes`` notes spread over ``--categories`` categories and loads the
+user's categories both ways: with ``note_count`` annotated by a COUNT over the
+notes, as the list used to, and with the stored counter. Then times single
+note creates, moves and deletes, which each adjust a counter with one F()
+UPDATE, against that UPDATE on its own.
+
+    python -m benchmarks.category_counts [--notes 100000 --categories 10]
+"""
+import argparse
+
+from .harness import setup_django, test_database, timed, summarize, report, create_user, seed_notes
+
+
+def run(notes, categories, writes, repeat):
+    from django.db import connection
+    from django.db.models import Count, Q
+    from django.test.utils import CaptureQueriesContext
+    from notes import counters
+    from notes.models import Category, Note
+    from notes.views import category_queryset
+
+    user = create_user()
+    owned = [Category.objects.create(user=user, name=f'Category {i}') for i in range(categories)]
+    for category in owned:
+        seed_notes(user, notes // categories, category=category)
+
+    loads = {
+        'counted': lambda: list(
+            Category.objects.filter(user=user)
+            .annotate(counted=Count('notes', filter=Q(notes__user=user)))
+            .order_by('name')
+        ),
+        'stored': lambda: list(category_queryset(user)),
+    }
+    reads = {name: [] for name in loads}
+    # alternate the two round by round, so drift hits both alike
+    for _ in range(repeat):
+        for name, load in loads.items():
+            reads[name] += timed(load, 1)
+    results = [{'category_list': name, 'load': summarize(reads[name])} for name in loads]
+
+    first, second = owned[0], owned[1]
+
+    def create_move_delete():
+        note = Note.objects.create(user=user, category=first, title='new')
+        note.category = second
+        note.save(update_fields=['category', 'updated_at'])
+        note.delete()
+
+    with CaptureQueriesContext(connection) as ctx:
+        create_move_delete()
+    counter_queries = sum('"note_count"' in query['sql'] for query in ctx.captured_queries)
+    cycles = timed(lambda: [create_move_delete() for _ in range(writes)], repeat)
+    updates = timed(lambda: [counters.adjust(user.pk, {first.pk: 1, second.pk: -1}) for _ in range(writes)], repeat)
+    results.append({
+        'writes': 'create, move, delete one note',
+        'per_cycle_us': round(min(cycles) * 1000 / writes, 1),
+        'counter_updates': counter_queries,
+        'counter_update_us': round(min(updates) * 1000 / writes / 2, 1),
+        'queries': len(ctx.captured_queries),
+    })
+    # only the two categories the direct adjust() calls above pushed off
+    assert counters.reconcile() == 2
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--notes', type=int, default=100000)
+    parser.add_argument('--categories', type=int, default=10)
+    parser.add_argument('--writes', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database():
+        report('category_counts', run(args.notes, args.categories, args.writes, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
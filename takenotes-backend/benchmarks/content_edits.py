@@ -0,0 +1,83 @@
+"""
+Autosaving a small edit to a large note: full PATCH vs content edits.
+
+Each round changes a few words in the middle of a ``--size`` KB note, either
+by PATCHing the whole content to /api/notes/{id}/ or by sending the splice to
+/api/notes/{id}/content/ with the note's ETag, and reports request and response
+bytes and time per edit for each.
+
+    python -m benchmarks.content_edits [--size 500] [--edits 200]
+"""
+import argparse
+
+from .harness import setup_django, test_database, timed, summarize, report, create_user
+
+
+def run(size_kb, edits, repeat):
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    from notes.models import Note
+    from notes.sync import note_etag
+    from notes.views import NoteViewSet
+
+    user = create_user()
+    # no trailing space: a full PATCH trims the content, a content edit does not
+    text = ('lorem ipsum dolor sit amet consectetur adipiscing elit ' * (size_kb * 20))[:size_kb * 1024].rstrip()
+    middle = len(text) // 2
+    factory = APIRequestFactory()
+    views = {
+        'full content': NoteViewSet.as_view({'patch': 'partial_update'}),
+        'content edits': NoteViewSet.as_view({'patch': 'edit_content'}),
+    }
+
+    results = []
+    for mode, view in views.items():
+        note = Note.objects.create(user=user, title='Big note', content=text)
+        state = {'content': text, 'etag': note_etag(note.updated_at), 'round': 0}
+
+        def autosave():
+            state['round'] += 1
+            word = f'edit {state["round"]:06d}'
+            state['content'] = state['content'][:middle] + word + state['content'][middle + len(word):]
+            if mode == 'full content':
+                body, headers = {'content': state['content']}, {}
+            else:
+                body = {'edits': [{'start': middle, 'end': middle + len(word), 'text': word}]}
+                headers = {'HTTP_IF_MATCH': state['etag']}
+            request = factory.patch(f'/api/notes/{note.pk}/', body, format='json', **headers)
+            request_bytes = len(request.body)
+            force_authenticate(request, user=user)
+            response = view(request, pk=note.pk)
+            response.render()
+            assert response.status_code == 200, response.status_code
+            state['etag'] = response['ETag']
+            return request_bytes, len(response.content)
+
+        request_bytes, response_bytes = autosave()
+        timings = timed(lambda: [autosave() for _ in range(edits)], repeat)
+        note.refresh_from_db()
+        assert note.content == state['content']
+        results.append({
+            'mode': mode,
+            'note_kb': size_kb,
+            'request_bytes': request_bytes,
+            'response_bytes': response_bytes,
+            'per_edit_ms': round(min(timings) / edits, 3),
+            f'{edits}_edits': summarize(timings),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--size', type=int, default=500, help='note size in KB')
+    parser.add_argument('--edits', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database():
+        report('content_edits', run(args.size, args.edits, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
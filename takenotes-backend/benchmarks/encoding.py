@@ -0,0 +1,80 @@
+"""
+Payload size and render time of a large notes list, per encoding option.
+
+Seeds ``--notes`` notes and renders all of them the way the list endpoint does,
+with every field and with the card fields only (``?fields=``, no ``content``),
+through DRF's JSONRenderer and FastJSONRenderer (orjson), then compresses the
+JSON with gzip and Brotli at the configured levels. Reports the time of each
+step and the bytes that would be sent.
+
+    python -m benchmarks.encoding [--notes 10000]
+"""
+import argparse
+
+from .harness import setup_django, test_database, timed, report, create_user, seed_notes
+
+CARD_FIELDS = ['id', 'title', 'category', 'category_name', 'category_color', 'updated_at', 'last_edited_label']
+
+
+def run(notes, repeat):
+    import random
+    from rest_framework.renderers import JSONRenderer
+    from config import compression
+    from notes.models import Category
+    from notes.renderers import FastJSONRenderer, orjson
+    from notes.serializers import NoteValuesSerializer
+    from notes.views import note_queryset
+
+    user = create_user()
+    category = Category.objects.create(user=user, name='Work', color='#10B981')
+    words = 'the a note idea meeting list draft plan review project team call later today fix ship write read'.split()
+    rng = random.Random(0)
+    seed_notes(user, notes, category=category, content=lambda i: ' '.join(rng.choice(words) for _ in range(300)))
+
+    renderers = {'drf json': JSONRenderer()}
+    if orjson is not None:
+        renderers['orjson'] = FastJSONRenderer()
+    codings = compression.encoders()
+
+    def best(fn):
+        # the result of the last run, with the fastest time in ms
+        result = {}
+        timings = timed(lambda: result.update(value=fn()), repeat)
+        return result['value'], round(min(timings), 2)
+
+    results = []
+    for label, fields in (('all fields', None), ('card fields', CARD_FIELDS)):
+        queryset = note_queryset(user, {}).values(*NoteValuesSerializer.columns(fields))
+        rows, query_ms = best(lambda: list(queryset.all()))
+        data, serialize_ms = best(lambda: NoteValuesSerializer(rows, many=True, fields=fields).data)
+        for name, renderer in renderers.items():
+            body, render_ms = best(lambda: renderer.render(data))
+            result = {
+                'fields': label,
+                'renderer': name,
+                'query_ms': query_ms,
+                'serialize_ms': serialize_ms,
+                'render_ms': render_ms,
+                'identity_bytes': len(body),
+            }
+            for coding, encode in codings.items():
+                compressed, compress_ms = best(lambda: encode(body))
+                result[f'{coding}_bytes'] = len(compressed)
+                result[f'{coding}_ms'] = compress_ms
+            results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--notes', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database():
+        report('encoding', run(args.notes, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Change feed fan-out under uvicorn: write-to-event latency on open SSE streams.
+
+Opens ``--devices`` /api/async/events/ streams for each of ``--users`` users,
+then has every user create ``--writes`` notes through POST /api/notes/, one
+after another. Latency is measured per stream from sending the POST to
+reading the matching ``note.created`` event; the server's own view of the
+feed comes from /api/notes/event-stats/.
+
+    python -m benchmarks.events [--users 50] [--devices 4] [--writes 20]
+"""
+import argparse
+import asyncio
+import json
+import time
+import urllib.request
+
+from .harness import setup_django, test_database, report, create_user
+from .loadgen import free_port, percentile, serve, server_command
+
+
+async def open_stream(port, token):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write((
+        f'GET /api/async/events/ HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n'
+        f'Authorization: Bearer {token}\r\nAccept: text/event-stream\r\n\r\n'
+    ).encode())
+    await writer.drain()
+    return reader, writer
+
+
+async def read_events(reader, count, arrivals):
+    """Record the arrival time of the first ``count`` note.created events."""
+    while len(arrivals) < count:
+        line = await reader.readline()
+        if not line:
+            return
+        # chunk-size lines and event data are skipped, only the event names matter
+        if line.startswith(b'event: note.created'):
+            arrivals.append(time.perf_counter())
+
+
+async def post_note(port, token, title):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    body = json.dumps({'title': title}).encode()
+    writer.write((
+        f'POST /api/notes/ HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\nAuthorization: Bearer {token}\r\n'
+        f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n'
+    ).encode() + body)
+    await writer.drain()
+    await reader.read()
+    writer.close()
+
+
+async def drive(port, tokens, devices, writes):
+    streams = []
+    for token in tokens:
+        for _ in range(devices):
+            reader, writer = await open_stream(port, token)
+            # wait for the ready event, so the subscription exists before writing
+            while not (await reader.readline()).startswith(b'event: ready'):
+                pass
+            streams.append((token, reader, writer, []))
+
+    sent = {token: [] for token in tokens}
+
+    async def writer_for(token):
+        for n in range(writes):
+            sent[token].append(time.perf_counter())
+            await post_note(port, token, f'note {n}')
+
+    readers = [read_events(reader, writes, arrivals) for _, reader, _, arrivals in streams]
+    await asyncio.wait_for(asyncio.gather(*readers, *(writer_for(token) for token in tokens)), 120)
+
+    latencies = [
+        arrival - sent[token][n]
+        for token, _, _, arrivals in streams
+        for n, arrival in enumerate(arrivals)
+    ]
+    for _, _, writer, _ in streams:
+        writer.close()
+    return latencies
+
+
+def run(connection, users, devices, writes):
+    from rest_framework_simplejwt.tokens import AccessToken
+    from notes.models import Category
+
+    tokens = []
+    for n in range(users):
+        user = create_user(f'feed{n}@example.com')
+        Category.objects.create(user=user, name='Random Thoughts')
+        tokens.append(str(AccessToken.for_user(user)))
+    admin = create_user('admin@example.com')
+    admin.is_staff = True
+    admin.save()
+    admin_token = AccessToken.for_user(admin)
+    connection.close()
+
+    port = free_port()
+    env = {'DATABASE_URL': f"sqlite:///{connection.settings_dict['NAME']}"}
+    with serve(server_command('asgi', port), port, env=env) as base_url:
+        latencies = asyncio.run(drive(port, tokens, devices, writes))
+        request = urllib.request.Request(
+            f'{base_url}/api/notes/event-stats/', headers={'Authorization': f'Bearer {admin_token}'},
+        )
+        server = json.load(urllib.request.urlopen(request))
+
+    return {
+        'streams': users * devices,
+        'writes': users * writes,
+        'events_received': len(latencies),
+        'events_expected': users * devices * writes,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'server': server,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--devices', type=int, default=4)
+    parser.add_argument('--writes', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database(on_disk=True) as connection:
+        report('events', run(connection, args.users, args.devices, args.writes))
+
+
+if __name__ == '__main__':
+    main()
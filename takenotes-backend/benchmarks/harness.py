@@ -0,0 +1,120 @@
+"""
+Shared helpers for the benchmark scripts in this package.
+
+Benchmarks run against a throwaway test database (never the configured one), so
+they are safe to run on a developer machine:
+
+    python -m benchmarks.pagination
+"""
+import contextlib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+
+def setup_django():
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    # benchmarks send far more requests than any client may; servers they start inherit this
+    os.environ.setdefault('THROTTLING', 'off')
+    import django
+    django.setup()
+
+
+@contextlib.contextmanager
+def test_database(on_disk=False):
+    """
+    Create a fresh test database for the duration of the block.
+
+    SQLite test databases live in memory unless ``on_disk`` is set, which puts
+    them in a temporary file so commits pay for real disk syncs.
+    """
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    if on_disk and connection.vendor == 'sqlite':
+        connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.mkdtemp(), 'benchmark.sqlite3')
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def timed(fn, repeat=5):
+    """Run ``fn`` ``repeat`` times and return the timings in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summarize(timings):
+    return {
+        'median_ms': round(statistics.median(timings), 3),
+        'min_ms': round(min(timings), 3),
+        'max_ms': round(max(timings), 3),
+    }
+
+
+def report(name, results):
+    json.dump({'benchmark': name, 'results': results}, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+@contextlib.contextmanager
+def manual_timestamps(model):
+    """Let seeding code set created_at/updated_at explicitly on ``model``."""
+    fields = [model._meta.get_field('created_at'), model._meta.get_field('updated_at')]
+    saved = [(f.auto_now, f.auto_now_add) for f in fields]
+    for f in fields:
+        f.auto_now = f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, (auto_now, auto_now_add) in zip(fields, saved):
+            f.auto_now, f.auto_now_add = auto_now, auto_now_add
+
+
+def create_user(username='bench@example.com'):
+    from django.contrib.auth import get_user_model
+    return get_user_model().objects.create_user(username=username, password='bench-pass')
+
+
+def seed_notes(user, count, category=None, content='Lorem ipsum dolor sit amet. ' * 8, batch_size=5000,
+               spacing_seconds=1):
+    """
+    Bulk insert ``count`` notes with distinct, decreasing timestamps,
+    ``spacing_seconds`` apart.
+
+    ``content`` is either a string or a callable taking the note's index.
+    bulk_create skips the save signals, so seeded notes are not in the search
+    index until it is rebuilt; the category's note count is updated here.
+    """
+    import datetime
+    from django.utils import timezone
+    from notes import counters
+    from notes.models import Note, make_preview
+
+    now = timezone.now()
+    with manual_timestamps(Note):
+        for start in range(0, count, batch_size):
+            batch = []
+            for i in range(start, min(start + batch_size, count)):
+                stamp = now - datetime.timedelta(seconds=i * spacing_seconds)
+                text = content(i) if callable(content) else content
+                batch.append(Note(
+                    user=user, category=category, title=f'Note {i}', content=text, preview=make_preview(text),
+                    created_at=stamp, updated_at=stamp,
+                ))
+            Note.objects.bulk_create(batch, batch_size=batch_size)
+    if category is not None:
+        counters.adjust(user.pk, {category.pk: count})
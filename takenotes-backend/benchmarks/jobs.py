@@ -0,0 +1,79 @@
+"""
+Background jobs: what queueing saves a request, and how fast workers drain the queue.
+
+Seeds ``--notes`` notes and compares GET /api/notes/export/ (the whole export
+streamed inside the request) with POST /api/jobs/ queueing the same export,
+then times the export job itself. Then queues ``--jobs`` small imports and
+times ``manage.py run_jobs --burst`` draining them with 1 and ``--workers``
+threads. The database is an on-disk SQLite file, since pool threads open
+their own connections.
+
+    python -m benchmarks.jobs [--notes 50000 --jobs 200 --workers 4]
+"""
+import argparse
+import io
+import tempfile
+
+from .harness import setup_django, test_database, timed, summarize, report, create_user, seed_notes
+
+
+def run(notes, count, workers, repeat):
+    from django.core.management import call_command
+    from django.test.utils import override_settings
+    from rest_framework.test import APIClient
+    from notes import jobs
+    from notes.models import Job
+
+    user = create_user()
+    seed_notes(user, notes)
+    client = APIClient()
+    client.force_authenticate(user=user)
+
+    def stream_export():
+        response = client.get('/api/notes/export/', {'gzip': '1'})
+        assert response.status_code == 200, response.status_code
+        b''.join(response.streaming_content)
+
+    def queue_export():
+        assert client.post('/api/jobs/', {'kind': 'export', 'gzip': True}, format='json').status_code == 202
+
+    results = []
+    with override_settings(JOBS_RESULTS_DIR=tempfile.mkdtemp()):
+        results.append({'request': 'GET /api/notes/export/ (streamed)', 'time': summarize(timed(stream_export, repeat))})
+        results.append({'request': 'POST /api/jobs/ (queued export)', 'time': summarize(timed(queue_export, repeat))})
+        Job.objects.all().delete()
+        jobs.enqueue('export', user, gzip=True)
+        [pk] = jobs.claim('bench')
+        results.append({'job': 'export run by a worker', 'time': summarize(timed(lambda: jobs.run(pk, 'bench'), 1))})
+
+        for threads in sorted({1, workers}):
+            Job.objects.all().delete()
+            for i in range(count):
+                jobs.enqueue('import', user, notes=[{'title': f'Imported {i}'}])
+            [elapsed] = timed(lambda: call_command('run_jobs', '--burst', '--workers', str(threads), stdout=io.StringIO()), 1)
+            done = Job.objects.filter(status=Job.SUCCEEDED).count()
+            results.append({
+                'workers': threads,
+                'jobs': count,
+                'succeeded': done,
+                'retried': Job.objects.filter(attempts__gt=1).count(),
+                'jobs_per_second': round(done / elapsed * 1000, 1),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--notes', type=int, default=50000)
+    parser.add_argument('--jobs', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database(on_disk=True):
+        report('jobs', run(args.notes, args.jobs, args.workers, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
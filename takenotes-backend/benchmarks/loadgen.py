@@ -0,0 +1,138 @@
+"""
+A small closed-loop HTTP/1.1 load generator and helpers to run the app under a
+real server, for benchmarks that measure throughput and tail latency.
+
+Each of ``concurrency`` keep-alive connections sends its next request as soon as
+the previous response has been read, for ``duration`` seconds.
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from contextlib import contextmanager
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def serve(command, port, env=None, timeout=30):
+    """Run a server command from the project directory until the block exits."""
+    process = subprocess.Popen(
+        command, cwd=PROJECT_DIR, env={**os.environ, **(env or {})},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_up(port, timeout)
+        yield f'http://127.0.0.1:{port}'
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def wait_until_up(port, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/api/health/', timeout=1)
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f'server on port {port} did not come up')
+            time.sleep(0.2)
+
+
+def server_command(kind, port, workers=1, threads=8):
+    """Command line for running the app under gunicorn (WSGI) or uvicorn (ASGI)."""
+    bind = f'127.0.0.1:{port}'
+    if kind == 'wsgi':
+        return [sys.executable, '-m', 'gunicorn', 'config.wsgi:application', '--bind', bind,
+                '--workers', str(workers), '--threads', str(threads), '--log-level', 'warning']
+    if kind == 'asgi':
+        return [sys.executable, '-m', 'uvicorn', 'config.asgi:application', '--host', '127.0.0.1',
+                '--port', str(port), '--workers', str(workers), '--no-access-log', '--log-level', 'warning']
+    raise ValueError(f'unknown server kind: {kind}')
+
+
+async def read_response(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed')
+    length, close = 0, False
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'connection' and value.strip().lower() == 'close':
+            close = True
+    await reader.readexactly(length)
+    return int(status_line.split()[1]), close
+
+
+async def client(host, port, request, deadline, latencies, errors):
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status, close = await read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                errors.append(status)
+            if close:
+                writer.close()
+                writer = None
+        except (ConnectionError, asyncio.IncompleteReadError, OSError) as exc:
+            errors.append(type(exc).__name__)
+            if writer is not None:
+                writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+def run_load(base_url, path, headers=None, concurrency=64, duration=10.0):
+    """Hammer ``GET path`` and return throughput and latency percentiles."""
+    host, port = base_url.split('//', 1)[1].split(':')
+    lines = [f'GET {path} HTTP/1.1', f'Host: {host}:{port}']
+    lines += [f'{name}: {value}' for name, value in (headers or {}).items()]
+    request = ('\r\n'.join(lines) + '\r\n\r\n').encode()
+    latencies, errors = [], []
+
+    async def main():
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(
+            client(host, int(port), request, deadline, latencies, errors) for _ in range(concurrency)
+        ))
+
+    asyncio.run(main())
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'requests_per_second': round(len(latencies) / duration, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
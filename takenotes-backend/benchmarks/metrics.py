@@ -0,0 +1,81 @@
+"""
+Overhead of the request metrics middleware.
+
+Sends the same Bearer-authenticated GET /api/notes/ through the full Django
+stack (test client, every middleware) without RequestMetricsMiddleware, with it
+measuring every request, and with it sampling a tenth of them, and reports the
+time per request and the overhead against the baseline.
+
+    python -m benchmarks.metrics [--requests 2000]
+"""
+import argparse
+
+from .harness import setup_django, test_database, timed, summarize, report, create_user, seed_notes
+
+MIDDLEWARE = 'config.metrics.RequestMetricsMiddleware'
+
+
+def fetch(client, headers):
+    response = client.get('/api/notes/', {'page_size': 20}, headers=headers)
+    assert response.status_code == 200, response.status_code
+
+
+def run(requests, notes, repeat):
+    from django.conf import settings
+    from django.test import Client
+    from django.test.utils import override_settings
+    from rest_framework_simplejwt.tokens import AccessToken
+    from config import metrics
+
+    user = create_user()
+    seed_notes(user, notes)
+    headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+    without = [name for name in settings.MIDDLEWARE if name != MIDDLEWARE]
+    configurations = [
+        ('off', {'MIDDLEWARE': without}),
+        ('every request', {'MIDDLEWARE': [MIDDLEWARE, *without], 'REQUEST_METRICS_SAMPLE_RATE': 1.0}),
+        ('10% sampled', {'MIDDLEWARE': [MIDDLEWARE, *without], 'REQUEST_METRICS_SAMPLE_RATE': 0.1}),
+    ]
+
+    clients = {}
+    for name, overrides in configurations:
+        with override_settings(**overrides):
+            # a client loads the middleware chain on its first request
+            clients[name] = Client()
+            fetch(clients[name], headers)
+    metrics.clear()
+
+    # alternate the configurations round by round, so drift hits them all alike
+    timings = {name: [] for name, _ in configurations}
+    for _ in range(repeat):
+        for name, overrides in configurations:
+            with override_settings(**overrides):
+                timings[name] += timed(lambda: [fetch(clients[name], headers) for _ in range(requests)], 1)
+    results = [
+        {
+            'metrics': name,
+            'per_request_us': round(min(timings[name]) * 1000 / requests, 1),
+            f'{requests}_requests': summarize(timings[name]),
+        }
+        for name, _ in configurations
+    ]
+    baseline = results[0]['per_request_us']
+    for result in results[1:]:
+        result['overhead_pct'] = round((result['per_request_us'] / baseline - 1) * 100, 2)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--notes', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database():
+        report('metrics', run(args.requests, args.notes, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
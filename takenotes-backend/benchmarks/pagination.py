@@ -0,0 +1,74 @@
+"""
+Keyset vs offset pagination for the notes list.
+
+Seeds one user with a growing number of notes and times fetching a page at
+increasing depths. Keyset pages cost the same wherever they start; offset pages
+get slower the further into the list they are.
+
+    python -m benchmarks.pagination [--sizes 1000 10000 50000] [--page-size 50]
+"""
+import argparse
+
+from .harness import setup_django, test_database, timed, summarize, report, create_user, seed_notes
+
+
+def run(sizes, page_size, repeat):
+    import base64
+    from rest_framework.pagination import LimitOffsetPagination
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    from notes.models import Note
+    from notes.views import NoteViewSet
+
+    class OffsetNoteViewSet(NoteViewSet):
+        pagination_class = LimitOffsetPagination
+
+    keyset_view = NoteViewSet.as_view({'get': 'list'})
+    offset_view = OffsetNoteViewSet.as_view({'get': 'list'})
+    factory = APIRequestFactory()
+
+    def fetch(view, user, params):
+        request = factory.get('/api/notes/', params)
+        force_authenticate(request, user=user)
+        response = view(request)
+        response.render()
+        assert response.status_code == 200, response.status_code
+
+    results = []
+    for index, size in enumerate(sizes):
+        user = create_user(f'bench{index}@example.com')
+        seed_notes(user, size)
+        ordered = Note.objects.filter(user=user).order_by('-updated_at', '-id')
+        for fraction in (0, 0.25, 0.5, 0.9):
+            offset = int((size - page_size) * fraction)
+            params = {'page_size': page_size}
+            if offset:
+                anchor = ordered.values('updated_at', 'id')[offset - 1]
+                raw = f"{anchor['updated_at'].isoformat()}|{anchor['id']}"
+                params['cursor'] = base64.urlsafe_b64encode(raw.encode()).decode()
+            keyset = timed(lambda: fetch(keyset_view, user, params), repeat)
+            offset_timings = timed(
+                lambda: fetch(offset_view, user, {'limit': page_size, 'offset': offset}), repeat
+            )
+            results.append({
+                'notes': size,
+                'offset': offset,
+                'keyset': summarize(keyset),
+                'limit_offset': summarize(offset_timings),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database():
+        report('pagination', run(args.sizes, args.page_size, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Notes list with full contents against the card view, for large notes.
+
+Seeds ``--notes`` notes of about ``--size`` characters each and pages through
+GET /api/notes/ with every field and with ``?view=cards`` (the stored preview
+in place of ``content``). Reports the time of the page query, the characters
+it reads from the notes table, the time per request and the response size.
+
+    python -m benchmarks.previews [--notes 2000 --size 50000]
+"""
+import argparse
+
+from .harness import setup_django, test_database, timed, summarize, report, create_user, seed_notes
+
+PAGE_SIZE = 100
+
+
+def run(notes, size, repeat):
+    import random
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    from notes.models import Category
+    from notes.serializers import NoteSerializer, NoteValuesSerializer, list_fields
+    from notes.views import NoteViewSet, note_queryset
+
+    user = create_user()
+    category = Category.objects.create(user=user, name='Work', color='#10B981')
+    words = 'the a note idea meeting list draft plan review project team call later today fix ship write read'.split()
+    rng = random.Random(0)
+    body = ' '.join(rng.choice(words) for _ in range(size // 5))[:size]
+    seed_notes(user, notes, category=category, content=lambda i: f'{i} {body}')
+
+    factory = APIRequestFactory()
+    view = NoteViewSet.as_view({'get': 'list'})
+    views = ('full', 'cards')
+
+    def fetch(params):
+        request = factory.get('/api/notes/', {'page_size': PAGE_SIZE, **params})
+        force_authenticate(request, user=user)
+        response = view(request)
+        response.render()
+        assert response.status_code == 200, response.status_code
+        return response
+
+    def page_query(name):
+        request = Request(factory.get('/api/notes/', {'view': name}))
+        columns = NoteValuesSerializer.columns(list_fields(request, NoteSerializer.Meta.fields))
+        queryset = note_queryset(user, {}).values(*columns)[:PAGE_SIZE]
+        return lambda: list(queryset.all())
+
+    queries = {name: [] for name in views}
+    requests = {name: [] for name in views}
+    # alternate the views round by round, so drift hits both alike
+    for _ in range(repeat):
+        for name in views:
+            queries[name] += timed(page_query(name), 1)
+            requests[name] += timed(lambda: fetch({'view': name}), 1)
+
+    results = []
+    for name in views:
+        rows = page_query(name)()
+        results.append({
+            'view': name,
+            'query_ms': round(min(queries[name]), 2),
+            'chars_read': sum(len(value) for row in rows for value in row.values() if isinstance(value, str)),
+            'request': summarize(requests[name]),
+            'response_bytes': len(fetch({'view': name}).content),
+        })
+    full, cards = results
+    for key in ('chars_read', 'response_bytes'):
+        cards[f'{key}_ratio'] = round(full[key] / cards[key], 1)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--notes', type=int, default=2000)
+    parser.add_argument('--size', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database():
+        report('previews', run(args.notes, args.size, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
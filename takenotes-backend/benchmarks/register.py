@@ -0,0 +1,85 @@
+"""
+Registrations per second, before and after bulk default-category provisioning.
+
+Posts sign-ups to RegisterView and to a copy of its previous implementation,
+which created each default category with its own autocommitted INSERT.
+The database is an on-disk SQLite file, so every commit costs a disk sync.
+Passwords are hashed with MD5 here so the hasher, which is deliberately slow,
+does not hide the database work.
+
+    python -m benchmarks.register [--users 500]
+"""
+import argparse
+import itertools
+import time
+
+from .harness import setup_django, test_database, report
+
+
+def run(users, repeat):
+    from django.db import IntegrityError, connection, reset_queries
+    from django.test import override_settings
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework import status
+    from rest_framework.response import Response
+    from rest_framework.test import APIRequestFactory
+    from notes.models import Category
+    from users.serializers import UserRegisterSerializer
+    from users.views import RegisterView, default_categories
+
+    class PreviousRegisterView(RegisterView):
+        def post(self, request):
+            serializer = UserRegisterSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            user = serializer.save()
+            for name, color in default_categories():
+                try:
+                    Category.objects.create(user=user, name=name, color=color)
+                except IntegrityError:
+                    pass
+            return Response(serializer.to_representation(user), status=status.HTTP_201_CREATED)
+
+    factory = APIRequestFactory()
+    counter = itertools.count()
+
+    def register(view):
+        request = factory.post('/api/auth/register/', {
+            'username': f'user{next(counter)}@example.com', 'password': 'bench-pass',
+        }, format='json')
+        response = view(request)
+        assert response.status_code == 201, response.status_code
+
+    results = []
+    with override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']):
+        for name, view_class in (('before', PreviousRegisterView), ('after', RegisterView)):
+            view = view_class.as_view()
+            reset_queries()
+            with CaptureQueriesContext(connection) as ctx:
+                register(view)
+            rates = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                for _ in range(users):
+                    register(view)
+                rates.append(users / (time.perf_counter() - start))
+            results.append({
+                'implementation': name,
+                'inserts_per_registration': sum(q['sql'].startswith('INSERT') for q in ctx.captured_queries),
+                'registrations_per_second': round(max(rates), 1),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database(on_disk=True):
+        report('register', run(args.users, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
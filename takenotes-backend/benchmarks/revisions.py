@@ -0,0 +1,85 @@
+"""
+Revision history cost: storage, save overhead and rebuild time.
+
+Edits a ``--size`` KB note ``--revisions`` times, changing a few words at a
+different place each time, with coalescing off so every save is a revision.
+Reports the bytes stored for the history against full snapshots, the time a
+save takes with and without recording history, and the time to rebuild every
+revision through notes.revisions.load.
+
+    python -m benchmarks.revisions [--size 500] [--revisions 200]
+"""
+import argparse
+import random
+import statistics
+import time
+
+from .harness import setup_django, test_database, report, create_user
+
+
+def run(size_kb, count):
+    import zlib
+    from django.db.models.signals import post_save
+    from django.test.utils import override_settings
+    from notes import revisions
+    from notes.models import Note, NoteRevision
+    from notes.signals import record_revision
+
+    user = create_user()
+    # random words, so keyframes compress about as well as real prose does
+    words = 'the a note idea meeting list draft plan review project team call later today fix ship write read'.split()
+    rng = random.Random(0)
+    text = ' '.join(rng.choice(words) + str(rng.randrange(100)) for _ in range(size_kb * 150))[:size_kb * 1024]
+
+    def edit_all(note, record):
+        if not record:
+            post_save.disconnect(record_revision, sender=Note)
+        timings = []
+        try:
+            for n in range(count):
+                at = (n * 7919) % (len(note.content) - 20)
+                note.content = note.content[:at] + f'edit {n:05d}' + note.content[at + 10:]
+                start = time.perf_counter()
+                note.save(update_fields=['content', 'updated_at'])
+                timings.append((time.perf_counter() - start) * 1000)
+        finally:
+            post_save.connect(record_revision, sender=Note)
+        return timings
+
+    with override_settings(NOTE_REVISION_COALESCE_SECONDS=0):
+        plain = edit_all(Note.objects.create(user=user, content=text), record=False)
+        note = Note.objects.create(user=user, content=text)
+        recorded = edit_all(note, record=True)
+
+    stored = sum(len(data) for data in NoteRevision.objects.filter(note=note).values_list('data', flat=True))
+    rebuilds = []
+    for number in range(1, count + 2):
+        start = time.perf_counter()
+        revisions.load(note.pk, number)
+        rebuilds.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'note_kb': size_kb,
+        'revisions': count + 1,
+        'keyframe_interval': revisions.keyframe_interval(),
+        'history_bytes': stored,
+        'full_snapshot_bytes': (count + 1) * len(text.encode()),
+        'compressed_snapshot_bytes': (count + 1) * len(zlib.compress(text.encode())),
+        'save_ms': {'without_history': round(statistics.median(plain), 3), 'with_history': round(statistics.median(recorded), 3)},
+        'rebuild_ms': {'median': round(statistics.median(rebuilds), 3), 'max': round(max(rebuilds), 3)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--size', type=int, default=500, help='note size in KB')
+    parser.add_argument('--revisions', type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database():
+        report('revisions', run(args.size, args.revisions))
+
+
+if __name__ == '__main__':
+    main()
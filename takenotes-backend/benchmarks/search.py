@@ -0,0 +1,62 @@
+"""
+Full-text search latency against a large notes table.
+
+Seeds one user with synthetic notes drawn from a fixed vocabulary, rebuilds the
+search index and times ranked searches through the search endpoint.
+
+    python -m benchmarks.search [--notes 100000]
+"""
+import argparse
+import random
+
+from .harness import setup_django, test_database, timed, summarize, report, create_user, seed_notes
+
+VOCABULARY = [
+    'meeting', 'budget', 'exam', 'chemistry', 'groceries', 'avocado', 'travel', 'passport',
+    'birthday', 'project', 'deadline', 'recipe', 'garden', 'invoice', 'workout', 'reading',
+    'movie', 'podcast', 'dentist', 'insurance', 'landlord', 'holiday', 'meditation', 'python',
+] + [f'word{i}' for i in range(2000)]
+
+
+def run(notes, limit, repeat):
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    from notes.search import get_search_backend
+    from notes.views import NoteViewSet
+
+    rng = random.Random(42)
+    user = create_user()
+    seed_notes(user, notes, content=lambda i: ' '.join(rng.choices(VOCABULARY, k=40)))
+    get_search_backend().rebuild()
+
+    view = NoteViewSet.as_view({'get': 'search'}, **NoteViewSet.search.kwargs)
+    factory = APIRequestFactory()
+
+    def fetch(params):
+        request = factory.get('/api/notes/search/', params)
+        force_authenticate(request, user=user)
+        response = view(request)
+        response.render()
+        assert response.status_code == 200, response.status_code
+
+    results = []
+    for query in ('meeting', 'exam chemistry', 'word17 word1999', 'dead', 'nosuchword'):
+        for offset in (0, 200):
+            timings = timed(lambda: fetch({'q': query, 'limit': limit, 'offset': offset}), repeat)
+            results.append({'notes': notes, 'query': query, 'offset': offset, **summarize(timings)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--notes', type=int, default=100000)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database():
+        report('search', run(args.notes, args.limit, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
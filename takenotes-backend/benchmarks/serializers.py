@@ -0,0 +1,58 @@
+"""
+NoteSerializer vs the values()-based NoteValuesSerializer for the notes list.
+
+Seeds one user with notes spread over several categories and days, then times
+loading and rendering every note to JSON both ways. Before timing, it checks
+that the two paths render byte-identical JSON.
+
+    python -m benchmarks.serializers [--sizes 1000 10000 100000]
+"""
+import argparse
+
+from .harness import setup_django, test_database, timed, summarize, report, create_user, seed_notes
+
+
+def run(sizes, repeat):
+    from rest_framework.renderers import JSONRenderer
+    from notes.models import Category, Note
+    from notes.serializers import NoteSerializer, NoteValuesSerializer
+
+    renderer = JSONRenderer()
+    results = []
+    for index, size in enumerate(sizes):
+        user = create_user(f'bench{index}@example.com')
+        # a quarter of the notes without a category; edits a few minutes apart
+        # reach back weeks, so every kind of last_edited_label shows up
+        for category in [None, *(Category.objects.create(user=user, name=f'Category {i}') for i in range(3))]:
+            seed_notes(user, size // 4, category=category, spacing_seconds=457)
+        queryset = Note.objects.filter(user=user).select_related('category').order_by('-updated_at', '-id')
+
+        def drf():
+            return renderer.render(NoteSerializer(queryset, many=True).data)
+
+        def fast():
+            rows = queryset.values(*NoteValuesSerializer.values)
+            return renderer.render(NoteValuesSerializer(rows, many=True).data)
+
+        assert drf() == fast(), f'outputs differ at {size} notes'
+        results.append({
+            'notes': size,
+            'note_serializer': summarize(timed(drf, repeat)),
+            'values_serializer': summarize(timed(fast, repeat)),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database():
+        report('serializers', run(args.sizes, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""
+End-to-end API load suite: throughput, latency percentiles and queries per request.
+
+Seeds a throwaway database with synthetic users, categories and notes at one of
+the ``SCALES`` (or ``--notes``/``--users``), then sends ``--requests`` requests
+to each of the main endpoints through the whole Django stack (URL routing,
+middleware, JWT authentication, views, rendering) with the test client, so it
+needs no server or network. For each endpoint it reports requests per second,
+p50/p95/p99 latency and the queries per request.
+
+Passwords are hashed with MD5 unless ``--real-hasher`` is given, so the
+login and sign-up numbers measure the endpoints rather than the hasher.
+
+Save a run and check a later one against it, before a deploy:
+
+    python -m benchmarks.suite --scale 100k > baseline.json
+    python -m benchmarks.suite --scale 100k --baseline baseline.json
+
+With ``--baseline`` the exit status is 1 if any endpoint's p95 grew by more
+than ``--tolerance`` (default 25%) or it now runs more queries per request.
+"""
+import argparse
+import itertools
+import json
+import sys
+import time
+
+from .harness import setup_django, test_database, report, manual_timestamps
+from .loadgen import percentile
+
+# notes, users
+SCALES = {
+    '1k': (1_000, 10),
+    '100k': (100_000, 100),
+    '1m': (1_000_000, 1_000),
+}
+PASSWORD = 'bench-pass'
+
+
+def seed(users, notes, batch_size=5000):
+    """``users`` users with the default categories and ``notes`` notes spread across them."""
+    import datetime
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.hashers import make_password
+    from django.utils import timezone
+    from notes import counters
+    from notes.models import Category, Note, make_preview
+    from users.views import default_categories
+
+    User = get_user_model()
+    password = make_password(PASSWORD)
+    User.objects.bulk_create(
+        [User(username=f'seed{i}@example.com', password=password) for i in range(users)], batch_size=batch_size,
+    )
+    accounts = list(User.objects.filter(username__startswith='seed').order_by('username'))
+    Category.objects.bulk_create(
+        [Category(user=user, name=name, color=color) for user in accounts for name, color in default_categories()],
+        batch_size=batch_size,
+    )
+    categories = {}
+    for category in Category.objects.all():
+        categories.setdefault(category.user_id, []).append(category)
+
+    now = timezone.now()
+    with manual_timestamps(Note):
+        for start in range(0, notes, batch_size):
+            batch = []
+            for i in range(start, min(start + batch_size, notes)):
+                user = accounts[i % users]
+                choices = categories[user.pk]
+                # every fourth note is uncategorized
+                category = choices[i % len(choices)] if i % 4 else None
+                stamp = now - datetime.timedelta(seconds=i)
+                content = f'Synthetic note {i}. ' + 'Lorem ipsum dolor sit amet. ' * 8
+                batch.append(Note(
+                    user=user, category=category, title=f'Note {i}', content=content, preview=make_preview(content),
+                    created_at=stamp, updated_at=stamp,
+                ))
+            Note.objects.bulk_create(batch, batch_size=batch_size)
+    counters.reconcile()
+    return accounts
+
+
+def scenarios(accounts):
+    """Endpoint name -> function taking the request index and returning (method, path, body, user)."""
+    from notes.models import Note
+
+    counter = itertools.count()
+    sample = accounts[:50]
+    notes = {user.pk: list(Note.objects.filter(user=user).values_list('pk', flat=True)[:20]) for user in sample}
+
+    def user(i):
+        return sample[i % len(sample)]
+
+    def update(i):
+        owner = user(i)
+        note_id = notes[owner.pk][i // len(sample) % len(notes[owner.pk])]
+        return 'patch', f'/api/notes/{note_id}/', {'title': f'Edited {i}', 'content': f'Edited content {i}'}, owner
+
+    return {
+        'register': lambda i: (
+            'post', '/api/auth/register/', {'username': f'signup{next(counter)}@example.com', 'password': PASSWORD}, None,
+        ),
+        'token': lambda i: ('post', '/api/auth/token/', {'username': user(i).username, 'password': PASSWORD}, None),
+        'note list': lambda i: ('get', '/api/notes/', None, user(i)),
+        'note create': lambda i: ('post', '/api/notes/', {'title': f'New {i}', 'content': 'Created by the suite'}, user(i)),
+        'note update': update,
+        'category list': lambda i: ('get', '/api/categories/', None, user(i)),
+    }
+
+
+def measure(client, tokens, make_request, requests):
+    from django.db import connection
+
+    counts = []
+
+    def count(execute, sql, params, many, context):
+        counts[-1] += 1
+        return execute(sql, params, many, context)
+
+    def send(i):
+        method, path, body, user = make_request(i)
+        headers = {'Authorization': f'Bearer {tokens[user.pk]}'} if user else {}
+        response = getattr(client, method)(path, body, content_type='application/json', headers=headers)
+        assert response.status_code < 300, (path, response.status_code, response.content[:200])
+
+    send(0)
+    latencies = []
+    with connection.execute_wrapper(count):
+        start = time.perf_counter()
+        for i in range(1, requests + 1):
+            counts.append(0)
+            sent = time.perf_counter()
+            send(i)
+            latencies.append(time.perf_counter() - sent)
+        elapsed = time.perf_counter() - start
+    return {
+        'requests': requests,
+        'rps': round(requests / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'queries_per_request': round(sum(counts) / requests, 2),
+        'max_queries': max(counts),
+    }
+
+
+def run(notes, users, requests, only=None):
+    from django.test import Client
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    start = time.perf_counter()
+    accounts = seed(users, notes)
+    seconds = time.perf_counter() - start
+    tokens = {user.pk: str(AccessToken.for_user(user)) for user in accounts[:50]}
+    client = Client()
+
+    results = {'notes': notes, 'users': users, 'seed_seconds': round(seconds, 1), 'endpoints': {}}
+    for name, make_request in scenarios(accounts).items():
+        if only and name not in only:
+            continue
+        results['endpoints'][name] = measure(client, tokens, make_request, requests)
+    return results
+
+
+def regressions(results, baseline, tolerance):
+    """Descriptions of endpoints that got slower or chattier than in ``baseline``."""
+    found = []
+    for name, current in results['endpoints'].items():
+        before = baseline['endpoints'].get(name)
+        if before is None:
+            continue
+        if current['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            found.append(f"{name}: p95 {before['p95_ms']} ms -> {current['p95_ms']} ms")
+        if current['queries_per_request'] > before['queries_per_request']:
+            found.append(f"{name}: queries per request {before['queries_per_request']} -> {current['queries_per_request']}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--scale', choices=SCALES, default='1k')
+    parser.add_argument('--notes', type=int, help='overrides the scale')
+    parser.add_argument('--users', type=int, help='overrides the scale')
+    parser.add_argument('--requests', type=int, default=200, help='per endpoint')
+    parser.add_argument('--only', nargs='+', metavar='ENDPOINT', help='e.g. "note list" token')
+    parser.add_argument('--on-disk', action='store_true', help='use an SQLite file instead of memory')
+    parser.add_argument('--real-hasher', action='store_true', help='keep the configured password hashers')
+    parser.add_argument('--baseline', type=argparse.FileType(), help='JSON from an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p95 growth against the baseline')
+    args = parser.parse_args()
+    notes, users = SCALES[args.scale]
+    notes, users = args.notes or notes, args.users or users
+    baseline = json.load(args.baseline)['results'] if args.baseline else None
+
+    setup_django()
+    from django.test.utils import override_settings
+
+    hashers = {} if args.real_hasher else {'PASSWORD_HASHERS': ['django.contrib.auth.hashers.MD5PasswordHasher']}
+    with override_settings(**hashers), test_database(on_disk=args.on_disk):
+        results = run(notes, users, args.requests, args.only)
+    report('suite', results)
+
+    if baseline:
+        found = regressions(results, baseline, args.tolerance)
+        for line in found:
+            print(f'regression: {line}', file=sys.stderr)
+        sys.exit(1 if found else 0)
+
+
+if __name__ == '__main__':
+    main()
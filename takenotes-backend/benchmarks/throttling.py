@@ -0,0 +1,98 @@
+"""
+Cost of throttling on requests that are not throttled.
+
+Sends the same authenticated GET /api/notes/ through the notes list view with
+no throttles, with the token-bucket UserThrottle and AnonThrottle in the local
+and the cache store, and with DRF's stock history-based UserRateThrottle and
+AnonRateThrottle, at a rate high enough that nothing is refused. Reports the
+time per request and per throttle decision for each.
+
+    python -m benchmarks.throttling [--requests 2000]
+"""
+import argparse
+
+from .harness import setup_django, test_database, timed, summarize, report, create_user, seed_notes
+
+RATE = '1000000/hour'
+
+
+def run(requests, notes, repeat):
+    from django.conf import settings
+    from django.test.utils import override_settings
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
+    from notes.views import NoteViewSet
+    from users import throttling
+
+    user = create_user()
+    seed_notes(user, notes)
+    factory = APIRequestFactory()
+    rates = {**settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], 'user': RATE, 'anon': RATE}
+    configurations = [
+        ('none', [], None),
+        ('token bucket, local store', [throttling.UserThrottle, throttling.AnonThrottle], 'users.throttling.LocalBucketStore'),
+        ('token bucket, cache store', [throttling.UserThrottle, throttling.AnonThrottle], 'users.throttling.CacheBucketStore'),
+        ('DRF request history', [UserRateThrottle, AnonRateThrottle], None),
+    ]
+
+    # DRF's throttles read their rates once, at import
+    UserRateThrottle.THROTTLE_RATES = AnonRateThrottle.THROTTLE_RATES = rates
+    request = Request(factory.get('/api/notes/'))
+    request.user = user
+
+    def fetch(view):
+        request = factory.get('/api/notes/', {'page_size': 20})
+        force_authenticate(request, user=user)
+        response = view(request)
+        response.render()
+        assert response.status_code == 200, response.status_code
+
+    def decide(throttle_classes):
+        for throttle_class in throttle_classes:
+            assert throttle_class().allow_request(request, None)
+
+    timings = {name: [] for name, _, _ in configurations}
+    decisions = {name: [] for name, _, _ in configurations}
+    # alternate the configurations round by round, so drift hits them all alike
+    for _ in range(repeat):
+        for name, throttle_classes, store in configurations:
+            overrides = {'REST_FRAMEWORK': {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates}}
+            if store:
+                overrides['THROTTLE_STORE'] = store
+            with override_settings(**overrides):
+                throttling.get_store.cache_clear()
+                view = NoteViewSet.as_view({'get': 'list'}, throttle_classes=throttle_classes)
+                fetch(view)
+                timings[name] += timed(lambda: [fetch(view) for _ in range(requests)], 1)
+                decisions[name] += timed(lambda: [decide(throttle_classes) for _ in range(requests)], 1)
+    results = [
+        {
+            'throttles': name,
+            'per_request_us': round(min(timings[name]) * 1000 / requests, 1),
+            'per_decision_us': round(min(decisions[name]) * 1000 / requests, 2),
+            f'{requests}_requests': summarize(timings[name]),
+        }
+        for name, _, _ in configurations
+    ]
+    throttling.get_store.cache_clear()
+    baseline = results[0]['per_request_us']
+    for result in results[1:]:
+        result['overhead_pct'] = round((result['per_request_us'] / baseline - 1) * 100, 2)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--notes', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database():
+        report('throttling', run(args.requests, args.notes, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Response compression for JSON, negotiated from Accept-Encoding.
+
+CompressionMiddleware encodes JSON bodies of at least
+``RESPONSE_COMPRESSION_MIN_SIZE`` bytes (default 1024) with Brotli when the
+client accepts it and the optional ``brotli`` package is installed, and with
+gzip otherwise. Streamed responses (exports, the change feed) are left alone.
+
+ETags stay strong. The note ETags name a version of the note, not bytes, and
+If-Match needs them strong; ``Vary: Accept-Encoding`` keeps caches from handing
+one coding to a client that asked for another.
+"""
+import gzip
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def min_size():
+    return getattr(settings, 'RESPONSE_COMPRESSION_MIN_SIZE', 1024)
+
+
+def encode_gzip(content):
+    # a fixed mtime, so the same body always compresses to the same bytes
+    return gzip.compress(content, compresslevel=getattr(settings, 'RESPONSE_GZIP_LEVEL', 6), mtime=0)
+
+
+def encode_brotli(content):
+    return brotli.compress(content, quality=getattr(settings, 'RESPONSE_BROTLI_QUALITY', 4))
+
+
+def encoders():
+    """Supported codings, most preferred first."""
+    if brotli is not None:
+        return {'br': encode_brotli, 'gzip': encode_gzip}
+    return {'gzip': encode_gzip}
+
+
+def negotiate(accept_encoding, available):
+    """The coding in ``available`` the client weights highest, or None (RFC 9110 12.5.3)."""
+    weights = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        weight = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        if coding:
+            weights[coding.strip().lower()] = weight
+    default = weights.get('*', 0.0)
+    best, best_weight = None, 0.0
+    for coding in available:
+        weight = weights.get(coding, default)
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+def compress(request, response):
+    if (
+        response.streaming
+        or response.has_header('Content-Encoding')
+        or not response.get('Content-Type', '').startswith('application/json')
+        or len(response.content) < min_size()
+    ):
+        return response
+    # whether or not this client gets it compressed, another one might
+    patch_vary_headers(response, ('Accept-Encoding',))
+    available = encoders()
+    coding = negotiate(request.headers.get('Accept-Encoding', ''), available)
+    if coding is None:
+        return response
+    compressed = available[coding](response.content)
+    if len(compressed) >= len(response.content):
+        return response
+    response.content = compressed
+    response['Content-Length'] = str(len(compressed))
+    response['Content-Encoding'] = coding
+    return response
+
+
+class CompressionMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return compress(request, await self.get_response(request))
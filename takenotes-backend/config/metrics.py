@@ -0,0 +1,216 @@
+"""
+Per-request performance metrics, aggregated in process and served in the
+Prometheus text format at /api/metrics.
+
+RequestMetricsMiddleware times each sampled request and labels it with the
+resolved view name, method and status. Database queries are counted and timed
+by an execute wrapper installed on every connection, which charges them to the
+request found in a context variable, so queries an async view runs in a worker
+thread are counted too. Rendering time is the time spent turning a DRF
+Response's data (or an async view's) into bytes; building that data with
+serializers happens in the view, before rendering, and only shows in the
+request duration.
+
+Histograms live in this process only; with several workers, scrape each one.
+``REQUEST_METRICS_SAMPLE_RATE`` (0 to 1, default 1) sets the share of requests
+measured. The endpoint is closed until ``METRICS_TOKEN`` is set, and then
+answers scrapers that send it as a bearer token.
+"""
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+LABELS = ('view', 'method', 'status')
+
+
+class Histogram:
+    """A labelled Prometheus histogram: cumulative bucket counts, sum and count."""
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def clear(self):
+        with self.lock:
+            self.series.clear()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            series = sorted((labels, [counts[:], total, count]) for labels, (counts, total, count) in self.series.items())
+        for labels, (counts, total, count) in series:
+            label_text = ','.join(f'{name}="{escape(value)}"' for name, value in zip(LABELS, labels))
+            cumulative = 0
+            for bound, bucket in zip((*self.buckets, '+Inf'), counts):
+                cumulative += bucket
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {total:.6g}')
+            lines.append(f'{self.name}_count{{{label_text}}} {count}')
+        return lines
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Time from request to response.', LATENCY_BUCKETS)
+DB_QUERIES = Histogram('http_request_db_queries', 'Database queries run per request.', QUERY_BUCKETS)
+DB_SECONDS = Histogram('http_request_db_duration_seconds', 'Time spent in database queries per request.', LATENCY_BUCKETS)
+RENDER_SECONDS = Histogram(
+    'http_response_render_duration_seconds',
+    'Time spent rendering response data to bytes, not counting serializers building it.',
+    LATENCY_BUCKETS,
+)
+RESPONSE_BYTES = Histogram('http_response_size_bytes', 'Response body size, when it is known up front.', SIZE_BUCKETS)
+HISTOGRAMS = (REQUEST_SECONDS, DB_QUERIES, DB_SECONDS, RENDER_SECONDS, RESPONSE_BYTES)
+
+
+class Sample:
+    __slots__ = ('queries', 'db_seconds', 'render_seconds', 'render_started')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+        self.render_started = None
+
+    def rendered(self, response):
+        self.render_seconds += time.perf_counter() - self.render_started
+
+
+current_sample = ContextVar('current_sample', default=None)
+
+
+def count_query(execute, sql, params, many, context):
+    sample = current_sample.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        sample.db_seconds += time.perf_counter() - start
+        sample.queries += 1
+
+
+def install(connection, **kwargs):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+@contextmanager
+def rendering():
+    """Charge the enclosed work to the current request's render time."""
+    sample = current_sample.get()
+    if sample is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        sample.render_seconds += time.perf_counter() - start
+
+
+def sample_rate():
+    return getattr(settings, 'REQUEST_METRICS_SAMPLE_RATE', 1.0)
+
+
+def record(request, response, sample, seconds):
+    match = getattr(request, 'resolver_match', None)
+    labels = (match.view_name if match else 'unmatched', request.method, str(response.status_code))
+    REQUEST_SECONDS.observe(labels, seconds)
+    DB_QUERIES.observe(labels, sample.queries)
+    DB_SECONDS.observe(labels, sample.db_seconds)
+    RENDER_SECONDS.observe(labels, sample.render_seconds)
+    if not response.streaming:
+        RESPONSE_BYTES.observe(labels, len(response.content))
+
+
+class RequestMetricsMiddleware:
+    """Records latency, queries, DB time, render time and response size per view."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # connections opened from now on get the wrapper from the signal
+        connection_created.connect(install, dispatch_uid='config.metrics.install')
+        for connection in connections.all(initialized_only=True):
+            install(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if random.random() >= sample_rate():
+            return self.get_response(request)
+        sample = Sample()
+        token = current_sample.set(sample)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_sample.reset(token)
+        record(request, response, sample, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        if random.random() >= sample_rate():
+            return await self.get_response(request)
+        sample = Sample()
+        token = current_sample.set(sample)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_sample.reset(token)
+        record(request, response, sample, time.perf_counter() - start)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns; time that step
+        sample = current_sample.get()
+        if sample is not None:
+            sample.render_started = time.perf_counter()
+            response.add_post_render_callback(sample.rendered)
+        return response
+
+
+def render():
+    """All histograms in the Prometheus text exposition format."""
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    return '\n'.join(lines) + '\n'
+
+
+def clear():
+    for histogram in HISTOGRAMS:
+        histogram.clear()
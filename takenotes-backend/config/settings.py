@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .database import database_from_env
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -48,6 +51,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so its timings cover the rest of the stack
+    'config.metrics.RequestMetricsMiddleware',
+    # before anything else that reads or writes the body
+    'config.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -81,13 +88,55 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# Configured from DATABASE_URL and DB_* environment variables; see config/database.py
 DATABASES = {
+    'default': database_from_env(os.environ, BASE_DIR),
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# Per-process memory; point this at Redis or Memcached when running several
+# workers so cached category lists and their hit counters are shared.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
+# Cache alias and lifetime (seconds) of the per-user category list
+NOTES_CATEGORY_CACHE = 'default'
+NOTES_CATEGORY_CACHE_TIMEOUT = 300
+
+# Change feed (notes.events): broker class, events buffered per open stream
+# before a slow client is told to resync, and seconds between keep-alives
+NOTES_EVENT_BROKER = 'notes.events.LocalBroker'
+NOTES_EVENTS_QUEUE_SIZE = 256
+NOTES_EVENTS_HEARTBEAT = 15
+
+# Request metrics (config.metrics), served at /api/metrics/: share of requests
+# measured, and the bearer token scrapers must send (the endpoint is closed without one)
+REQUEST_METRICS_SAMPLE_RATE = 1.0
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# JSON responses of at least this many bytes are sent gzip- or Brotli-encoded
+# when the client accepts it (config.compression)
+RESPONSE_COMPRESSION_MIN_SIZE = 1024
+RESPONSE_GZIP_LEVEL = 6
+RESPONSE_BROTLI_QUALITY = 4
+
+# Background jobs (notes.jobs), run by `manage.py run_jobs`: attempts per job,
+# retry backoff (JOBS_RETRY_DELAY * 2 ** (attempt - 1) seconds, capped), seconds
+# without progress before a running job counts as abandoned, where export files
+# are written, and how long finished jobs are kept (`manage.py prune_jobs`)
+JOBS_MAX_ATTEMPTS = 3
+JOBS_RETRY_DELAY = 10
+JOBS_RETRY_MAX_DELAY = 600
+JOBS_LOCK_TIMEOUT = 600
+JOBS_RESULTS_DIR = BASE_DIR / 'job_results'
+JOBS_RETENTION_DAYS = 7
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -128,14 +177,49 @@ STATIC_URL = 'static/'
 # Django REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # orjson when it is installed, DRF's JSONRenderer otherwise; see notes.renderers
+    'DEFAULT_RENDERER_CLASSES': (
+        'notes.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_THROTTLE_CLASSES': (
+        'users.throttling.UserThrottle',
+        'users.throttling.AnonThrottle',
+    ),
+    # token buckets (users.throttling): "<burst>/<period>", refilled evenly over the period;
+    # login and register are also limited per IP and, as <scope>_endpoint, across all clients
+    'DEFAULT_THROTTLE_RATES': {
+        'user': '1200/min',
+        'anon': '120/min',
+        'login': '10/min',
+        'login_endpoint': '20/s',
+        'register': '5/min',
+        'register_endpoint': '5/s',
+    },
+    # proxies in front of the app that append to X-Forwarded-For; with 0 the
+    # header is ignored and client IPs are REMOTE_ADDR, which clients cannot forge
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
 }
 
+# THROTTLING=off in the environment turns every throttle off (the benchmarks do this)
+if os.environ.get('THROTTLING') == 'off':
+    REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] = dict.fromkeys(REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'])
+
+# Where throttle buckets live: 'users.throttling.LocalBucketStore' (per process)
+# or 'users.throttling.CacheBucketStore' (in THROTTLE_CACHE, shared by workers)
+THROTTLE_STORE = 'users.throttling.LocalBucketStore'
+THROTTLE_CACHE = 'default'
+
+# Users resolved from JWTs are cached per process (see users.authentication)
+JWT_USER_CACHE_SIZE = 1024
+JWT_USER_CACHE_TTL = 60  # seconds; bounds how long other workers see a deactivated user
+
 # drf-spectacular settings
 SPECTACULAR_SETTINGS = {
     'TITLE': 'TakeNotes API',
@@ -0,0 +1,254 @@
+"""
+Async (ASGI-native) versions of the note and category endpoints.
+
+DRF views are synchronous, so under ASGI every request to them is handed to a
+worker thread. The plain Django async views below serve the list, retrieve,
+create and update paths with the async ORM instead, and return the same JSON
+as their DRF counterparts. They are mounted under ``/api/async/``.
+
+Model saves still run in a thread (``Model.asave`` wraps ``save``), so the
+signal handlers that keep the search index, tombstones and caches up to date
+behave exactly as they do for the DRF views.
+"""
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import classonlymethod
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from config import metrics
+from users.authentication import CachedJWTAuthentication
+
+from . import bulk, caching, events, sync
+from .models import Category, Note
+from .pagination import NoteCursorPagination
+from .renderers import FastJSONRenderer
+from .serializers import (
+    CategorySerializer, NoteBatchCreateSerializer, NoteSerializer, NoteValuesSerializer,
+    list_fields, requested_fields, save_changes,
+)
+from .views import category_queryset, note_queryset
+
+
+class AsyncAPIView(View):
+    """
+    Minimal async counterpart of a DRF APIView: JWT authentication, JSON in
+    and out, the default throttles, and API exceptions rendered the way DRF's
+    exception handler does.
+    """
+    authentication = CachedJWTAuthentication()
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+    renderer = FastJSONRenderer()
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        # token-authenticated like the DRF views, so no CSRF cookie checks
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.request = Request(request, parsers=[JSONParser()])
+        try:
+            authenticated = await self.authentication.aauthenticate(request)
+            if authenticated is None:
+                raise exceptions.NotAuthenticated()
+            self.user = self.request.user = authenticated[0]
+            self.check_throttles()
+            method = request.method.lower()
+            if method not in self.http_method_names or not hasattr(self, method):
+                return await self.http_method_not_allowed(request, *args, **kwargs)
+            return await getattr(self, method)(self.request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            return self.error_response(exc)
+
+    def check_throttles(self):
+        throttles = [throttle_class() for throttle_class in self.throttle_classes]
+        waits = [throttle.wait() for throttle in throttles if not throttle.allow_request(self.request, self)]
+        if waits:
+            raise exceptions.Throttled(max(waits))
+
+    def render(self, data, status=status.HTTP_200_OK):
+        with metrics.rendering():
+            body = self.renderer.render(data)
+        return HttpResponse(body, status=status, content_type="application/json")
+
+    def error_response(self, exc):
+        detail = exc.detail if isinstance(exc.detail, (list, dict)) else {"detail": exc.detail}
+        response = self.render(detail, status=exc.status_code)
+        if exc.status_code == status.HTTP_401_UNAUTHORIZED:
+            response["WWW-Authenticate"] = self.authentication.authenticate_header(self.request)
+        if getattr(exc, "wait", None):
+            response["Retry-After"] = "%d" % exc.wait
+        return response
+
+
+async def requested_categories(user, data):
+    """The user's categories named by ``data["category"]``, keyed by id, for NoteBatchCreateSerializer."""
+    ids = bulk.requested_ids([data.get("category")]) if isinstance(data, dict) else set()
+    if not ids:
+        return {}
+    return {category.pk: category async for category in Category.objects.filter(user=user, pk__in=ids)}
+
+
+class AsyncNoteListView(AsyncAPIView):
+    async def get(self, request):
+        queryset = note_queryset(self.user, request.query_params)
+        fields = list_fields(request, NoteSerializer.Meta.fields)
+        etag, last_modified = await sync.alist_validators(self.user, request.query_params)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        since = sync.parse_since(request.query_params.get("updated_since"))
+        if since is not None:
+            if sync.is_beyond_retention(since):
+                return self.render(
+                    {"detail": "updated_since is older than the deletion history; fetch the full list."},
+                    status=status.HTTP_410_GONE,
+                )
+            server_time = timezone.now()
+            queryset = sync.changed_since(queryset, since)
+
+        paginator = NoteCursorPagination()
+        page = await paginator.apaginate_queryset(queryset.values(*NoteValuesSerializer.columns(fields)), request)
+        data = paginator.get_paginated_response(NoteValuesSerializer(page, many=True, fields=fields).data).data
+        if since is not None and not request.query_params.get(paginator.cursor_query_param):
+            data["deleted"] = await sync.adeleted_since(self.user, since)
+            data["server_time"] = server_time.isoformat()
+
+        response = self.render(data)
+        sync.set_validators(response, etag, last_modified)
+        return response
+
+    async def post(self, request):
+        categories = await requested_categories(self.user, request.data)
+        serializer = NoteBatchCreateSerializer(data=request.data, context={"categories": categories})
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        if data.get("category"):
+            note = await Note.objects.acreate(user=self.user, **data)
+        else:
+            note = await caching.asave_with_default_category(
+                self.user, lambda category: Note.objects.create(user=self.user, **{**data, "category": category}),
+            )
+        return self.render(NoteSerializer(note).data, status=status.HTTP_201_CREATED)
+
+
+@sync_to_async
+def update_note(user, pk, request, data):
+    # locked from the If-Match check until the write commits, as in NoteViewSet.update
+    with transaction.atomic():
+        note = note_queryset(user, {}).select_for_update(of=("self",)).filter(pk=pk).first()
+        if note is None:
+            raise exceptions.NotFound()
+        sync.check_if_match(request, sync.note_etag(note.updated_at))
+        save_changes(note, data)
+    return note
+
+
+class AsyncNoteDetailView(AsyncAPIView):
+    async def get(self, request, pk):
+        fields = requested_fields(request, NoteSerializer.Meta.fields)
+        row = await note_queryset(self.user, {}).values(*NoteValuesSerializer.columns(fields)).filter(pk=pk).afirst()
+        if row is None:
+            raise exceptions.NotFound()
+        response = self.render(NoteValuesSerializer(row, fields=fields).data)
+        response["ETag"] = sync.note_etag(row["updated_at"])
+        return response
+
+    async def put(self, request, pk):
+        return await self.update(request, pk, partial=False)
+
+    async def patch(self, request, pk):
+        return await self.update(request, pk, partial=True)
+
+    async def update(self, request, pk, partial):
+        categories = await requested_categories(self.user, request.data)
+        serializer = NoteBatchCreateSerializer(
+            data=request.data, partial=partial, context={"categories": categories},
+        )
+        serializer.is_valid(raise_exception=True)
+        note = await update_note(self.user, pk, request, serializer.validated_data)
+        response = self.render(NoteSerializer(note).data)
+        response["ETag"] = sync.note_etag(note.updated_at)
+        return response
+
+
+DUPLICATE_CATEGORY = {"detail": "Category with this name already exists for this user."}
+
+
+@sync_to_async
+def save_category(category):
+    # a savepoint keeps a surrounding transaction usable if the unique constraint fires
+    with transaction.atomic():
+        category.save()
+
+
+class AsyncCategoryListView(AsyncAPIView):
+    async def get(self, request):
+        data = await caching.aget_category_list(self.user.pk)
+        cache_status = "HIT"
+        if data is None:
+            categories = [category async for category in category_queryset(self.user)]
+            data = CategorySerializer(categories, many=True).data
+            await caching.aset_category_list(self.user.pk, data)
+            cache_status = "MISS"
+        response = self.render(data)
+        response["X-Cache"] = cache_status
+        return response
+
+    async def post(self, request):
+        serializer = CategorySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        category = Category(user=self.user, **serializer.validated_data)
+        try:
+            await save_category(category)
+        except IntegrityError:
+            return self.render(DUPLICATE_CATEGORY, status=status.HTTP_400_BAD_REQUEST)
+        return self.render(CategorySerializer(category).data, status=status.HTTP_201_CREATED)
+
+
+class AsyncCategoryDetailView(AsyncAPIView):
+    async def get(self, request, pk):
+        return self.render(CategorySerializer(await self.get_category(pk)).data)
+
+    async def put(self, request, pk):
+        return await self.update(request, pk, partial=False)
+
+    async def patch(self, request, pk):
+        return await self.update(request, pk, partial=True)
+
+    async def get_category(self, pk):
+        category = await category_queryset(self.user).filter(pk=pk).afirst()
+        if category is None:
+            raise exceptions.NotFound()
+        return category
+
+    async def update(self, request, pk, partial):
+        category = await self.get_category(pk)
+        serializer = CategorySerializer(category, data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        for field, value in serializer.validated_data.items():
+            setattr(category, field, value)
+        try:
+            await save_category(category)
+        except IntegrityError:
+            return self.render(DUPLICATE_CATEGORY, status=status.HTTP_400_BAD_REQUEST)
+        return self.render(CategorySerializer(category).data)
+
+
+class AsyncNoteEventsView(AsyncAPIView):
+    """The user's change feed as Server-Sent Events; see notes.events. Needs an ASGI server."""
+
+    async def get(self, request):
+        response = StreamingHttpResponse(events.stream(self.user.pk), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        # stop nginx from buffering the stream
+        response["X-Accel-Buffering"] = "no"
+        return response
@@ -0,0 +1,145 @@
+"""
+Batch note writes: many notes created, edited, moved or deleted in one request.
+
+Every batch is validated as a whole before anything is written, so a bad item
+is reported next to its index and nothing is applied. A valid batch is written
+in one transaction with bulk queries, and the user's categories are loaded once
+per batch, which also resolves the "Random Thoughts" default for new notes.
+"""
+import uuid
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import counters, events, revisions
+from .caching import invalidate_category_list
+from .models import DEFAULT_CATEGORY_NAME, Category, Note, NoteRevision, NoteTombstone
+from .search import get_search_backend
+
+MAX_BATCH_SIZE = 1000
+# notes per import job: the request has to fit DATA_UPLOAD_MAX_MEMORY_SIZE
+# (2.5 MB by default), about 250 bytes a note
+MAX_IMPORT_SIZE = 10000
+
+
+def user_categories(user):
+    """All of ``user``'s categories keyed by id, in one query."""
+    return {category.pk: category for category in Category.objects.filter(user=user).order_by()}
+
+
+def default_category(categories):
+    return next((c for c in categories.values() if c.name.lower() == DEFAULT_CATEGORY_NAME.lower()), None)
+
+
+def requested_ids(values):
+    """The well-formed note ids among raw request values; the serializer reports the rest."""
+    ids = set()
+    for value in values:
+        try:
+            ids.add(uuid.UUID(str(value)))
+        except ValueError:
+            pass
+    return ids
+
+
+def user_notes(user, ids, lock=False):
+    """``user``'s notes among ``ids``, keyed by id; ``lock`` holds them until the transaction ends."""
+    notes = Note.objects.filter(user=user, pk__in=ids).select_related('category').order_by()
+    if lock:
+        notes = notes.select_for_update(of=('self',))
+    return {note.pk: note for note in notes}
+
+
+def existing_note_ids(user, ids):
+    return set(Note.objects.filter(user=user, pk__in=ids).values_list('pk', flat=True))
+
+
+def create_notes(user, items, categories):
+    default = default_category(categories)
+    notes = [Note(user=user, **{**item, 'category': item.get('category') or default}) for item in items]
+    # bulk_create skips save(), which keeps previews up to date
+    for note in notes:
+        note.set_preview()
+    with transaction.atomic():
+        Note.objects.bulk_create(notes)
+        get_search_backend().index_notes(notes)
+        revisions.record(notes, created=True)
+        if any(note.category_id for note in notes):
+            counters.adjust(user.pk, Counter(note.category_id for note in notes))
+            invalidate_category_list(user.pk)
+        events.publish_on_commit(user.pk, [events.note_event('created', note) for note in notes])
+    return notes
+
+
+def update_notes(items, notes):
+    """
+    Apply validated edits to the loaded ``notes``; returns them in request order.
+
+    The counts move from the categories the notes were loaded in, so load them
+    with ``user_notes(..., lock=True)`` in the same transaction.
+    """
+    now = timezone.now()
+    fields = {'updated_at'}
+    touched = {}
+    loaded_categories = {}
+    for item in items:
+        note = notes[item['id']]
+        loaded_categories.setdefault(note.pk, note.category_id)
+        for field, value in item.items():
+            if field != 'id':
+                setattr(note, field, value)
+                fields.add(field)
+        note.updated_at = now
+        touched[note.pk] = note
+    if 'content' in fields:
+        for note in touched.values():
+            note.set_preview()
+        fields.add('preview')
+    edited = list(touched.values())
+    with transaction.atomic():
+        # bulk_update skips auto_now, hence the explicit updated_at
+        Note.objects.bulk_update(edited, sorted(fields))
+        if fields & {'title', 'content'}:
+            get_search_backend().index_notes(edited)
+            revisions.record(edited)
+        if 'category' in fields:
+            moves = counters.moves((loaded_categories[note.pk], note.category_id) for note in edited)
+            counters.adjust(edited[0].user_id, moves)
+            invalidate_category_list(edited[0].user_id)
+        events.publish_on_commit(edited[0].user_id, [events.note_event('updated', note) for note in edited])
+    return edited
+
+
+def move_notes(user, ids, category):
+    now = timezone.now()
+    with transaction.atomic():
+        notes = Note.objects.filter(user=user, pk__in=ids)
+        # locked, so the counts move from the categories the notes are really in
+        loaded = notes.select_for_update().order_by().values_list('category_id', flat=True)
+        target = category.pk if category else None
+        deltas = counters.moves((old, target) for old in loaded)
+        moved = notes.update(category=category, updated_at=now)
+        counters.adjust(user.pk, deltas)
+        invalidate_category_list(user.pk)
+        events.publish_on_commit(user.pk, events.notes_moved(ids, category.pk if category else None, now))
+    return moved
+
+
+def delete_notes(user, ids):
+    with transaction.atomic():
+        notes = Note.objects.filter(user=user, pk__in=ids)
+        # locked, so the counts come off the categories the notes are really in
+        loaded = dict(notes.select_for_update().order_by().values_list('pk', 'category_id'))
+        # raw deletes send no post_delete, so the per-note receivers are done
+        # here once for the whole batch; revisions are the only rows that cascade
+        NoteRevision.objects.filter(note_id__in=loaded)._raw_delete(notes.db)
+        deleted = notes._raw_delete(notes.db)
+        NoteTombstone.objects.bulk_create([NoteTombstone(note_id=pk, user=user) for pk in loaded])
+        get_search_backend().remove_notes(list(loaded))
+        removed = Counter(category_id for category_id in loaded.values() if category_id is not None)
+        if removed:
+            counters.adjust(user.pk, {category_id: -count for category_id, count in removed.items()})
+            invalidate_category_list(user.pk)
+        events.publish_on_commit(user.pk, [events.note_deleted(pk) for pk in loaded])
+    return deleted
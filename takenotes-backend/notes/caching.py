@@ -0,0 +1,157 @@
+"""
+Per-user caches of category data.
+
+``GET /api/categories/`` is read on nearly every screen but only changes when a
+category is written or a note enters or leaves a category, and every note
+created without a category needs the user's default category. Both are cached
+per user (the default as its id, name and color) in the cache named by
+``NOTES_CATEGORY_CACHE`` (default ``'default'``) for
+``NOTES_CATEGORY_CACHE_TIMEOUT`` seconds (default 300).
+Entries are dropped from the Category and Note signals in ``notes.signals``
+and by the bulk note writes, which send no save signals.
+
+Hits and misses of the list are counted in the same cache, so with a shared
+backend the counters cover every worker.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
+
+from .models import DEFAULT_CATEGORY_NAME, Category
+
+KEY_PREFIX = 'notes:categories'
+STATS_EVENTS = ('hit', 'miss')
+# what is cached of the default category
+DEFAULT_FIELDS = ('id', 'name', 'color')
+
+
+def get_cache():
+    return caches[getattr(settings, 'NOTES_CATEGORY_CACHE', 'default')]
+
+
+def timeout():
+    return getattr(settings, 'NOTES_CATEGORY_CACHE_TIMEOUT', 300)
+
+
+def list_key(user_id):
+    return f'{KEY_PREFIX}:{user_id}'
+
+
+def default_key(user_id):
+    return f'{KEY_PREFIX}:{user_id}:default'
+
+
+def stats_key(event):
+    return f'{KEY_PREFIX}:stats:{event}'
+
+
+def record(event):
+    cache = get_cache()
+    key = stats_key(event)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # first event since the counter expired or was evicted
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def get_category_list(user_id):
+    data = get_cache().get(list_key(user_id))
+    record('miss' if data is None else 'hit')
+    return data
+
+
+def set_category_list(user_id, data):
+    get_cache().set(list_key(user_id), data, timeout())
+
+
+def find_default_category(user):
+    # compare on Lower(name) so the (user, Lower(name)) index serves the
+    # lookup; leave it unordered so no sort is needed on top of it
+    matches = (
+        Category.objects.alias(lower_name=Lower('name'))
+        .filter(user=user, lower_name=DEFAULT_CATEGORY_NAME.lower())
+        .order_by()[:1]
+    )
+    return next(iter(matches), None)
+
+
+def cached_category(user, values):
+    """A Category built from cached ``values``, as if loaded with ``only()`` on them."""
+    values = {**values, 'user_id': user.pk}
+    names = [field.attname for field in Category._meta.concrete_fields if field.attname in values]
+    return Category.from_db(Category.objects.db, names, [values[name] for name in names])
+
+
+def get_default_category(user):
+    """
+    The user's default category for new notes, or None if they have none.
+
+    The id, name and color are cached, which is all a new note and its response
+    need, so a hit runs no query. See save_with_default_category for a category
+    deleted by a process whose cache is not this one's.
+    """
+    key = default_key(user.pk)
+    cached = get_cache().get(key)
+    if cached is False:
+        # None cannot be cached, so "no default" is stored as False
+        return None
+    if cached is not None:
+        return cached_category(user, cached)
+    category = find_default_category(user)
+    values = {name: getattr(category, name) for name in DEFAULT_FIELDS} if category else False
+    get_cache().set(key, values, timeout())
+    return category
+
+
+def save_with_default_category(user, save):
+    """
+    Call ``save(category)`` with ``user``'s default category and return its result.
+
+    With a per-process cache another process may have deleted the cached
+    category. The foreign key check rejects a note pointing at it when the save
+    commits; the entry is then dropped and the save retried with a fresh lookup.
+    """
+    category = get_default_category(user)
+    try:
+        with transaction.atomic():
+            return save(category)
+    except IntegrityError:
+        if category is None:
+            raise
+        drop(default_key(user.pk))
+        return save(get_default_category(user))
+
+
+# Django's cache backends implement their async methods with sync_to_async, so
+# wrapping the sync helpers costs the async views nothing extra
+aget_category_list = sync_to_async(get_category_list)
+aset_category_list = sync_to_async(set_category_list)
+asave_with_default_category = sync_to_async(save_with_default_category)
+
+
+def drop(*keys):
+    get_cache().delete_many(keys)
+    # a request racing the open transaction may re-cache the old value; drop
+    # the entries again once the write is visible
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: get_cache().delete_many(keys))
+
+
+def invalidate_category_list(user_id):
+    drop(list_key(user_id))
+
+
+def invalidate_categories(user_id):
+    """Drop everything cached about ``user_id``'s categories."""
+    drop(list_key(user_id), default_key(user_id))
+
+
+def stats():
+    counts = get_cache().get_many([stats_key(event) for event in STATS_EVENTS])
+    hits, misses = (counts.get(stats_key(event), 0) for event in STATS_EVENTS)
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_ratio': round(hits / total, 4) if total else None}
@@ -0,0 +1,76 @@
+"""
+Stored per-category note counts.
+
+``Category.note_count`` is what CategorySerializer renders, so listing
+categories runs no COUNT. Like the query it replaces, it counts only the
+notes of the category's own user. The counter is only ever changed with ``F()``
+updates, in the transaction that writes the notes: the Note signals in
+``notes.signals`` cover single saves and deletes, and ``notes.bulk`` the batch
+writes, which send no save signals. Deleting a category deletes its counter;
+its notes become uncategorized, and those are not counted.
+
+``python manage.py reconcile_category_counts`` recounts categories whose
+counter has drifted (after raw SQL, a fixture load, or a bug), and drops the
+cached category lists that showed the old counts.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .caching import invalidate_category_list
+from .models import Category, Note
+
+BATCH_SIZE = 1000
+
+
+def moves(pairs):
+    """Counter changes for notes moved from one category to another, as ``(old, new)`` id pairs."""
+    deltas = Counter()
+    for old, new in pairs:
+        if old != new:
+            deltas[old] -= 1
+            deltas[new] += 1
+    return deltas
+
+
+def adjust(user_id, deltas):
+    """
+    Add ``deltas`` ({category_id: change}) for notes of ``user_id`` to the
+    counters of that user's categories; one UPDATE per distinct change.
+    """
+    by_change = defaultdict(list)
+    for category_id, change in deltas.items():
+        if category_id is not None and change:
+            by_change[change].append(category_id)
+    for change, ids in by_change.items():
+        Category.objects.filter(pk__in=ids, user_id=user_id).update(note_count=F('note_count') + change)
+
+
+def actual_count():
+    """The number of notes in the category of the outer row, counted in the database."""
+    counts = Note.objects.filter(category=OuterRef('pk'), user=OuterRef('user')).order_by().values('category').annotate(total=Count('pk'))
+    return Coalesce(Subquery(counts.values('total'), output_field=IntegerField()), 0)
+
+
+def reconcile(categories=None):
+    """
+    Recount the categories (all by default) whose counter is off, and drop
+    their users' cached category lists; returns how many were fixed.
+    """
+    categories = Category.objects.all() if categories is None else categories
+    drifted = list(
+        categories.order_by()
+        .annotate(actual=Count('notes', filter=Q(notes__user=F('user'))))
+        .filter(~Q(note_count=F('actual')))
+        .values_list('pk', 'user_id')
+    )
+    for start in range(0, len(drifted), BATCH_SIZE):
+        batch = drifted[start:start + BATCH_SIZE]
+        # recounted in the UPDATE itself, so notes written since the check are not lost
+        with transaction.atomic():
+            Category.objects.filter(pk__in=[pk for pk, _ in batch]).update(note_count=actual_count())
+            for user_id in {user_id for _, user_id in batch}:
+                invalidate_category_list(user_id)
+    return len(drifted)
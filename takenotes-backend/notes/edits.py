@@ -0,0 +1,41 @@
+"""
+Incremental content edits: a note's content changed by a list of splices.
+
+An edit ``{"start": s, "end": e, "text": t}`` replaces ``content[s:e]`` with
+``t``. Offsets refer to the base content the client last read (named by the
+note's ETag), edits are in ascending order and do not overlap, and they count
+UTF-16 code units, as JavaScript string indices do, so a browser can send the
+offsets its editor reports without converting them.
+"""
+
+MAX_EDITS = 1000
+
+
+def utf16_length(text):
+    return len(text) if text.isascii() else len(text.encode('utf-16-le')) // 2
+
+
+def apply_edits(content, edits):
+    """Return ``content`` with ``edits`` applied; ValueError if they do not fit it."""
+    if content.isascii() and all(edit['text'].isascii() for edit in edits):
+        # one code unit per character, so plain string slicing will do
+        return splice(content, edits, len(content), 1)
+    try:
+        units = content.encode('utf-16-le')
+        encoded = [{**edit, 'text': edit['text'].encode('utf-16-le')} for edit in edits]
+        return splice(units, encoded, len(units) // 2, 2).decode('utf-16-le')
+    except UnicodeError:
+        raise ValueError('Edits must not split a surrogate pair.')
+
+
+def splice(content, edits, length, width):
+    pieces = []
+    position = 0
+    for edit in edits:
+        if edit['end'] > length:
+            raise ValueError(f"Edit {edit['start']}-{edit['end']} ends past the end of the content ({length}).")
+        pieces.append(content[position * width:edit['start'] * width])
+        pieces.append(edit['text'])
+        position = edit['end']
+    pieces.append(content[position * width:])
+    return content[:0].join(pieces)
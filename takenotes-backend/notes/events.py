@@ -0,0 +1,248 @@
+"""
+Per-user change feed: note and category writes pushed to Server-Sent Events streams.
+
+Model signals (and the batch writers, which bypass them) publish small events
+once their transaction commits. The broker fans every event out to the
+subscriptions of the same user, each an open ``/api/async/events/`` stream on
+this process's event loop.
+
+Events only say what changed, e.g.
+``{"type": "note.updated", "id": "...", "category": "...", "updated_at": "..."}``;
+clients fetch the notes themselves with ``GET /api/notes/?updated_since=``.
+Each stream starts with a ``ready`` event carrying ``server_time``, so after a
+reconnect a client syncs from the ``server_time`` it last saw and misses nothing.
+
+``LocalBroker`` only reaches streams in the same process. To fan out across
+processes, subclass it so that ``publish`` sends to a shared transport (e.g.
+Redis pub/sub) and a listener calls ``deliver`` for each message received, and
+point ``NOTES_EVENT_BROKER`` at the subclass.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework import serializers
+
+# timestamps read the same as in the notes API
+format_datetime = serializers.DateTimeField().to_representation
+
+# sent instead of the next event when a subscriber fell behind and events were dropped
+RESYNC = 'resync'
+
+
+def queue_size():
+    return getattr(settings, 'NOTES_EVENTS_QUEUE_SIZE', 256)
+
+
+def heartbeat_interval():
+    return getattr(settings, 'NOTES_EVENTS_HEARTBEAT', 15)
+
+
+class EventMetrics:
+    """Per-process counters for the change feed, and recent delivery latencies."""
+
+    def __init__(self, samples=1000):
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=samples)
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.connections = 0
+            self.connections_total = 0
+            self.published = 0
+            self.delivered = 0
+            self.dropped = 0
+            self.latencies.clear()
+
+    def connected(self):
+        with self.lock:
+            self.connections += 1
+            self.connections_total += 1
+
+    def disconnected(self):
+        with self.lock:
+            self.connections -= 1
+
+    def record_published(self, count):
+        with self.lock:
+            self.published += count
+
+    def record_delivered(self, published_at):
+        with self.lock:
+            self.delivered += 1
+            self.latencies.append(time.monotonic() - published_at)
+
+    def record_dropped(self, count):
+        with self.lock:
+            self.dropped += count
+
+    def snapshot(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            data = {
+                'connections': self.connections,
+                'connections_total': self.connections_total,
+                'events_published': self.published,
+                'events_delivered': self.delivered,
+                'events_dropped': self.dropped,
+            }
+        data['latency_ms'] = {
+            name: round(latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000, 3)
+            if latencies else None
+            for name, fraction in (('p50', 0.5), ('p99', 0.99), ('max', 1))
+        }
+        return data
+
+
+metrics = EventMetrics()
+
+
+class Subscription:
+    """One open stream: a bounded queue of ``(event, published_at)`` on the stream's event loop."""
+
+    def __init__(self, user_id, maxsize):
+        self.user_id = str(user_id)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def put(self, item):
+        # runs on self.loop
+        if self.overflowed:
+            metrics.record_dropped(1)
+            return
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # a client this far behind is told to resync rather than fed a gap
+            self.overflowed = True
+            metrics.record_dropped(self.queue.qsize() + 1)
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait((RESYNC, None))
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class LocalBroker:
+    """In-process fan-out from publishers on any thread to subscriptions on event loops."""
+
+    def __init__(self):
+        self.subscriptions = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id, queue_size())
+        with self.lock:
+            self.subscriptions[subscription.user_id].add(subscription)
+        metrics.connected()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers = self.subscriptions.get(subscription.user_id)
+            if subscribers is None or subscription not in subscribers:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self.subscriptions[subscription.user_id]
+        metrics.disconnected()
+
+    def publish(self, user_id, events):
+        self.deliver(user_id, events, time.monotonic())
+
+    def deliver(self, user_id, events, published_at):
+        """Hand ``events`` to this process's subscriptions of ``user_id``."""
+        with self.lock:
+            subscribers = list(self.subscriptions.get(str(user_id), ()))
+        for subscription in subscribers:
+            for event in events:
+                try:
+                    subscription.loop.call_soon_threadsafe(subscription.put, (event, published_at))
+                except RuntimeError:
+                    # the stream's loop has shut down without closing the stream
+                    self.unsubscribe(subscription)
+                    break
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    path = getattr(settings, 'NOTES_EVENT_BROKER', 'notes.events.LocalBroker')
+    return import_string(path)()
+
+
+def publish_on_commit(user_id, events):
+    """Publish ``events`` once the current transaction commits (at once outside one)."""
+    if not events:
+        return
+
+    def publish():
+        metrics.record_published(len(events))
+        get_broker().publish(user_id, events)
+
+    # robust: a broker outage is logged, it never fails the write that was just committed
+    transaction.on_commit(publish, robust=True)
+
+
+def note_event(action, note):
+    return {
+        'type': f'note.{action}',
+        'id': str(note.pk),
+        'category': str(note.category_id) if note.category_id else None,
+        'updated_at': format_datetime(note.updated_at),
+    }
+
+
+def notes_moved(ids, category_id, updated_at):
+    category = str(category_id) if category_id else None
+    updated_at = format_datetime(updated_at)
+    return [
+        {'type': 'note.updated', 'id': str(pk), 'category': category, 'updated_at': updated_at}
+        for pk in dict.fromkeys(ids)
+    ]
+
+
+def note_deleted(note_id):
+    return {'type': 'note.deleted', 'id': str(note_id), 'deleted_at': format_datetime(timezone.now())}
+
+
+def category_event(action, category):
+    event = {'type': f'category.{action}', 'id': str(category.pk)}
+    if action != 'deleted':
+        event.update(name=category.name, color=category.color, updated_at=format_datetime(category.updated_at))
+    return event
+
+
+def format_event(name, data):
+    return f'event: {name}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+
+
+async def stream(user_id):
+    """The Server-Sent Events body of one user's change feed; runs until the client goes away."""
+    broker = get_broker()
+    subscription = broker.subscribe(user_id)
+    try:
+        yield format_event('ready', {'server_time': timezone.now().isoformat()})
+        while True:
+            try:
+                event, published_at = await asyncio.wait_for(subscription.get(), heartbeat_interval())
+            except TimeoutError:
+                # keeps proxies from closing an idle connection
+                yield ': keep-alive\n\n'
+                continue
+            if event == RESYNC:
+                yield format_event(RESYNC, {})
+                return
+            metrics.record_delivered(published_at)
+            yield format_event(event['type'], event)
+    finally:
+        broker.unsubscribe(subscription)
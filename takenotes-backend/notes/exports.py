@@ -0,0 +1,128 @@
+"""
+Streaming exports of a user's notes as NDJSON or a JSON array, optionally gzipped.
+
+Rows are read with a chunked ``iterator()`` over a values() query (a
+server-side cursor on PostgreSQL) and rendered one at a time with
+NoteValuesSerializer, so the response is produced while the client downloads
+it and memory use stays flat however many notes there are.
+
+Under ASGI Django reads a sync iterator to the end before sending any of it,
+so there the response gets an async iterator instead (see ``astreamed``),
+which produces the same chunks one at a time on the sync thread.
+"""
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+from .serializers import NoteValuesSerializer
+
+CHUNK_SIZE = 2000
+# bytes gathered before a piece of the response is handed to the server
+BUFFER_SIZE = 64 * 1024
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+}
+
+
+def encode(data):
+    # compact, like JSONRenderer
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+def ndjson_pieces(notes):
+    for note in notes:
+        yield encode(note) + '\n'
+
+
+def json_array_pieces(notes):
+    yield '['
+    separator = ''
+    for note in notes:
+        yield separator + encode(note)
+        separator = ','
+    yield ']'
+
+
+def buffered(pieces, size=BUFFER_SIZE):
+    """Join small text pieces into byte chunks of roughly ``size`` bytes."""
+    buffer, length = [], 0
+    for piece in pieces:
+        data = piece.encode()
+        buffer.append(data)
+        length += len(data)
+        if length >= size:
+            yield b''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def gzipped(chunks):
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def counted(rows, report):
+    """Pass ``rows`` through, calling ``report(count)`` every CHUNK_SIZE rows and at the end."""
+    count = 0
+    for count, row in enumerate(rows, start=1):
+        yield row
+        if count % CHUNK_SIZE == 0:
+            report(count)
+    report(count)
+
+
+def export_chunks(queryset, output='ndjson', compress=False, report=None):
+    """
+    Yield the export of ``queryset`` as byte chunks. ``report``, if given, is
+    called with the number of notes exported so far as the export proceeds.
+    """
+    serializer = NoteValuesSerializer()
+    rows = queryset.values(*NoteValuesSerializer.values).iterator(chunk_size=CHUNK_SIZE)
+    if report is not None:
+        rows = counted(rows, report)
+    notes = (serializer.to_representation(row) for row in rows)
+    pieces = ndjson_pieces(notes) if output == 'ndjson' else json_array_pieces(notes)
+    chunks = buffered(pieces)
+    return gzipped(chunks) if compress else chunks
+
+
+async def astreamed(chunks):
+    """
+    ``chunks`` as an async iterator. Each chunk is made on the thread sync
+    views and their database connection run on, so the cursor stays where it
+    was opened and rendering keeps off the event loop.
+    """
+    next_chunk = sync_to_async(next)
+    try:
+        while (chunk := await next_chunk(chunks, None)) is not None:
+            yield chunk
+    finally:
+        # a client that disconnects early leaves the cursor open otherwise
+        await sync_to_async(chunks.close)()
+
+
+def export_file(output='ndjson', compress=False):
+    """The file name and content type of an export."""
+    if compress:
+        return f'notes.{output}.gz', 'application/gzip'
+    return f'notes.{output}', CONTENT_TYPES[output] + '; charset=utf-8'
+
+
+def export_response(queryset, output='ndjson', compress=False, asynchronous=False):
+    """The export as a download; ``asynchronous`` streams it to an ASGI server."""
+    filename, content_type = export_file(output, compress)
+    chunks = export_chunks(queryset, output, compress)
+    response = StreamingHttpResponse(astreamed(chunks) if asynchronous else chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'private, no-store'
+    return response
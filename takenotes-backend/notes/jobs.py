@@ -0,0 +1,229 @@
+"""
+Background jobs, queued in the database and run by ``python manage.py run_jobs``.
+
+Work too slow for a request (a whole-account export, a large import,
+rebuilding the search index) is queued as a Job row and answered with 202;
+clients poll ``GET /api/jobs/{id}/`` for its status and progress. There is no
+broker: workers find due rows by polling and claim each one with a conditional
+UPDATE, which only one worker can win, so any number of them can share the
+queue on SQLite or PostgreSQL.
+
+A job whose handler raises goes back to the queue after an exponential
+backoff, ``JOBS_RETRY_DELAY * 2 ** (attempt - 1)`` seconds (default 10) capped
+at ``JOBS_RETRY_MAX_DELAY`` (default 600), until it has had
+``JOBS_MAX_ATTEMPTS`` attempts (default 3). Handlers report progress with
+``set_progress``, which also tells other workers the job is alive; a running
+job that has not reported for ``JOBS_LOCK_TIMEOUT`` seconds (default 600) was
+left by a worker that died, and is taken back as a failed attempt.
+
+Handlers are registered with ``@handler(kind)``; each gets the Job and returns
+its JSON result. Handlers may be retried, so they should be safe to run again
+(the import resumes where the last attempt committed).
+"""
+import datetime
+import logging
+import os
+import shutil
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import bulk, exports
+from .models import Job, Note
+from .search import get_search_backend
+from .serializers import NoteBatchCreateSerializer
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+# import errors kept in a job's result; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+
+def max_attempts():
+    return getattr(settings, 'JOBS_MAX_ATTEMPTS', 3)
+
+
+def retry_delay():
+    return getattr(settings, 'JOBS_RETRY_DELAY', 10)
+
+
+def max_retry_delay():
+    return getattr(settings, 'JOBS_RETRY_MAX_DELAY', 600)
+
+
+def lock_timeout():
+    return datetime.timedelta(seconds=getattr(settings, 'JOBS_LOCK_TIMEOUT', 600))
+
+
+def results_dir():
+    return Path(getattr(settings, 'JOBS_RESULTS_DIR', settings.BASE_DIR / 'job_results'))
+
+
+def retention():
+    return datetime.timedelta(days=getattr(settings, 'JOBS_RETENTION_DAYS', 7))
+
+
+def handler(kind):
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+def enqueue(kind, user=None, **params):
+    if kind not in HANDLERS:
+        raise ValueError(f'Unknown job kind: {kind}')
+    return Job.objects.create(kind=kind, user=user, params=params, max_attempts=max_attempts())
+
+
+def backoff(attempts):
+    """Seconds to wait before attempt ``attempts + 1``."""
+    return min(retry_delay() * 2 ** (attempts - 1), max_retry_delay())
+
+
+def claim(worker, limit=1):
+    """Claim up to ``limit`` due jobs for ``worker``; returns their ids."""
+    now = timezone.now()
+    stale = Q(status=Job.RUNNING, locked_at__lt=now - lock_timeout())
+    # a stale job that has used up its attempts is not worth another
+    Job.objects.filter(stale, attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, error='The worker running this job stopped responding.', finished_at=now,
+    )
+    candidates = (
+        Job.objects.filter(Q(status=Job.QUEUED, run_after__lte=now) | stale)
+        .order_by('run_after')
+        .values_list('pk', 'status', 'locked_at')[:limit * 4]
+    )
+    claimed = []
+    for pk, status, locked_at in candidates:
+        # matches nothing if another worker claimed the job since it was read
+        taken = Job.objects.filter(pk=pk, status=status, locked_at=locked_at).update(
+            status=Job.RUNNING, locked_by=worker, locked_at=now, attempts=F('attempts') + 1,
+        )
+        if taken:
+            claimed.append(pk)
+            if len(claimed) == limit:
+                break
+    return claimed
+
+
+def set_progress(job, progress, total=None, **fields):
+    """Record how far ``job`` has got; this is also its worker's heartbeat."""
+    job.progress = progress
+    fields.update(progress=progress, locked_at=timezone.now())
+    if total is not None:
+        job.total = fields['total'] = total
+    Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(**fields)
+
+
+def run(pk, worker):
+    """Run the claimed job ``pk``; returns its status afterwards."""
+    job = Job.objects.select_related('user').get(pk=pk)
+    try:
+        result = HANDLERS[job.kind](job)
+    except Exception as exc:
+        logger.exception('Job %s (%s) failed on attempt %s', job.pk, job.kind, job.attempts)
+        return fail(job, worker, f'{type(exc).__name__}: {exc}')
+    # only the worker that still holds the job may finish it
+    Job.objects.filter(pk=pk, locked_by=worker).update(
+        status=Job.SUCCEEDED, result=result, error='', finished_at=timezone.now(),
+    )
+    return Job.SUCCEEDED
+
+
+def fail(job, worker, error):
+    now = timezone.now()
+    if job.attempts < job.max_attempts:
+        status, fields = Job.QUEUED, {
+            'run_after': now + datetime.timedelta(seconds=backoff(job.attempts)), 'locked_by': '', 'locked_at': None,
+        }
+    else:
+        status, fields = Job.FAILED, {'finished_at': now}
+    Job.objects.filter(pk=job.pk, locked_by=worker).update(status=status, error=error, **fields)
+    return status
+
+
+def run_in_worker(pk, worker):
+    """run() on a pool thread or process, which keeps no database connection afterwards."""
+    try:
+        return run(pk, worker)
+    finally:
+        connections.close_all()
+
+
+def result_path(job):
+    return results_dir() / str(job.pk) / job.result['file']
+
+
+def prune():
+    """Delete finished jobs older than JOBS_RETENTION_DAYS, with their files; returns how many."""
+    finished = Job.objects.filter(status__in=[Job.SUCCEEDED, Job.FAILED], finished_at__lt=timezone.now() - retention())
+    ids = list(finished.values_list('pk', flat=True))
+    for pk in ids:
+        shutil.rmtree(results_dir() / str(pk), ignore_errors=True)
+    Job.objects.filter(pk__in=ids).delete()
+    return len(ids)
+
+
+@handler('export')
+def export_notes(job):
+    """The user's notes as an export file, the same as GET /api/notes/export/ sends."""
+    output, compress = job.params.get('output', 'ndjson'), job.params.get('gzip', False)
+    queryset = Note.objects.filter(user=job.user).order_by('-updated_at', '-id')
+    if job.params.get('category'):
+        queryset = queryset.filter(category_id=job.params['category'])
+    filename, content_type = exports.export_file(output, compress)
+    path = results_dir() / str(job.pk) / filename
+    path.parent.mkdir(parents=True, exist_ok=True)
+    set_progress(job, 0, queryset.count())
+    # written under a temporary name, so a failed attempt leaves no partial file behind
+    partial = path.with_name(path.name + '.partial')
+    with open(partial, 'wb') as file:
+        for chunk in exports.export_chunks(queryset, output, compress, report=lambda done: set_progress(job, done)):
+            file.write(chunk)
+    os.replace(partial, path)
+    return {'file': filename, 'content_type': content_type, 'size': path.stat().st_size, 'notes': job.progress}
+
+
+@handler('import')
+def import_notes(job):
+    """
+    Create notes from ``params["notes"]``, MAX_BATCH_SIZE at a time. Invalid
+    items are skipped and reported by index. Each batch commits together with
+    the job's progress, so a retry carries on after the last committed batch.
+    """
+    items = job.params['notes']
+    categories = bulk.user_categories(job.user)
+    state = job.result or {'created': 0, 'failed': 0, 'errors': {}}
+    set_progress(job, job.progress, len(items))
+    for start in range(job.progress, len(items), bulk.MAX_BATCH_SIZE):
+        valid = []
+        for index, item in enumerate(items[start:start + bulk.MAX_BATCH_SIZE], start=start):
+            serializer = NoteBatchCreateSerializer(data=item, context={'categories': categories})
+            if serializer.is_valid():
+                valid.append(serializer.validated_data)
+                continue
+            state['failed'] += 1
+            if len(state['errors']) < MAX_REPORTED_ERRORS:
+                state['errors'][str(index)] = serializer.errors
+        with transaction.atomic():
+            if valid:
+                bulk.create_notes(job.user, valid, categories)
+            state['created'] += len(valid)
+            set_progress(job, min(start + bulk.MAX_BATCH_SIZE, len(items)), result=state)
+    return state
+
+
+@handler('reindex')
+def rebuild_search_index(job):
+    """Rebuild the full-text search index, as ``manage.py rebuild_search_index`` does."""
+    backend = get_search_backend()
+    set_progress(job, 0, 1)
+    with transaction.atomic():
+        backend.rebuild()
+    set_progress(job, 1)
+    return {'backend': type(backend).__name__}
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from notes import jobs
+
+
+class Command(BaseCommand):
+    help = "Delete finished background jobs older than JOBS_RETENTION_DAYS, with their export files."
+
+    def handle(self, *args, **options):
+        pruned = jobs.prune()
+        self.stdout.write(self.style.SUCCESS(f"Pruned {pruned} finished job(s)."))
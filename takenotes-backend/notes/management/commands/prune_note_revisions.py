@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from notes.revisions import prune, retention, revision_limit
+
+
+class Command(BaseCommand):
+    help = "Delete note revisions older than NOTE_REVISION_RETENTION_DAYS or beyond NOTE_REVISION_LIMIT per note."
+
+    def handle(self, *args, **options):
+        deleted = prune()
+        self.stdout.write(self.style.SUCCESS(
+            f"Pruned {deleted} revision(s) older than {retention().days} days "
+            f"or beyond the newest {revision_limit()} of a note."
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from notes.models import NoteTombstone
+from notes.sync import tombstone_retention
+
+
+class Command(BaseCommand):
+    help = "Delete note tombstones older than NOTE_TOMBSTONE_RETENTION_DAYS."
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - tombstone_retention()
+        deleted, _ = NoteTombstone.objects.filter(deleted_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f"Pruned {deleted} tombstone(s) older than {cutoff:%Y-%m-%d %H:%M}."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from notes.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the note full-text search index from the notes table."
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        with transaction.atomic():
+            backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt search index ({type(backend).__name__})."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from notes.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = "Recount the stored note counts of categories that have drifted from the notes table."
+
+    def handle(self, *args, **options):
+        fixed = reconcile()
+        self.stdout.write(self.style.SUCCESS(f"Reconciled {fixed} category count(s)."))
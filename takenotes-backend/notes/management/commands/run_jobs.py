@@ -0,0 +1,70 @@
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from notes import jobs
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs on a pool of threads or processes until stopped (see notes.jobs)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Jobs run at the same time (default 4).')
+        parser.add_argument(
+            '--processes', action='store_true',
+            help='Run jobs in worker processes instead of threads, for CPU-bound jobs.',
+        )
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between polls of an idle queue.')
+        parser.add_argument('--burst', action='store_true', help='Exit once no job is due instead of waiting for more.')
+        parser.add_argument('--name', default='', help='Worker name recorded on claimed jobs (default host:pid).')
+
+    def handle(self, *args, workers, processes, poll_interval, burst, name, **options):
+        worker = name or f'{socket.gethostname()}:{os.getpid()}'
+        stopping = threading.Event()
+        previous = {sig: signal.signal(sig, lambda *_: stopping.set()) for sig in (signal.SIGINT, signal.SIGTERM)}
+        if processes:
+            # children open their own connections; they must not inherit ours
+            connections.close_all()
+            pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup)
+        else:
+            pool = ThreadPoolExecutor(workers, thread_name_prefix='job')
+        running, finished = {}, 0
+        try:
+            with pool:
+                while not stopping.is_set():
+                    claimed = jobs.claim(worker, workers - len(running)) if len(running) < workers else []
+                    for pk in claimed:
+                        running[pool.submit(jobs.run_in_worker, pk, worker)] = pk
+                    if not running:
+                        if burst:
+                            break
+                        stopping.wait(poll_interval)
+                        continue
+                    done, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finished += 1
+                        self.report(running.pop(future), future)
+                # on a stop signal, the jobs already started are finished
+                for future in list(running):
+                    finished += 1
+                    self.report(running.pop(future), future)
+        finally:
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+        self.stdout.write(self.style.SUCCESS(f"Worker {worker} ran {finished} job(s)."))
+
+    def report(self, pk, future):
+        try:
+            status = future.result()
+        except Exception as exc:
+            # the job is left running and is taken back once its lock times out
+            self.stderr.write(f"Job {pk} crashed its worker: {type(exc).__name__}: {exc}")
+            return
+        self.stdout.write(f"Job {pk} {status}.")
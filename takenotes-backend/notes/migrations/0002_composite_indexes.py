@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-17 16:19
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(models.F('user'), django.db.models.functions.text.Lower('name'), name='category_user_lower_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['user', '-updated_at', '-id'], name='note_user_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['user', 'category', '-updated_at', '-id'], name='note_user_cat_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 6.0 on 2026-10-17 17:02
+
+from django.db import migrations
+
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE notes_note_fts USING fts5("
+    "title, content, note_id, user_id, tokenize = 'unicode61 remove_diacritics 2')",
+    "INSERT INTO notes_note_fts (title, content, note_id, user_id) "
+    "SELECT title, content, id, user_id FROM notes_note",
+]
+SQLITE_BACKWARD = [
+    "DROP TABLE IF EXISTS notes_note_fts",
+]
+
+POSTGRES_FORWARD = [
+    "ALTER TABLE notes_note ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(content, '')), 'B')) STORED",
+    "CREATE INDEX note_search_vector_idx ON notes_note USING GIN (search_vector)",
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS note_search_vector_idx",
+    "ALTER TABLE notes_note DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0002_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            run_for_vendor({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-17 18:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0004_note_tombstone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NoteRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('number', models.PositiveIntegerField()),
+                ('title', models.CharField(blank=True, default='', max_length=200)),
+                ('keyframe', models.BooleanField(default=False)),
+                ('data', models.BinaryField()),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('note', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='notes.note')),
+            ],
+            options={
+                'ordering': ['-number'],
+                'indexes': [models.Index(fields=['created_at'], name='revision_created_idx')],
+                'constraints': [models.UniqueConstraint(fields=('note', 'number'), name='unique_revision_number_per_note')],
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 6.0 on 2026-10-17 18:54
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+# notes.models.make_preview as of this migration, so later changes to it do
+# not change what this backfill writes
+PREVIEW_LENGTH = 500
+PREVIEW_LINES = 12
+
+
+def make_preview(content):
+    cut = content[:PREVIEW_LENGTH]
+    lines = cut.split('\n', PREVIEW_LINES)
+    if len(lines) > PREVIEW_LINES:
+        cut = '\n'.join(lines[:PREVIEW_LINES])
+    if len(cut) == len(content):
+        return content
+    space = cut.rfind(' ', PREVIEW_LENGTH * 4 // 5)
+    if space != -1 and len(cut) == PREVIEW_LENGTH:
+        cut = cut[:space]
+    return cut.rstrip() + '…'
+
+
+def fill_previews(apps, schema_editor):
+    Note = apps.get_model('notes', 'Note')
+    batch = []
+    for note in Note.objects.only('id', 'content').iterator(chunk_size=BATCH_SIZE):
+        note.preview = make_preview(note.content)
+        batch.append(note)
+        if len(batch) == BATCH_SIZE:
+            Note.objects.bulk_update(batch, ['preview'])
+            batch = []
+    Note.objects.bulk_update(batch, ['preview'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0005_note_revision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='preview',
+            field=models.CharField(blank=True, default='', editable=False, max_length=501),
+        ),
+        migrations.RunPython(fill_previews, migrations.RunPython.noop),
+    ]
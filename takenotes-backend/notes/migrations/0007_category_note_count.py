@@ -0,0 +1,30 @@
+# Generated by Django 6.0 on 2026-10-17 20:12
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_notes(apps, schema_editor):
+    Category = apps.get_model('notes', 'Category')
+    Note = apps.get_model('notes', 'Note')
+    counts = Note.objects.filter(category=OuterRef('pk'), user=OuterRef('user')).order_by().values('category').annotate(total=Count('pk'))
+    Category.objects.update(
+        note_count=Coalesce(Subquery(counts.values('total'), output_field=models.IntegerField()), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0006_note_preview'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='note_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_notes, migrations.RunPython.noop),
+    ]
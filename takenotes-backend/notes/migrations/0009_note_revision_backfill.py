@@ -0,0 +1,47 @@
+# Generated by Django 6.0 on 2026-10-17 22:05
+
+import zlib
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+BATCH_SIZE = 1000
+
+
+def record_existing_notes(apps, schema_editor):
+    # Notes written before 0005 have no history, and their first edit would
+    # start it with the edited text. Give each one a keyframe of what it holds
+    # now, dated to its last edit, as notes.revisions writes revision 1.
+    Note = apps.get_model('notes', 'Note')
+    NoteRevision = apps.get_model('notes', 'NoteRevision')
+    # ids first: the writes below change which notes the filter matches
+    ids = list(Note.objects.filter(revisions__isnull=True).values_list('id', flat=True))
+    for start in range(0, len(ids), BATCH_SIZE):
+        notes = Note.objects.filter(pk__in=ids[start:start + BATCH_SIZE]).only('id', 'title', 'content')
+        save_revisions(Note, NoteRevision, [
+            NoteRevision(
+                note_id=note.pk, number=1, title=note.title, keyframe=True,
+                data=zlib.compress(note.content.encode()), size=len(note.content),
+            )
+            for note in notes
+        ])
+
+
+def save_revisions(Note, NoteRevision, batch):
+    NoteRevision.objects.bulk_create(batch)
+    # auto_now_add dated them now, which would fold the next edit into them
+    edited = Subquery(Note.objects.filter(pk=OuterRef('note_id')).values('updated_at'))
+    NoteRevision.objects.filter(note_id__in=[revision.note_id for revision in batch]).update(
+        created_at=edited, updated_at=edited,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0008_job'),
+    ]
+
+    operations = [
+        migrations.RunPython(record_existing_notes, migrations.RunPython.noop),
+    ]
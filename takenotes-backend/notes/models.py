@@ -1,7 +1,32 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Lower
 from django.conf import settings
+from django.utils import timezone
 import uuid
 
+# Notes created without a category go to the user's category of this name
+# (compared case-insensitively)
+DEFAULT_CATEGORY_NAME = 'Random Thoughts'
+
+# A note card shows the title and about this much of the content
+PREVIEW_LENGTH = 500
+PREVIEW_LINES = 12
+
+
+def make_preview(content):
+    """The start of ``content``: at most PREVIEW_LINES lines and PREVIEW_LENGTH characters, then "…"."""
+    cut = content[:PREVIEW_LENGTH]
+    lines = cut.split('\n', PREVIEW_LINES)
+    if len(lines) > PREVIEW_LINES:
+        cut = '\n'.join(lines[:PREVIEW_LINES])
+    if len(cut) == len(content):
+        return content
+    # end on a word boundary when there is one reasonably close
+    space = cut.rfind(' ', PREVIEW_LENGTH * 4 // 5)
+    if space != -1 and len(cut) == PREVIEW_LENGTH:
+        cut = cut[:space]
+    return cut.rstrip() + '…'
+
 
 class TimeStampedModel(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
@@ -16,27 +41,147 @@ class Category(TimeStampedModel):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='categories')
     name = models.CharField(max_length=50)
     color = models.CharField(max_length=7, default="#A3A3A3")  # HEX color like #RRGGBB
+    # notes in this category, kept by notes.counters
+    note_count = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['user', 'name'], name='unique_category_name_per_user'),
         ]
+        indexes = [
+            # case-insensitive name lookups (default category resolution)
+            models.Index(models.F('user'), Lower('name'), name='category_user_lower_name_idx'),
+        ]
         ordering = ['name']
 
     def __str__(self) -> str:
         return self.name
 
+    def save(self, **kwargs):
+        # note_count only changes through F() updates; writing back the value
+        # this instance loaded could undo notes counted since
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'note_count'
+            ]
+        super().save(**kwargs)
+
 
 class Note(TimeStampedModel):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notes')
     category = models.ForeignKey(Category, null=True, blank=True, on_delete=models.SET_NULL, related_name='notes')
     title = models.CharField(max_length=200, blank=True, default='')
+    # kept in step with content by save(); lists that leave content out return this instead
+    preview = models.CharField(max_length=PREVIEW_LENGTH + 1, blank=True, default='', editable=False)
     content = models.TextField(blank=True, default='')
 
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            # the notes list, newest first, with id as the keyset tie-breaker
+            models.Index(fields=['user', '-updated_at', '-id'], name='note_user_updated_idx'),
+            # the same list filtered by category
+            models.Index(fields=['user', 'category', '-updated_at', '-id'], name='note_user_cat_updated_idx'),
+        ]
 
     @property
     def last_edited(self):
         return self.updated_at
+
+    def set_preview(self):
+        self.preview = make_preview(self.content)
+
+    def save(self, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'content' in update_fields:
+            self.set_preview()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'preview'}
+        # the category counters are adjusted from post_save, in the same transaction
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            super().save(**kwargs)
+
+
+class NoteTombstone(models.Model):
+    """Marks a deleted note so syncing clients can drop their local copy."""
+    note_id = models.UUIDField(primary_key=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='note_tombstones')
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'deleted_at'], name='tombstone_user_deleted_idx'),
+        ]
+
+
+class NoteRevision(TimeStampedModel):
+    """
+    One saved version of a note's title and content.
+
+    ``data`` is zlib-compressed: the whole content for a keyframe, otherwise a
+    splice that turns the previous revision's content into this one's. See
+    notes.revisions for how revisions are written, read back and pruned.
+    """
+    note = models.ForeignKey(Note, on_delete=models.CASCADE, related_name='revisions')
+    number = models.PositiveIntegerField()
+    title = models.CharField(max_length=200, blank=True, default='')
+    keyframe = models.BooleanField(default=False)
+    data = models.BinaryField()
+    # content length in characters, so lists do not have to rebuild the content
+    size = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['note', 'number'], name='unique_revision_number_per_note'),
+        ]
+        indexes = [
+            # pruning by age
+            models.Index(fields=['created_at'], name='revision_created_idx'),
+        ]
+        ordering = ['-number']
+
+
+class Job(TimeStampedModel):
+    """
+    A piece of slow work run outside the request cycle by ``manage.py run_jobs``.
+
+    ``params`` is what the handler for ``kind`` needs, ``progress`` out of
+    ``total`` how far it has got, and ``result`` what it produced. A failed
+    attempt goes back to the queue until ``run_after``; see notes.jobs.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUSES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (SUCCEEDED, 'Succeeded'), (FAILED, 'Failed')]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # None for jobs queued from the command line
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.CASCADE, related_name='jobs')
+    kind = models.CharField(max_length=50)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    # the worker running the job, and when it last reported; see notes.jobs.claim
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # workers polling for due jobs
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+            models.Index(fields=['user', '-created_at'], name='job_user_created_idx'),
+        ]
+        ordering = ['-created_at']
+
+    def __str__(self) -> str:
+        return f'{self.kind} ({self.status})'
@@ -0,0 +1,150 @@
+import base64
+import datetime
+import uuid
+
+from django.db.models import Q
+from django.utils.encoding import force_str
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class NoteCursorPagination(BasePagination):
+    """
+    Keyset pagination over notes ordered by (-updated_at, -id).
+
+    The cursor encodes the (updated_at, id) of the last row of the previous page,
+    so every page is a single index range scan no matter how deep the client
+    pages. Editing a note moves it to the top of the list without shifting the
+    remaining rows, so pages never repeat or skip unchanged notes.
+    """
+    cursor_query_param = 'cursor'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = ('-updated_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_query(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() for async views, fetching the page with async iteration."""
+        return self.set_page([row async for row in self.page_query(queryset, request)])
+
+    def page_query(self, queryset, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            updated_at, pk = position
+            # The redundant updated_at__lte bound gives the database a range to
+            # seek to on the (user, -updated_at, -id) index.
+            queryset = queryset.filter(
+                Q(updated_at__lte=updated_at),
+                Q(updated_at__lt=updated_at) | Q(id__lt=pk),
+            )
+        # Fetch one extra row to find out whether another page follows.
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            decoded = force_str(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            timestamp, pk = decoded.split('|', 1)
+            updated_at = datetime.datetime.fromisoformat(timestamp)
+            return updated_at, uuid.UUID(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row):
+        # Rows are model instances, or dicts when the view paginates a values() queryset.
+        if isinstance(row, dict):
+            updated_at, pk = row['updated_at'], row['id']
+        else:
+            updated_at, pk = row.updated_at, row.pk
+        raw = f'{updated_at.isoformat()}|{pk}'
+        encoded = force_str(base64.urlsafe_b64encode(raw.encode('ascii')))
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                    'format': 'uri',
+                    'example': 'http://api.example.org/api/notes/?cursor=cD00ODY%3D',
+                },
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Number of results to return per page (max {self.max_page_size}).',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+
+class NoteSearchPagination(LimitOffsetPagination):
+    """Limit/offset paging for ranked search results, which have no stable keyset."""
+    default_limit = 20
+    max_limit = 100
+
+
+class NoteRevisionPagination(LimitOffsetPagination):
+    """Revisions of one note, newest first."""
+    default_limit = 20
+    max_limit = 100
+
+
+class JobPagination(LimitOffsetPagination):
+    """A user's jobs, newest first."""
+    default_limit = 20
+    max_limit = 100
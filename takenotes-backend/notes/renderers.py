@@ -0,0 +1,33 @@
+"""
+A JSON renderer that uses orjson when it is installed.
+
+orjson encodes the dicts and lists DRF serializers produce several times
+faster than the standard library. It is an optional dependency
+(``pip install orjson``); without it, and for indented output, FastJSONRenderer
+is DRF's JSONRenderer. Datetimes and anything else orjson does not handle
+natively go through DRF's encoder, and U+2028/U+2029 are escaped afterwards as
+JSONRenderer escapes them, so the JSON is the same either way.
+"""
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+LINE_SEPARATOR = '\u2028'.encode()
+PARAGRAPH_SEPARATOR = '\u2029'.encode()
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = orjson.dumps(
+            data,
+            default=self.encoder_class().default,
+            # DRF formats datetimes its own way (milliseconds, "Z")
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )
+        # valid JSON but line terminators in JavaScript, which JSONRenderer escapes
+        return ret.replace(LINE_SEPARATOR, b'\\u2028').replace(PARAGRAPH_SEPARATOR, b'\\u2029')
@@ -0,0 +1,190 @@
+"""
+Note revision history, stored as compressed deltas.
+
+Every save that changes a note's title or content records a revision. A
+revision keeps the title and either the whole content (a keyframe) or the one
+splice ``(start, end, text)`` that turns the previous revision's content into
+its own, zlib-compressed. Revision 1 and every ``NOTE_REVISION_KEYFRAME_INTERVAL``th
+after it is a keyframe, so rebuilding any revision reads at most that many
+rows in one query: the nearest keyframe at or before it and the deltas since.
+
+A save within ``NOTE_REVISION_COALESCE_SECONDS`` of the latest revision's
+creation rewrites that revision instead of adding one, so autosaves every few
+seconds make one revision per window. ``prune_note_revisions`` drops revisions
+older than ``NOTE_REVISION_RETENTION_DAYS`` or beyond the newest
+``NOTE_REVISION_LIMIT`` of a note, turning the oldest kept one into a keyframe.
+"""
+import datetime
+import struct
+import zlib
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .models import NoteRevision
+
+# a delta's start and end offsets, ahead of the replacement text
+SPLICE = struct.Struct('>II')
+
+
+def keyframe_interval():
+    return getattr(settings, 'NOTE_REVISION_KEYFRAME_INTERVAL', 20)
+
+
+def coalesce_window():
+    return datetime.timedelta(seconds=getattr(settings, 'NOTE_REVISION_COALESCE_SECONDS', 60))
+
+
+def retention():
+    return datetime.timedelta(days=getattr(settings, 'NOTE_REVISION_RETENTION_DAYS', 90))
+
+
+def revision_limit():
+    return getattr(settings, 'NOTE_REVISION_LIMIT', 100)
+
+
+def common_prefix(a, b):
+    # binary search with C-level comparisons; a character loop is far slower on large notes
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a.startswith(b[lo:mid], lo):
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def common_suffix(a, b, limit):
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a.endswith(b[len(b) - mid:len(b) - lo], 0, len(a) - lo):
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def diff(old, new):
+    """The single splice ``(start, end, text)`` that turns ``old`` into ``new``."""
+    prefix = common_prefix(old, new)
+    suffix = common_suffix(old, new, min(len(old), len(new)) - prefix)
+    return prefix, len(old) - suffix, new[prefix:len(new) - suffix]
+
+
+def encode(content, previous):
+    if previous is None:
+        return zlib.compress(content.encode())
+    start, end, text = diff(previous, content)
+    return zlib.compress(SPLICE.pack(start, end) + text.encode())
+
+
+def decode(revision, previous):
+    """Content of ``revision``, given the content of the one before unless it is a keyframe."""
+    raw = zlib.decompress(revision.data)
+    if revision.keyframe:
+        return raw.decode()
+    start, end = SPLICE.unpack_from(raw)
+    return previous[:start] + raw[SPLICE.size:].decode() + previous[end:]
+
+
+def rebuild(chain):
+    """Content of ``chain[0]``, from revisions ordered newest first back to a keyframe."""
+    depth = next(index for index, revision in enumerate(chain) if revision.keyframe)
+    content = None
+    for revision in reversed(chain[:depth + 1]):
+        content = decode(revision, content)
+    return content
+
+
+def recent_chains(note_ids, depth):
+    """Each note's ``depth`` newest revisions, newest first, in one query."""
+    revisions = (
+        NoteRevision.objects.filter(note_id__in=note_ids)
+        .annotate(rank=Window(RowNumber(), partition_by=F('note_id'), order_by=F('number').desc()))
+        .filter(rank__lte=depth)
+        .order_by('note_id', '-number')
+    )
+    chains = defaultdict(list)
+    for revision in revisions:
+        chains[revision.note_id].append(revision)
+    return chains
+
+
+def write(revision, note, previous, now):
+    revision.title = note.title
+    revision.size = len(note.content)
+    # bulk_update skips auto_now
+    revision.updated_at = now
+    revision.keyframe = previous is None or (revision.number - 1) % keyframe_interval() == 0
+    revision.data = encode(note.content, None if revision.keyframe else previous)
+    return revision
+
+
+def record(notes, created=False):
+    """Record the saved title and content of ``notes`` in their histories."""
+    now = timezone.now()
+    chains = {} if created else recent_chains([note.pk for note in notes], keyframe_interval())
+    added, rewritten = [], []
+    for note in notes:
+        chain = chains.get(note.pk)
+        if not chain:
+            added.append(write(NoteRevision(note=note, number=1), note, None, now))
+            continue
+        latest = chain[0]
+        if latest.created_at > now - coalesce_window():
+            # the same editing session: fold this save into the latest revision
+            previous = None if latest.keyframe else rebuild(chain[1:])
+            if (decode(latest, previous), latest.title) != (note.content, note.title):
+                rewritten.append(write(latest, note, previous, now))
+        else:
+            current = rebuild(chain)
+            if (current, latest.title) != (note.content, note.title):
+                added.append(write(NoteRevision(note=note, number=latest.number + 1), note, current, now))
+    NoteRevision.objects.bulk_create(added)
+    NoteRevision.objects.bulk_update(rewritten, ['title', 'size', 'updated_at', 'keyframe', 'data'])
+
+
+def load(note_id, number):
+    """Revision ``number`` of a note with its ``content`` rebuilt, or None."""
+    chain = list(
+        NoteRevision.objects.filter(note_id=note_id, number__lte=number).order_by('-number')[:keyframe_interval()]
+    )
+    if not chain or chain[0].number != number:
+        return None
+    revision = chain[0]
+    revision.content = rebuild(chain)
+    return revision
+
+
+def prune(now=None):
+    """Delete revisions past the retention window or the per-note limit; returns how many."""
+    cutoff = (now or timezone.now()) - retention()
+    limit = revision_limit()
+    stale = NoteRevision.objects.filter(created_at__lt=cutoff).order_by().values_list('note_id', flat=True).distinct()
+    crowded = (
+        NoteRevision.objects.order_by().values('note_id')
+        .annotate(count=Count('id')).filter(count__gt=limit).values_list('note_id', flat=True)
+    )
+    return sum(prune_note(note_id, cutoff, limit) for note_id in {*stale, *crowded})
+
+
+def prune_note(note_id, cutoff, limit):
+    revisions = NoteRevision.objects.filter(note_id=note_id)
+    with transaction.atomic():
+        bounds = revisions.aggregate(latest=Max('number'), first_recent=Min('number', filter=Q(created_at__gte=cutoff)))
+        # the latest revision is always kept, however old
+        oldest_kept = max(bounds['first_recent'] or bounds['latest'], bounds['latest'] - limit + 1)
+        chain = list(revisions.filter(number__lte=oldest_kept).order_by('-number')[:keyframe_interval()])
+        kept = chain[0]
+        if not kept.keyframe:
+            kept.data = encode(rebuild(chain), None)
+            kept.keyframe = True
+            kept.save(update_fields=['data', 'keyframe'])
+        deleted, _ = revisions.filter(number__lt=oldest_kept).delete()
+    return deleted
@@ -0,0 +1,223 @@
+"""
+Full-text search over note titles and contents.
+
+The index lives in the same database as the notes. Which backend is used depends
+on the database engine (or on the ``NOTES_SEARCH_BACKEND`` setting):
+
+- SQLite: an FTS5 virtual table, kept in sync from the Note save/delete signals.
+- PostgreSQL: a generated ``search_vector`` tsvector column with a GIN index,
+  which the database keeps up to date on every write.
+- Anything else: unranked ``icontains`` matching, so the endpoint still works.
+
+The table and column are created by migration ``0003_note_search_index``.
+"""
+import uuid
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .models import Note
+
+FTS_TABLE = 'notes_note_fts'
+
+
+class SearchBackend:
+    """Interface for note search indexes."""
+
+    def search(self, user, query, limit, offset):
+        """Return the ids of ``user``'s notes matching ``query``, best match first."""
+        raise NotImplementedError
+
+    def count(self, user, query):
+        raise NotImplementedError
+
+    def index_note(self, note):
+        """Add or refresh ``note`` in the index."""
+
+    def index_notes(self, notes):
+        """Add or refresh several notes, e.g. after a bulk_create that sent no signals."""
+        for note in notes:
+            self.index_note(note)
+
+    def remove_note(self, note_id):
+        """Drop the note with ``note_id`` from the index."""
+
+    def remove_notes(self, note_ids):
+        """Drop several notes, e.g. after a raw delete that sent no signals."""
+        for note_id in note_ids:
+            self.remove_note(note_id)
+
+    def rebuild(self):
+        """Re-index every note from scratch."""
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    """
+    FTS5 table with ``title`` and ``content`` as searchable columns.
+
+    ``note_id`` and ``user_id`` are indexed too, so the per-user filter and the
+    deletes by note are index lookups rather than scans. Queries are confined to
+    the text columns with a column filter, and bm25 gives the id columns no weight.
+    """
+    rank = f'bm25({FTS_TABLE}, 10.0, 1.0, 0.0, 0.0)'
+
+    @staticmethod
+    def quote(term):
+        return '"' + term.replace('"', '""') + '"'
+
+    def match_expression(self, user, query):
+        terms = query.split()
+        if not terms:
+            return None
+        phrases = [self.quote(term) for term in terms]
+        # search-as-you-type: the last term also matches as a prefix
+        phrases[-1] += ' *'
+        return f'user_id:{self.quote(user.pk.hex)} AND {{title content}}: ({" AND ".join(phrases)})'
+
+    def search(self, user, query, limit, offset):
+        expression = self.match_expression(user, query)
+        if expression is None:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT note_id FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY {self.rank} LIMIT %s OFFSET %s',
+                [expression, limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def count(self, user, query):
+        expression = self.match_expression(user, query)
+        if expression is None:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [expression])
+            return cursor.fetchone()[0]
+
+    def index_note(self, note):
+        with connection.cursor() as cursor:
+            self._delete(cursor, note.pk.hex)
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (title, content, note_id, user_id) VALUES (%s, %s, %s, %s)',
+                [note.title, note.content, note.pk.hex, note.user_id.hex],
+            )
+
+    def index_notes(self, notes):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+                [[f'note_id:{self.quote(note.pk.hex)}'] for note in notes],
+            )
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (title, content, note_id, user_id) VALUES (%s, %s, %s, %s)',
+                [[note.title, note.content, note.pk.hex, note.user_id.hex] for note in notes],
+            )
+
+    def remove_note(self, note_id):
+        with connection.cursor() as cursor:
+            self._delete(cursor, note_id.hex)
+
+    def remove_notes(self, note_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+                [[f'note_id:{self.quote(note_id.hex)}'] for note_id in note_ids],
+            )
+
+    def _delete(self, cursor, note_hex):
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [f'note_id:{self.quote(note_hex)}'])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (title, content, note_id, user_id) '
+                f'SELECT title, content, id, user_id FROM {Note._meta.db_table}'
+            )
+
+
+class PostgresSearchBackend(SearchBackend):
+    """Ranked search on the generated ``search_vector`` column; no sync needed."""
+    config = 'english'
+
+    def search(self, user, query, limit, offset):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT id FROM {Note._meta.db_table}, websearch_to_tsquery(%s, %s) query '
+                'WHERE user_id = %s AND search_vector @@ query '
+                'ORDER BY ts_rank_cd(search_vector, query) DESC, updated_at DESC LIMIT %s OFFSET %s',
+                [self.config, query, user.pk, limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def count(self, user, query):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT count(*) FROM {Note._meta.db_table} '
+                'WHERE user_id = %s AND search_vector @@ websearch_to_tsquery(%s, %s)',
+                [user.pk, self.config, query],
+            )
+            return cursor.fetchone()[0]
+
+
+class SubstringSearchBackend(SearchBackend):
+    """Unindexed fallback for databases without a full-text engine."""
+
+    def queryset(self, user, query):
+        qs = Note.objects.filter(user=user)
+        for term in query.split():
+            qs = qs.filter(Q(title__icontains=term) | Q(content__icontains=term))
+        return qs.order_by('-updated_at', '-id')
+
+    def search(self, user, query, limit, offset):
+        return list(self.queryset(user, query).values_list('id', flat=True)[offset:offset + limit])
+
+    def count(self, user, query):
+        return self.queryset(user, query).count()
+
+
+BACKENDS_BY_VENDOR = {
+    'sqlite': SQLiteFTS5Backend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    path = getattr(settings, 'NOTES_SEARCH_BACKEND', None)
+    backend_class = import_string(path) if path else BACKENDS_BY_VENDOR.get(connection.vendor, SubstringSearchBackend)
+    return backend_class()
+
+
+class SearchResults:
+    """
+    Lazy, sliceable view of a search, so DRF's LimitOffsetPagination can page it
+    like a queryset: only the requested slice of ids is fetched from the index.
+    """
+
+    def __init__(self, user, query, queryset=None):
+        self.user = user
+        self.query = query
+        # deliberately not filtered by user: SQLite would then walk the user's
+        # index instead of fetching the page by primary key
+        self.queryset = Note.objects.select_related('category') if queryset is None else queryset
+        self.backend = get_search_backend()
+
+    def count(self):
+        return self.backend.count(self.user, self.query)
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice) or item.step is not None:
+            raise TypeError('SearchResults only supports simple slicing')
+        offset = item.start or 0
+        # the SQLite index hands back hex strings, PostgreSQL hands back UUIDs
+        ids = [pk if isinstance(pk, uuid.UUID) else uuid.UUID(pk)
+               for pk in self.backend.search(self.user, self.query, item.stop - offset, offset)]
+        notes = {
+            note.pk: note
+            for note in self.queryset.filter(pk__in=ids).order_by()
+            if note.user_id == self.user.pk
+        }
+        return [notes[pk] for pk in ids if pk in notes]
@@ -1,23 +1,81 @@
 from django.utils import timezone
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 import datetime
 
-from .models import Category, Note
+from .bulk import MAX_BATCH_SIZE, MAX_IMPORT_SIZE
+from .edits import MAX_EDITS, utf16_length
+from .models import Category, Job, Note, NoteRevision
 
 
+def requested_fields(request, available):
+    """
+    The fields a read asks for with ``?fields=a,b``, in the order of
+    ``available``, or None when it wants them all. Unknown names are a 400.
+    """
+    raw = request.query_params.get("fields") if request.method in SAFE_METHODS else None
+    if not raw:
+        return None
+    names = {name.strip() for name in raw.split(",")} - {""}
+    unknown = names - set(available)
+    if unknown:
+        raise serializers.ValidationError({"fields": [f"Unknown fields: {', '.join(sorted(unknown))}."]})
+    return [name for name in available if name in names]
 
 
-class CategorySerializer(serializers.ModelSerializer):
-    note_count = serializers.SerializerMethodField()
+# named field sets a list can ask for with ``?view=``; "cards" is what a note
+# card shows, the stored preview in place of the full content
+LIST_VIEWS = {
+    "full": lambda available: None,
+    "cards": lambda available: [name for name in available if name != "content"],
+}
+
+
+def list_fields(request, available):
+    """
+    The fields a list renders: an explicit ``?fields=`` selection, else the
+    ``?view=`` field set, else all of them. Unknown views are a 400.
+    """
+    fields = requested_fields(request, available)
+    if fields is not None:
+        return fields
+    view = request.query_params.get("view") or "full"
+    if view not in LIST_VIEWS:
+        raise serializers.ValidationError({"view": [f"Unknown view: {view}. Expected one of: {', '.join(LIST_VIEWS)}."]})
+    return LIST_VIEWS[view](available)
+
 
+def select_fields(data, fields):
+    """``data`` cut down to ``fields``; None keeps everything."""
+    if fields is None:
+        return data
+    return {name: data[name] for name in fields if name in data}
+
+
+class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
+        # note_count is the stored counter, see notes.counters
         fields = ["id", "name", "color", "created_at", "updated_at", "note_count"]
 
-    def get_note_count(self, obj):
-        user = self.context["request"].user
-        # count only this user's notes in this category
-        return obj.notes.filter(user=user).count()
+
+def save_changes(note, validated_data):
+    """
+    Apply ``validated_data`` to ``note``, writing only the columns that changed.
+
+    Returns the changed field names. When nothing changed nothing is written,
+    so ``updated_at`` (and with it the note's ETag) stays as it was.
+    """
+    changed = []
+    for field, value in validated_data.items():
+        model_field = note._meta.get_field(field)
+        new = value.pk if model_field.is_relation and value is not None else value
+        if getattr(note, model_field.attname) != new:
+            setattr(note, field, value)
+            changed.append(field)
+    if changed:
+        note.save(update_fields=[*changed, "updated_at"])
+    return changed
 
 
 class NoteSerializer(serializers.ModelSerializer):
@@ -32,6 +90,7 @@ class NoteSerializer(serializers.ModelSerializer):
             "id",
             "title",
             "content",
+            "preview",
             "category",
             "category_name",
             "category_color",
@@ -42,6 +101,11 @@ class NoteSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ["created_at", "updated_at", "last_edited", "last_edited_label"]
 
+    def update(self, instance, validated_data):
+        # autosaves mostly resend what is stored; those write nothing
+        save_changes(instance, validated_data)
+        return instance
+
     def get_last_edited_label(self, obj):
         # "Today", "Yesterday", or "Mon DD"
         user_tz = timezone.get_current_timezone()
@@ -51,4 +115,239 @@ class NoteSerializer(serializers.ModelSerializer):
             return "Today"
         if updated.date() == (now.date() - datetime.timedelta(days=1)):
             return "Yesterday"
-        return updated.strftime("%b %d")
\ No newline at end of file
+        return updated.strftime("%b %d")
+
+class NoteValuesSerializer(serializers.BaseSerializer):
+    """
+    Read-only fast path for the notes list.
+
+    Renders rows of ``Note.objects.values(*NoteValuesSerializer.values)`` to the
+    same JSON NoteSerializer produces for those notes, without going through
+    DRF's per-field machinery. The timezone and the dates for "Today" and
+    "Yesterday" are resolved once per serializer rather than once per row.
+
+    With ``fields`` (see requested_fields) only those keys are rendered, and
+    ``columns(fields)`` names the only columns they need, so a list without
+    ``content`` (such as ``?view=cards``) never reads it from the database;
+    this is the values() counterpart of ``.defer("content")``.
+    """
+    values = (
+        "id",
+        "title",
+        "content",
+        "preview",
+        "category_id",
+        "category__name",
+        "category__color",
+        "created_at",
+        "updated_at",
+    )
+    # the cursor pagination keys on these, so they are always fetched
+    always = ("id", "updated_at")
+    field_columns = {
+        "id": ("id",),
+        "title": ("title",),
+        "content": ("content",),
+        "preview": ("preview",),
+        "category": ("category_id",),
+        "category_name": ("category_id", "category__name"),
+        "category_color": ("category_id", "category__color"),
+        "created_at": ("created_at",),
+        "updated_at": ("updated_at",),
+        "last_edited": ("updated_at",),
+        "last_edited_label": ("updated_at",),
+    }
+
+    @classmethod
+    def columns(cls, fields=None):
+        if fields is None:
+            return cls.values
+        needed = {*cls.always, *(column for field in fields for column in cls.field_columns[field])}
+        return tuple(column for column in cls.values if column in needed)
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.selected = fields
+        self.tz = timezone.get_current_timezone()
+        self.today = timezone.now().astimezone(self.tz).date()
+        self.yesterday = self.today - datetime.timedelta(days=1)
+
+    def format_datetime(self, value):
+        # what serializers.DateTimeField renders with the default ISO 8601 format
+        value = value.isoformat()
+        if value.endswith("+00:00"):
+            value = value[:-6] + "Z"
+        return value
+
+    def to_representation(self, row):
+        created = row["created_at"].astimezone(self.tz) if "created_at" in row else None
+        updated = row["updated_at"].astimezone(self.tz)
+        updated_iso = self.format_datetime(updated)
+        day = updated.date()
+        if day == self.today:
+            label = "Today"
+        elif day == self.yesterday:
+            label = "Yesterday"
+        else:
+            label = updated.strftime("%b %d")
+
+        data = {
+            "id": str(row["id"]),
+            "title": row.get("title"),
+            "content": row.get("content"),
+            "preview": row.get("preview"),
+            "category": row.get("category_id"),
+        }
+        # NoteSerializer leaves the category fields out when there is no category
+        if data["category"] is not None:
+            data["category_name"] = row.get("category__name")
+            data["category_color"] = row.get("category__color")
+        data["created_at"] = self.format_datetime(created) if created else None
+        data["updated_at"] = updated_iso
+        data["last_edited"] = updated_iso
+        data["last_edited_label"] = label
+        return select_fields(data, self.selected)
+
+
+class BatchCategoryMixin:
+    """
+    Resolves a category id from the ``categories`` dict the view loads once per
+    batch, so validating a batch issues no per-item queries.
+    """
+
+    def validate_category(self, value):
+        if value is None:
+            return None
+        try:
+            return self.context["categories"][value]
+        except KeyError:
+            raise serializers.ValidationError("Category not found.")
+
+
+class NoteBatchCreateSerializer(BatchCategoryMixin, serializers.ModelSerializer):
+    """One note of a batch write."""
+    category = serializers.UUIDField(required=False, allow_null=True)
+
+    class Meta:
+        model = Note
+        fields = ["title", "content", "category"]
+
+
+class NoteBatchUpdateSerializer(NoteBatchCreateSerializer):
+    """Edits to one existing note, picked from the ``notes`` the view loaded for the batch."""
+    id = serializers.UUIDField()
+
+    class Meta(NoteBatchCreateSerializer.Meta):
+        fields = ["id", *NoteBatchCreateSerializer.Meta.fields]
+
+    def validate_id(self, value):
+        if value not in self.context["notes"]:
+            raise serializers.ValidationError("Note not found.")
+        return value
+
+
+class NoteBatchDeleteSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.UUIDField(), allow_empty=False, max_length=MAX_BATCH_SIZE)
+
+    def validate_ids(self, value):
+        # report unknown notes per position, the way ListField reports bad items
+        errors = {
+            index: ["Note not found."]
+            for index, pk in enumerate(value)
+            if pk not in self.context["note_ids"]
+        }
+        if errors:
+            raise serializers.ValidationError(errors)
+        return value
+
+
+class NoteBatchMoveSerializer(BatchCategoryMixin, NoteBatchDeleteSerializer):
+    category = serializers.UUIDField(allow_null=True)
+
+
+class ContentEditSerializer(serializers.Serializer):
+    """Replace ``content[start:end]`` with ``text``; offsets in UTF-16 code units, see notes.edits."""
+    start = serializers.IntegerField(min_value=0)
+    end = serializers.IntegerField(min_value=0)
+    text = serializers.CharField(allow_blank=True, trim_whitespace=False, default="")
+
+    def validate(self, attrs):
+        if attrs["end"] < attrs["start"]:
+            raise serializers.ValidationError("end must not be before start.")
+        return attrs
+
+
+class NoteContentEditsSerializer(serializers.Serializer):
+    edits = ContentEditSerializer(many=True, allow_empty=False, max_length=MAX_EDITS)
+
+    def validate_edits(self, value):
+        for index, (previous, edit) in enumerate(zip(value, value[1:]), start=1):
+            if edit["start"] < previous["end"]:
+                raise serializers.ValidationError({index: ["Edits must be in order and must not overlap."]})
+        return value
+
+
+class NoteContentVersionSerializer(serializers.ModelSerializer):
+    """What a content edit answers with: the new version, not the whole note."""
+    content_length = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Note
+        fields = ["id", "updated_at", "content_length"]
+
+    def get_content_length(self, obj) -> int:
+        return utf16_length(obj.content)
+
+
+class NoteRevisionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = NoteRevision
+        fields = ["number", "title", "size", "created_at", "updated_at"]
+
+
+class NoteRevisionDetailSerializer(NoteRevisionSerializer):
+    # rebuilt from the revision's keyframe and deltas by notes.revisions.load
+    content = serializers.CharField(read_only=True)
+
+    class Meta(NoteRevisionSerializer.Meta):
+        fields = [*NoteRevisionSerializer.Meta.fields, "content"]
+
+
+class JobSerializer(serializers.ModelSerializer):
+    # params (an import's notes) can be large and are left out
+    class Meta:
+        model = Job
+        fields = [
+            "id", "kind", "status", "progress", "total", "result", "error", "attempts", "max_attempts",
+            "run_after", "created_at", "updated_at", "finished_at",
+        ]
+        read_only_fields = fields
+
+
+class JobCreateSerializer(serializers.Serializer):
+    """
+    What to queue: an ``export`` of the user's notes (the options of GET
+    /api/notes/export/), an ``import`` of ``notes`` shaped like bulk-create
+    items, or a ``reindex`` of the search index (staff only).
+    """
+    kind = serializers.ChoiceField(choices=["export", "import", "reindex"])
+    # the formats of notes.exports
+    output = serializers.ChoiceField(choices=["ndjson", "json"], default="ndjson")
+    gzip = serializers.BooleanField(default=False)
+    category = serializers.UUIDField(required=False, allow_null=True)
+    # each item is validated by the job, which reports bad ones without stopping
+    notes = serializers.ListField(child=serializers.DictField(), required=False, allow_empty=False, max_length=MAX_IMPORT_SIZE)
+
+    def validate(self, attrs):
+        kind = attrs["kind"]
+        if kind == "import" and "notes" not in attrs:
+            raise serializers.ValidationError({"notes": ["This field is required."]})
+        if kind == "export":
+            params = {"output": attrs["output"], "gzip": attrs["gzip"]}
+            if attrs.get("category"):
+                params["category"] = str(attrs["category"])
+        elif kind == "import":
+            params = {"notes": attrs["notes"]}
+        else:
+            params = {}
+        return {"kind": kind, "params": params}
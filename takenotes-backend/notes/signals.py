@@ -0,0 +1,119 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from . import counters, events, revisions
+from .caching import invalidate_categories, invalidate_category_list
+from .models import Category, Note, NoteTombstone
+from .search import get_search_backend
+
+# a save that writes none of these leaves the search index and the history as they are
+TEXT_FIELDS = {'title', 'content'}
+
+# category_id as loaded, so a save can tell whether the note changed category
+LOADED_CATEGORY = '_loaded_category_id'
+
+CATEGORY_FIELDS = {'category', 'category_id'}
+
+
+@receiver(post_save, sender=Note)
+def index_note(sender, instance, raw=False, update_fields=None, **kwargs):
+    # fixtures (raw saves) are indexed by rebuild_search_index instead
+    if raw or (update_fields is not None and not update_fields & TEXT_FIELDS):
+        return
+    get_search_backend().index_note(instance)
+
+
+@receiver(post_delete, sender=Note)
+def unindex_note(sender, instance, **kwargs):
+    get_search_backend().remove_note(instance.pk)
+
+
+@receiver(post_delete, sender=Note)
+def record_tombstone(sender, instance, origin=None, **kwargs):
+    # notes removed because their user is being deleted have nobody left to sync
+    origin_model = getattr(origin, 'model', type(origin))
+    if origin_model is get_user_model():
+        return
+    NoteTombstone.objects.create(note_id=instance.pk, user_id=instance.user_id)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    # a rename or delete can also change which category is the default
+    invalidate_categories(instance.user_id)
+
+
+@receiver(post_init, sender=Note)
+def remember_category(sender, instance, **kwargs):
+    # read __dict__ so a deferred category_id is not fetched just for this
+    setattr(instance, LOADED_CATEGORY, instance.__dict__.get('category_id', LOADED_CATEGORY))
+
+
+def writes_category(instance, created, update_fields):
+    return created or update_fields is None or bool(update_fields & CATEGORY_FIELDS)
+
+
+@receiver(pre_save, sender=Note)
+def load_category(sender, instance, raw=False, update_fields=None, **kwargs):
+    # a note loaded without its category_id looks it up before moving it
+    if raw or not writes_category(instance, instance._state.adding, update_fields):
+        return
+    if getattr(instance, LOADED_CATEGORY, LOADED_CATEGORY) is LOADED_CATEGORY:
+        stored = Note.objects.filter(pk=instance.pk).values_list('category_id', flat=True)
+        setattr(instance, LOADED_CATEGORY, stored.first())
+
+
+@receiver(post_save, sender=Note)
+def note_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # note counts only change when a note enters or leaves a category; fixtures
+    # carry their categories' counts, so raw saves leave the counters alone
+    if not raw and writes_category(instance, created, update_fields):
+        old = None if created else getattr(instance, LOADED_CATEGORY)
+        if old != instance.category_id:
+            counters.adjust(instance.user_id, counters.moves([(old, instance.category_id)]))
+            invalidate_category_list(instance.user_id)
+        setattr(instance, LOADED_CATEGORY, instance.category_id)
+
+
+@receiver(post_delete, sender=Note)
+def note_deleted(sender, instance, origin=None, **kwargs):
+    # a deleted user's categories go with the notes; batches use notes.bulk
+    origin_model = getattr(origin, 'model', type(origin))
+    if instance.category_id is not None and origin_model is not get_user_model():
+        counters.adjust(instance.user_id, {instance.category_id: -1})
+        invalidate_category_list(instance.user_id)
+
+
+@receiver(post_save, sender=Note)
+def publish_note_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        events.publish_on_commit(instance.user_id, [events.note_event('created' if created else 'updated', instance)])
+
+
+@receiver(post_delete, sender=Note)
+def publish_note_deleted(sender, instance, origin=None, **kwargs):
+    origin_model = getattr(origin, 'model', type(origin))
+    if origin_model is not get_user_model():
+        events.publish_on_commit(instance.user_id, [events.note_deleted(instance.pk)])
+
+
+@receiver(post_save, sender=Category)
+def publish_category_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        events.publish_on_commit(instance.user_id, [events.category_event('created' if created else 'updated', instance)])
+
+
+@receiver(post_delete, sender=Category)
+def publish_category_deleted(sender, instance, origin=None, **kwargs):
+    origin_model = getattr(origin, 'model', type(origin))
+    if origin_model is not get_user_model():
+        events.publish_on_commit(instance.user_id, [events.category_event('deleted', instance)])
+
+
+@receiver(post_save, sender=Note)
+def record_revision(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and not update_fields & TEXT_FIELDS):
+        return
+    revisions.record([instance], created=created)
@@ -0,0 +1,165 @@
+"""
+Conditional requests and delta sync support for notes.
+
+A list response is identified by the newest ``updated_at`` among all of the
+user's notes, the newest tombstone, and the version of the user's categories
+(their newest ``updated_at`` and how many there are), so polling clients can
+revalidate with ``If-None-Match``/``If-Modified-Since`` and get a 304 without
+the server serializing anything. The notes and tombstones are one index lookup
+each, however many notes there are, and a user has few categories. Every
+change a list can show moves one of them: writes and moves set ``updated_at``,
+deletes leave a tombstone, and a category rename, recolour or delete changes
+the category version. The newest note is taken over all notes rather than the
+listed ones, so a note moved out of a filtered category changes that list's
+ETag too.
+
+``updated_since`` narrows the list to notes changed after a timestamp, or
+whose category was, and reports deletions from the tombstone table. Notes of a
+deleted category are uncategorized afterwards without changing; clients learn
+of the deletion from the category list.
+
+A single note is versioned by its ``updated_at``: reads return it as the
+``ETag``, and writes sent with ``If-Match`` fail with 412 once someone else has
+changed the note, instead of overwriting their edit.
+"""
+import datetime
+import hashlib
+
+from django.conf import settings
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date, parse_etags
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from .models import Category, Note, NoteTombstone
+
+# Changes committed out of order can carry an updated_at slightly older than
+# the server_time a client already saw, so deltas re-send a short overlap.
+SYNC_OVERLAP = datetime.timedelta(seconds=5)
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The note was changed since it was read; fetch it again and reapply the edit.'
+    default_code = 'precondition_failed'
+
+
+class PreconditionRequired(APIException):
+    status_code = status.HTTP_428_PRECONDITION_REQUIRED
+    default_detail = 'Send the ETag of the version the request is based on in If-Match.'
+    default_code = 'precondition_required'
+
+
+def tombstone_retention():
+    return datetime.timedelta(days=getattr(settings, 'NOTE_TOMBSTONE_RETENTION_DAYS', 30))
+
+
+def parse_since(value):
+    """Parse the ``updated_since`` query parameter, or return None if absent."""
+    if value is None:
+        return None
+    parsed = parse_datetime(value.replace(' ', '+'))
+    if parsed is None:
+        raise ValidationError({'updated_since': 'Enter a valid ISO 8601 timestamp.'})
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def is_beyond_retention(since):
+    """True if tombstones older than ``since`` may already have been pruned."""
+    return since < timezone.now() - tombstone_retention()
+
+
+def latest_notes(user):
+    # the newest note by the (user, -updated_at, -id) index, a single row read
+    return Note.objects.filter(user=user).order_by('-updated_at', '-id').values_list('updated_at', flat=True)[:1]
+
+
+def latest_tombstone(user):
+    return NoteTombstone.objects.filter(user=user).order_by('-deleted_at').values_list('deleted_at', flat=True)[:1]
+
+
+def category_version():
+    # a delete lowers the count, any other write moves the newest updated_at
+    return {'latest': Max('updated_at'), 'total': Count('id')}
+
+
+def list_validators(user, params):
+    """Return ``(etag, last_modified)`` for a notes list without loading any notes."""
+    return validators(
+        latest_notes(user).first(),
+        latest_tombstone(user).first(),
+        Category.objects.filter(user=user).aggregate(**category_version()),
+        user,
+        params,
+    )
+
+
+async def alist_validators(user, params):
+    categories = await Category.objects.filter(user=user).aaggregate(**category_version())
+    return validators(await latest_notes(user).afirst(), await latest_tombstone(user).afirst(), categories, user, params)
+
+
+def validators(latest, deleted, categories, user, params):
+    stamps = [stamp for stamp in (latest, deleted, categories['latest']) if stamp is not None]
+    last_modified = max(stamps) if stamps else None
+
+    fingerprint = '|'.join([
+        str(user.pk),
+        str(latest),
+        str(deleted),
+        str(categories['latest']),
+        str(categories['total']),
+        '&'.join(f'{key}={value}' for key, value in sorted(params.items())),
+    ])
+    etag = '"%s"' % hashlib.md5(fingerprint.encode(), usedforsecurity=False).hexdigest()
+    return etag, last_modified
+
+
+def changed_since(queryset, since):
+    """Notes of ``queryset`` changed after ``since``, or shown with a category that was."""
+    cutoff = since - SYNC_OVERLAP
+    return queryset.filter(Q(updated_at__gt=cutoff) | Q(category__updated_at__gt=cutoff))
+
+
+def set_validators(response, etag, last_modified):
+    """Mark a list response for revalidation by the client on every use."""
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Authorization'])
+
+
+def note_etag(updated_at):
+    """Strong ETag of one note from its updated_at, which every write changes, in microseconds."""
+    return '"%d"' % ((updated_at - EPOCH) // datetime.timedelta(microseconds=1))
+
+
+def check_if_match(request, etag):
+    """Raise PreconditionFailed unless the request has no If-Match or it names ``etag``."""
+    header = request.headers.get('If-Match')
+    if header is None:
+        return
+    # parse_etags turns "*" into ["*"]; weak tags never match, as RFC 9110 requires
+    tags = parse_etags(header)
+    if tags != ['*'] and etag not in tags:
+        raise PreconditionFailed()
+
+
+def tombstones_since(user, since):
+    return NoteTombstone.objects.filter(user=user, deleted_at__gt=since - SYNC_OVERLAP).values_list('note_id', flat=True)
+
+
+def deleted_since(user, since):
+    return [str(pk) for pk in tombstones_since(user, since)]
+
+
+async def adeleted_since(user, since):
+    return [str(pk) async for pk in tombstones_since(user, since)]
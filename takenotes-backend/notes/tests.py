@@ -1,9 +1,60 @@
+import asyncio
+import datetime
+import gzip
+import io
+import json
+import tempfile
+import tracemalloc
+import unittest
+import uuid
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
+from rest_framework.exceptions import ErrorDetail
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase, APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import bulk, counters, events, jobs, revisions, sync
+from config import compression, metrics
+from config.database import database_from_env
+
+from .models import PREVIEW_LENGTH, PREVIEW_LINES, Category, Job, Note, NoteRevision, NoteTombstone, make_preview
+from .renderers import FastJSONRenderer, orjson
+from .serializers import NoteSerializer, NoteValuesSerializer
+
+
+class QueryCountAssertionsMixin:
+    """Helpers for guarding endpoints against N+1 query regressions."""
+
+    def count_queries(self, fn):
+        with CaptureQueriesContext(connection) as ctx:
+            fn()
+        return len(ctx.captured_queries)
 
-from .models import Category, Note
+    def assertConstantQueries(self, grow, request, sizes=(1, 10, 50)):
+        """
+        Call ``grow(n)`` to bring the data set up to ``n`` rows, then ``request()``,
+        for each size, and assert the request issues the same number of queries.
+        """
+        counts = {}
+        for size in sizes:
+            grow(size)
+            counts[size] = self.count_queries(request)
+        self.assertEqual(len(set(counts.values())), 1, f"query count grows with data size: {counts}")
+        return counts[sizes[0]]
 
 
 class NotesApiTest(APITestCase):
@@ -90,12 +141,12 @@ class NotesApiTest(APITestCase):
         # list all
         res = self.client.get(url_list)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertGreaterEqual(len(res.data), 2)
+        self.assertGreaterEqual(len(res.data["results"]), 2)
 
         # filter by category (school)
         res = self.client.get(url_list + f"?category={self.cat_school.id}")
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertTrue(all(str(n["category"]) == str(self.cat_school.id) for n in res.data))
+        self.assertTrue(all(str(n["category"]) == str(self.cat_school.id) for n in res.data["results"]))
 
         # retrieve
         url_detail = reverse('note-detail', kwargs={"pk": note1_id})
@@ -122,5 +173,1542 @@ class NotesApiTest(APITestCase):
         url_list = reverse('note-list')
         res = self.client.get(url_list)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        ids = {n["id"] for n in res.data}
+        ids = {n["id"] for n in res.data["results"]}
         self.assertNotIn(str(other_note.id), ids)
+
+    def test_notes_list_cursor_pagination(self):
+        notes = [Note.objects.create(user=self.user, title=f"n{i}") for i in range(5)]
+        # Give two notes the same timestamp so the id tie-breaker is exercised
+        Note.objects.filter(id__in=[notes[1].id, notes[2].id]).update(updated_at=notes[1].updated_at)
+
+        url_list = reverse('note-list')
+        seen = []
+        res = self.client.get(url_list, {"page_size": 2})
+        while True:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(res.data["results"]), 2)
+            seen.extend(n["id"] for n in res.data["results"])
+            if not res.data["next"]:
+                break
+            res = self.client.get(res.data["next"])
+
+        expected = [str(pk) for pk in Note.objects.filter(user=self.user).order_by("-updated_at", "-id").values_list("id", flat=True)]
+        self.assertEqual(seen, expected)
+
+    def test_notes_list_cursor_is_stable_across_edits(self):
+        for i in range(4):
+            Note.objects.create(user=self.user, title=f"n{i}")
+        url_list = reverse('note-list')
+        first = self.client.get(url_list, {"page_size": 2})
+        first_ids = [n["id"] for n in first.data["results"]]
+
+        # Editing a note from the first page moves it to the top, not into the next page
+        note = Note.objects.get(id=first_ids[1])
+        note.title = "edited"
+        note.save()
+
+        second = self.client.get(first.data["next"])
+        second_ids = [n["id"] for n in second.data["results"]]
+        self.assertEqual(len(second_ids), 2)
+        self.assertFalse(set(first_ids) & set(second_ids))
+        self.assertIsNone(second.data["next"])
+
+    def test_notes_list_invalid_cursor(self):
+        res = self.client.get(reverse('note-list'), {"cursor": "not-a-cursor"})
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class CategoryQueryCountTest(QueryCountAssertionsMixin, APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="counts@example.com", password="pass1234")
+        self.other = get_user_model().objects.create_user(username="counts-other@example.com", password="pass1234")
+        self.client.force_authenticate(user=self.user)
+
+    def grow_categories(self, size):
+        existing = Category.objects.filter(user=self.user).count()
+        for i in range(existing, size):
+            cat = Category.objects.create(user=self.user, name=f"Cat {i}")
+            Note.objects.create(user=self.user, category=cat, title="mine")
+            Note.objects.create(user=self.other, category=cat, title="not mine")
+
+    def test_category_list_query_count_is_constant(self):
+        url = reverse('category-list')
+        queries = self.assertConstantQueries(self.grow_categories, lambda: self.client.get(url))
+        self.assertEqual(queries, 1)
+
+    def test_category_list_counts_only_own_notes(self):
+        self.grow_categories(3)
+        Category.objects.create(user=self.user, name="Empty")
+        res = self.client.get(reverse('category-list'))
+        counts = {c["name"]: c["note_count"] for c in res.data}
+        self.assertEqual(counts, {"Cat 0": 1, "Cat 1": 1, "Cat 2": 1, "Empty": 0})
+
+
+class CategoryCounterTest(APITestCase):
+    """Category.note_count is kept by every note write and recounted by reconcile_category_counts."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="counter@example.com", password="pass1234")
+        self.client.force_authenticate(user=self.user)
+        self.work = Category.objects.create(user=self.user, name="Work")
+        self.home = Category.objects.create(user=self.user, name="Home")
+
+    def assertCounts(self, work, home):
+        self.assertEqual(
+            dict(Category.objects.filter(pk__in=[self.work.pk, self.home.pk]).values_list("name", "note_count")),
+            {"Work": work, "Home": home},
+        )
+
+    def test_single_writes(self):
+        res = self.client.post(reverse('note-list'), {"title": "a", "category": str(self.work.id)}, format='json')
+        note_url = reverse('note-detail', kwargs={"pk": res.data["id"]})
+        self.assertCounts(1, 0)
+        self.client.patch(note_url, {"category": str(self.home.id)}, format='json')
+        self.assertCounts(0, 1)
+        self.client.patch(note_url, {"title": "renamed"}, format='json')
+        self.client.patch(note_url, {"category": None}, format='json')
+        self.assertCounts(0, 0)
+        self.client.patch(note_url, {"category": str(self.work.id)}, format='json')
+        self.client.delete(note_url)
+        self.assertCounts(0, 0)
+
+    def test_deleting_the_user_skips_the_counters(self):
+        Note.objects.create(user=self.user, category=self.work)
+        Note.objects.create(user=self.user, category=self.home)
+        with CaptureQueriesContext(connection) as ctx:
+            self.user.delete()
+        self.assertFalse([q["sql"] for q in ctx.captured_queries if q["sql"].startswith('UPDATE "notes_category"')])
+
+    def test_notes_loaded_without_their_category_and_stale_categories(self):
+        note = Note.objects.create(user=self.user, category=self.work)
+        stale = Category.objects.get(pk=self.home.pk)
+        deferred = Note.objects.only("id", "title").get(pk=note.pk)
+        deferred.category = self.home
+        deferred.save()
+        self.assertCounts(0, 1)
+        # saving a category loaded before the move does not write its old count back
+        stale.color = "#000000"
+        stale.save()
+        self.assertCounts(0, 1)
+
+    def test_bulk_writes(self):
+        res = self.client.post(
+            reverse('note-bulk-create'),
+            [{"title": "a", "category": str(self.work.id)}, {"title": "b", "category": str(self.work.id)}, {"title": "c"}],
+            format='json',
+        )
+        ids = [note["id"] for note in res.data]
+        self.assertCounts(2, 0)
+        self.client.post(reverse('note-bulk-update'), [{"id": ids[0], "category": str(self.home.id)}], format='json')
+        self.assertCounts(1, 1)
+        self.client.post(reverse('note-bulk-move'), {"ids": ids, "category": str(self.home.id)}, format='json')
+        self.assertCounts(0, 3)
+        self.client.post(reverse('note-bulk-delete'), {"ids": ids[:2]}, format='json')
+        self.assertCounts(0, 1)
+
+    def test_deleting_a_category_leaves_the_others_alone(self):
+        note = Note.objects.create(user=self.user, category=self.work)
+        Note.objects.create(user=self.user, category=self.home)
+        self.client.delete(reverse('category-detail', kwargs={"pk": self.work.id}))
+        self.assertEqual(list(Category.objects.values_list("name", "note_count")), [("Home", 1)])
+        # the note, now uncategorized, counts again once it is moved
+        self.client.patch(reverse('note-detail', kwargs={"pk": note.id}), {"category": str(self.home.id)}, format='json')
+        self.assertEqual(Category.objects.get(pk=self.home.pk).note_count, 2)
+
+    def test_list_counts_nothing_and_reconcile_fixes_drift(self):
+        Note.objects.create(user=self.user, category=self.work)
+        Category.objects.filter(pk=self.work.pk).update(note_count=7)
+        Category.objects.filter(pk=self.home.pk).update(note_count=3)
+        # the drifted counts get cached, and reconciling must not leave them there
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('category-list'))
+        self.assertFalse([q for q in ctx.captured_queries if "COUNT(" in q["sql"].upper()])
+
+        out = io.StringIO()
+        call_command("reconcile_category_counts", stdout=out)
+        self.assertIn("Reconciled 2 category count(s).", out.getvalue())
+        self.assertCounts(1, 0)
+        listed = self.client.get(reverse('category-list')).data
+        self.assertEqual({c["name"]: c["note_count"] for c in listed}, {"Work": 1, "Home": 0})
+
+
+@unittest.skipUnless(connection.vendor == "sqlite", "query plan assertions are written for SQLite")
+class IndexUsageTest(APITestCase):
+    """
+    EXPLAIN the hot queries and fail if any of them needs a full table scan or
+    a temporary b-tree to sort, i.e. if the composite indexes stop covering them.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="plans@example.com", password="pass1234")
+        self.category = Category.objects.create(user=self.user, name="Random Thoughts")
+        for i in range(20):
+            Note.objects.create(user=self.user, category=self.category if i % 2 else None, title=f"n{i}")
+
+    def assertIndexOnly(self, queryset):
+        plan = queryset.explain()
+        for line in plan.splitlines():
+            self.assertNotRegex(line, r"\bSCAN\b", f"full scan in plan:\n{plan}")
+            self.assertNotIn("TEMP B-TREE", line, f"temp-table sort in plan:\n{plan}")
+        return plan
+
+    def notes(self):
+        return Note.objects.filter(user=self.user).select_related("category").order_by("-updated_at", "-id")
+
+    def test_note_list_uses_user_updated_index(self):
+        plan = self.assertIndexOnly(self.notes()[:51])
+        self.assertIn("note_user_updated_idx", plan)
+
+    def test_note_list_page_uses_user_updated_index(self):
+        now = timezone.now()
+        page = self.notes().filter(Q(updated_at__lte=now), Q(updated_at__lt=now) | Q(id__lt=self.category.id))
+        plan = self.assertIndexOnly(page[:51])
+        self.assertIn("note_user_updated_idx", plan)
+
+    def test_note_list_by_category_uses_category_index(self):
+        plan = self.assertIndexOnly(self.notes().filter(category=self.category)[:51])
+        self.assertIn("note_user_cat_updated_idx", plan)
+
+    def test_default_category_lookup_uses_lower_name_index(self):
+        lookup = (
+            Category.objects.alias(lower_name=Lower("name"))
+            .filter(user=self.user, lower_name="random thoughts")
+            .order_by()
+        )
+        plan = self.assertIndexOnly(lookup[:1])
+        self.assertIn("category_user_lower_name_idx", plan)
+
+
+@unittest.skipUnless(connection.vendor == "sqlite", "SQLite connection pragmas")
+class SQLiteConnectionTest(APITestCase):
+    def test_pragmas_are_applied_to_each_connection(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+
+class DatabaseSettingsTest(SimpleTestCase):
+    def test_pool_without_psycopg_pool_fails_at_startup(self):
+        environ = {"DATABASE_URL": "postgres://app@db/notes", "DB_POOL_MAX_SIZE": "10"}
+        with mock.patch("config.database.find_spec", return_value=None):
+            with self.assertRaisesMessage(ImproperlyConfigured, "psycopg[binary,pool]"):
+                database_from_env(environ, settings.BASE_DIR)
+
+
+class NoteSearchTest(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="search@example.com", password="pass1234")
+        self.other = get_user_model().objects.create_user(username="search-other@example.com", password="pass1234")
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('note-search')
+
+    def search(self, q, **params):
+        res = self.client.get(self.url, {"q": q, **params})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res
+
+    def ids(self, res):
+        return [n["id"] for n in res.data["results"]]
+
+    def test_search_ranks_title_matches_first(self):
+        in_content = Note.objects.create(user=self.user, title="Groceries", content="remember the avocados")
+        in_title = Note.objects.create(user=self.user, title="Avocados", content="ripe ones")
+        Note.objects.create(user=self.user, title="Unrelated", content="nothing here")
+        res = self.search("avocados")
+        self.assertEqual(res.data["count"], 2)
+        self.assertEqual(self.ids(res), [str(in_title.id), str(in_content.id)])
+
+    def test_search_matches_all_terms_and_prefix_of_last(self):
+        match = Note.objects.create(user=self.user, title="Exam prep", content="chemistry revision")
+        Note.objects.create(user=self.user, title="Exam dates", content="history")
+        self.assertEqual(self.ids(self.search("exam chem")), [str(match.id)])
+
+    def test_search_is_user_scoped(self):
+        Note.objects.create(user=self.other, title="secret plans")
+        self.assertEqual(self.search("secret").data["count"], 0)
+
+    def test_search_index_follows_updates_and_deletes(self):
+        note = Note.objects.create(user=self.user, title="draft", content="")
+        note.title = "final"
+        note.save()
+        self.assertEqual(self.search("draft").data["count"], 0)
+        self.assertEqual(self.ids(self.search("final")), [str(note.id)])
+        note.delete()
+        self.assertEqual(self.search("final").data["count"], 0)
+
+    def test_search_is_paginated(self):
+        for i in range(5):
+            Note.objects.create(user=self.user, title=f"meeting {i}")
+        first = self.search("meeting", limit=2)
+        self.assertEqual(first.data["count"], 5)
+        self.assertEqual(len(first.data["results"]), 2)
+        rest = self.client.get(first.data["next"])
+        self.assertEqual(len(rest.data["results"]), 2)
+        self.assertFalse(set(self.ids(first)) & set(self.ids(rest)))
+
+    def test_search_handles_query_syntax_characters(self):
+        Note.objects.create(user=self.user, title='say "hello" (now)')
+        self.assertEqual(self.search('"hello" OR (').data["count"], 0)
+        self.assertEqual(self.search('"hello"').data["count"], 1)
+
+    def test_search_requires_query(self):
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class NotesSyncTest(QueryCountAssertionsMixin, APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="sync@example.com", password="pass1234")
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('note-list')
+        self.note = Note.objects.create(user=self.user, title="first")
+
+    def test_unchanged_list_returns_304(self):
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        etag = res["ETag"]
+        self.assertTrue(res.has_header("Last-Modified"))
+
+        again = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(again.content, b"")
+
+    def test_revalidation_does_not_load_notes(self):
+        etag = self.client.get(self.url)["ETag"]
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertFalse(any('"notes_note"."title"' in q["sql"] for q in ctx.captured_queries))
+
+    def test_etag_changes_on_create_update_and_delete(self):
+        etags = {self.client.get(self.url)["ETag"]}
+        other = Note.objects.create(user=self.user, title="second")
+        etags.add(self.client.get(self.url)["ETag"])
+        self.note.title = "renamed"
+        self.note.save()
+        etags.add(self.client.get(self.url)["ETag"])
+        other.delete()
+        etags.add(self.client.get(self.url)["ETag"])
+        self.assertEqual(len(etags), 4)
+
+    def test_etag_changes_when_a_note_leaves_a_filtered_list(self):
+        cat = Category.objects.create(user=self.user, name="Work")
+        Note.objects.create(user=self.user, category=cat, title="a")
+        moved = Note.objects.create(user=self.user, category=cat, title="b")
+        etag = self.client.get(self.url, {"category": str(cat.id)})["ETag"]
+        moved.category = None
+        moved.save()
+        res = self.client.get(self.url, {"category": str(cat.id)}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_category_rename_and_delete_reach_lists_and_deltas(self):
+        cat = Category.objects.create(user=self.user, name="Work")
+        note = Note.objects.create(user=self.user, category=cat, title="a")
+        edited = note.updated_at
+
+        etag = self.client.get(self.url)["ETag"]
+        since = timezone.now() + sync.SYNC_OVERLAP
+        self.client.patch(reverse('category-detail', args=[cat.id]), {"color": "#000000"})
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+        delta = self.client.get(self.url, {"updated_since": since.isoformat()})
+        self.assertEqual([(n["id"], n["category_color"]) for n in delta.data["results"]], [(str(note.id), "#000000")])
+
+        etag = self.client.get(self.url)["ETag"]
+        self.client.delete(reverse('category-detail', args=[cat.id]))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+        # the notes themselves were not edited
+        note.refresh_from_db()
+        self.assertEqual(note.updated_at, edited)
+
+    def test_revalidation_does_not_scan_notes(self):
+        etag = self.client.get(self.url)["ETag"]
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        # the user's categories are counted, never their notes
+        self.assertFalse(any("COUNT(" in q["sql"] and 'FROM "notes_note"' in q["sql"] for q in ctx.captured_queries))
+
+    def test_delta_returns_changes_and_tombstones(self):
+        stale = Note.objects.create(user=self.user, title="stale")
+        gone = Note.objects.create(user=self.user, title="gone")
+        since = timezone.now()
+        Note.objects.filter(id__in=[self.note.id, stale.id, gone.id]).update(
+            updated_at=since - datetime.timedelta(minutes=5)
+        )
+        self.note.title = "changed"
+        self.note.save()
+        gone_id = str(gone.id)
+        gone.delete()
+
+        res = self.client.get(self.url, {"updated_since": since.isoformat()})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([n["id"] for n in res.data["results"]], [str(self.note.id)])
+        self.assertEqual(res.data["deleted"], [gone_id])
+        self.assertIn("server_time", res.data)
+
+    def test_delta_rejects_bad_or_expired_timestamps(self):
+        res = self.client.get(self.url, {"updated_since": "yesterday"})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        res = self.client.get(self.url, {"updated_since": (timezone.now() - datetime.timedelta(days=365)).isoformat()})
+        self.assertEqual(res.status_code, status.HTTP_410_GONE)
+
+    def test_deleting_user_leaves_no_tombstones(self):
+        self.user.delete()
+        self.assertFalse(NoteTombstone.objects.exists())
+
+
+class NoteBulkTest(QueryCountAssertionsMixin, APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username="bulk@example.com", password="pass1234")
+        self.other = User.objects.create_user(username="bulk-other@example.com", password="pass1234")
+        self.client.force_authenticate(user=self.user)
+        self.cat_random = Category.objects.create(user=self.user, name="Random Thoughts")
+        self.cat_work = Category.objects.create(user=self.user, name="Work")
+
+    def test_bulk_create_defaults_category_and_indexes(self):
+        payload = [
+            {"title": "one", "content": "alpha"},
+            {"title": "two", "category": str(self.cat_work.id)},
+        ]
+        res = self.client.post(reverse('note-bulk-create'), payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([n["category"] for n in res.data], [self.cat_random.id, self.cat_work.id])
+        self.assertEqual(Note.objects.filter(user=self.user).count(), 2)
+
+        found = self.client.get(reverse('note-search'), {"q": "alpha"})
+        self.assertEqual([n["title"] for n in found.data["results"]], ["one"])
+
+    def test_bulk_create_query_count_is_constant(self):
+        url = reverse('note-bulk-create')
+        counts = {
+            size: self.count_queries(lambda: self.client.post(url, [{"title": "t"}] * size, format='json'))
+            for size in (1, 10, 50)
+        }
+        self.assertEqual(len(set(counts.values())), 1, counts)
+
+    def test_bulk_create_reports_errors_per_item_and_writes_nothing(self):
+        foreign = Category.objects.create(user=self.other, name="Theirs")
+        payload = [{"title": "ok"}, {"title": "x" * 201}, {"category": str(foreign.id)}]
+        res = self.client.post(reverse('note-bulk-create'), payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn("title", res.data[1])
+        self.assertIn("category", res.data[2])
+        self.assertFalse(Note.objects.exists())
+
+    def test_bulk_update_edits_only_own_notes(self):
+        mine = Note.objects.create(user=self.user, title="old")
+        theirs = Note.objects.create(user=self.other, title="theirs")
+        url = reverse('note-bulk-update')
+
+        res = self.client.post(url, [{"id": str(mine.id), "title": "new"}, {"id": str(theirs.id)}], format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("id", res.data[1])
+
+        before = mine.updated_at
+        res = self.client.post(url, [{"id": str(mine.id), "title": "new", "content": "fresh"}], format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        mine.refresh_from_db()
+        self.assertEqual((mine.title, mine.content), ("new", "fresh"))
+        self.assertGreater(mine.updated_at, before)
+        self.assertEqual(self.client.get(reverse('note-search'), {"q": "fresh"}).data["count"], 1)
+
+    def test_bulk_move_and_delete(self):
+        notes = [Note.objects.create(user=self.user, title=str(i)) for i in range(3)]
+        ids = [str(n.id) for n in notes]
+
+        res = self.client.post(reverse('note-bulk-move'), {"ids": ids, "category": str(self.cat_work.id)}, format='json')
+        self.assertEqual(res.data, {"moved": 3})
+        self.assertEqual(Note.objects.filter(category=self.cat_work).count(), 3)
+
+        res = self.client.post(reverse('note-bulk-delete'), {"ids": ids[:2]}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(list(Note.objects.values_list("id", flat=True)), [notes[2].id])
+        self.assertEqual(NoteTombstone.objects.count(), 2)
+        self.assertEqual(self.client.get(reverse('note-search'), {"q": "0"}).data["count"], 0)
+
+    def test_bulk_delete_query_count_is_constant(self):
+        url = reverse('note-bulk-delete')
+
+        def delete(size):
+            notes = Note.objects.bulk_create(Note(user=self.user, category=self.cat_work) for _ in range(size))
+            counters.adjust(self.user.pk, {self.cat_work.pk: size})
+            return lambda: self.client.post(url, {"ids": [str(note.id) for note in notes]}, format='json')
+
+        counts = {size: self.count_queries(delete(size)) for size in (1, 10, 100)}
+        self.assertEqual(len(set(counts.values())), 1, counts)
+
+    def test_bulk_delete_rejects_unknown_ids(self):
+        mine = Note.objects.create(user=self.user)
+        theirs = Note.objects.create(user=self.other)
+        res = self.client.post(reverse('note-bulk-delete'), {"ids": [str(mine.id), str(theirs.id)]}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(list(res.data["ids"]), [1])
+        self.assertEqual(Note.objects.count(), 2)
+
+
+class NoteValuesSerializerTest(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="fast@example.com", password="pass1234")
+        self.client.force_authenticate(user=self.user)
+        cat = Category.objects.create(user=self.user, name="Work", color="#10B981")
+        now = timezone.now()
+        for index, age in enumerate([datetime.timedelta(0), datetime.timedelta(days=1), datetime.timedelta(days=40)]):
+            for category in (cat, None):
+                note = Note.objects.create(user=self.user, category=category, title=f"n{index}", content="c")
+                Note.objects.filter(pk=note.pk).update(updated_at=now - age, created_at=now - age * 2)
+
+    def assertMatchesNoteSerializer(self):
+        notes = Note.objects.filter(user=self.user).select_related("category").order_by("-updated_at", "-id")
+        expected = JSONRenderer().render(NoteSerializer(notes, many=True).data)
+        rows = notes.values(*NoteValuesSerializer.values)
+        self.assertEqual(JSONRenderer().render(NoteValuesSerializer(rows, many=True).data), expected)
+
+    def test_output_is_byte_identical(self):
+        self.assertMatchesNoteSerializer()
+
+    def test_output_is_byte_identical_outside_utc(self):
+        with timezone.override("America/Los_Angeles"):
+            self.assertMatchesNoteSerializer()
+
+    def test_list_endpoint_uses_values_rows(self):
+        res = self.client.get(reverse('note-list'))
+        self.assertEqual(len(res.data["results"]), 6)
+        self.assertEqual(
+            {n["last_edited_label"] for n in res.data["results"]},
+            {"Today", "Yesterday", (timezone.now() - datetime.timedelta(days=40)).strftime("%b %d")},
+        )
+
+    @unittest.skipIf(orjson is None, "orjson is not installed")
+    def test_fast_renderer_output_is_byte_identical(self):
+        res = self.client.get(reverse('note-list'), {"updated_since": "2020-01-01T00:00:00Z"})
+        data = {**res.data, "when": timezone.now(), "ids": [uuid.uuid4()], 1: ErrorDetail("bad")}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    @unittest.skipIf(orjson is None, "orjson is not installed")
+    def test_fast_renderer_escapes_line_separators_like_drf(self):
+        Note.objects.create(user=self.user, title="a\u2028b", content="c\u2029d \u00e9")
+        data = self.client.get(reverse('note-list')).data
+        rendered = FastJSONRenderer().render(data)
+        self.assertEqual(rendered, JSONRenderer().render(data))
+        self.assertIn(b"a\\u2028b", rendered)
+
+
+class FieldSelectionTest(APITestCase):
+    """?fields= trims note and category responses, and note lists skip the columns left out."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="sparse@example.com", password="pass1234")
+        self.client.force_authenticate(user=self.user)
+        self.work = Category.objects.create(user=self.user, name="Work", color="#10B981")
+        self.note = Note.objects.create(user=self.user, category=self.work, title="card", content="long body " * 100)
+        Note.objects.create(user=self.user, title="loose", content="x")
+
+    def test_note_list_returns_and_reads_only_the_requested_fields(self):
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(reverse('note-list'), {"fields": "id,title,category_name"})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.json()["results"],
+            [{"id": str(Note.objects.get(title="loose").id), "title": "loose"},
+             {"id": str(self.note.id), "title": "card", "category_name": "Work"}],
+        )
+        page_query = next(q["sql"] for q in ctx.captured_queries if "LIMIT" in q["sql"])
+        self.assertNotIn('"notes_note"."content"', page_query)
+
+    def test_pages_and_etags_follow_the_selection(self):
+        res = self.client.get(reverse('note-list'), {"fields": "title", "page_size": 1})
+        self.assertEqual(res.json()["results"], [{"title": "loose"}])
+        self.assertEqual(self.client.get(res.json()["next"]).json()["results"], [{"title": "card"}])
+        full = self.client.get(reverse('note-list'), {"page_size": 1})
+        self.assertNotEqual(res["ETag"], full["ETag"])
+
+    def test_detail_search_and_categories(self):
+        res = self.client.get(reverse('note-detail', kwargs={"pk": self.note.id}), {"fields": "title,updated_at"})
+        self.assertEqual(set(res.json()), {"title", "updated_at"})
+        self.assertTrue(res.has_header("ETag"))
+        res = self.client.get(reverse('note-search'), {"q": "card", "fields": "id"})
+        self.assertEqual(res.json()["results"], [{"id": str(self.note.id)}])
+
+        # the cached category list keeps every field for the next caller
+        for cache_status in ("MISS", "HIT"):
+            res = self.client.get(reverse('category-list'), {"fields": "name,note_count"})
+            self.assertEqual(res["X-Cache"], cache_status)
+            self.assertEqual(res.json(), [{"name": "Work", "note_count": 1}])
+        self.assertIn("color", self.client.get(reverse('category-list')).json()[0])
+        res = self.client.get(reverse('category-detail', kwargs={"pk": self.work.id}), {"fields": "color"})
+        self.assertEqual(res.json(), {"color": "#10B981"})
+
+    def test_async_list_matches(self):
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        params = {"fields": "id,content,last_edited_label"}
+        expected = self.client.get(reverse('note-list'), params)
+        actual = self.client.get(reverse('async-note-list'), params)
+        self.assertEqual(actual.content, expected.content)
+
+    def test_unknown_fields_are_rejected_and_writes_ignore_the_parameter(self):
+        res = self.client.get(reverse('note-list'), {"fields": "title,secret"})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.json(), {"fields": ["Unknown fields: secret."]})
+        res = self.client.patch(
+            reverse('note-detail', kwargs={"pk": self.note.id}) + "?fields=id", {"title": "renamed"}, format='json',
+        )
+        self.assertEqual(res.json()["title"], "renamed")
+
+
+class NotePreviewTest(APITestCase):
+    """Notes keep a short preview of their content; ?view=cards lists it instead of the content."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="preview@example.com", password="pass1234")
+        self.client.force_authenticate(user=self.user)
+        self.note = Note.objects.create(user=self.user, title="long", content="word " * 1000)
+
+    def test_make_preview(self):
+        self.assertEqual(make_preview("short note"), "short note")
+        self.assertEqual(make_preview(""), "")
+        preview = make_preview("word " * 1000)
+        self.assertLessEqual(len(preview), PREVIEW_LENGTH + 1)
+        self.assertTrue(preview.endswith("word…"))
+        lines = "\n".join(f"line {i}" for i in range(PREVIEW_LINES + 5))
+        self.assertEqual(make_preview(lines).count("\n"), PREVIEW_LINES - 1)
+        self.assertEqual(make_preview("x" * 2000), "x" * PREVIEW_LENGTH + "…")
+
+    def test_preview_follows_every_content_write(self):
+        self.assertEqual(self.note.preview, make_preview(self.note.content))
+        detail = reverse('note-detail', kwargs={"pk": self.note.id})
+        res = self.client.patch(detail, {"content": "patched"}, format='json')
+        self.assertEqual(res.json()["preview"], "patched")
+
+        res = self.client.patch(
+            reverse('note-edit-content', kwargs={"pk": self.note.id}),
+            {"edits": [{"start": 0, "end": 0, "text": "re"}]}, format='json', HTTP_IF_MATCH=res["ETag"],
+        )
+        self.note.refresh_from_db()
+        self.assertEqual(self.note.preview, "repatched")
+
+        res = self.client.post(reverse('note-bulk-create'), [{"title": "a", "content": "bulk"}], format='json')
+        created = Note.objects.get(pk=res.json()[0]["id"])
+        self.assertEqual(created.preview, "bulk")
+        self.client.post(reverse('note-bulk-update'), [{"id": str(created.id), "content": "edited"}], format='json')
+        created.refresh_from_db()
+        self.assertEqual(created.preview, "edited")
+
+    def test_preview_is_read_only(self):
+        res = self.client.patch(reverse('note-detail', kwargs={"pk": self.note.id}), {"preview": "fake"}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.note.refresh_from_db()
+        self.assertEqual(self.note.preview, make_preview(self.note.content))
+
+    def test_cards_view_leaves_content_out_of_the_query_and_response(self):
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(reverse('note-list'), {"view": "cards"})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        card = res.json()["results"][0]
+        self.assertNotIn("content", card)
+        self.assertEqual(card["preview"], self.note.preview)
+        page_query = next(q["sql"] for q in ctx.captured_queries if "LIMIT" in q["sql"])
+        self.assertNotIn('"notes_note"."content"', page_query)
+
+        full = self.client.get(reverse('note-list'))
+        self.assertEqual(full.json()["results"][0], {**card, "content": self.note.content, "preview": card["preview"]})
+        self.assertNotEqual(res["ETag"], full["ETag"])
+        self.assertEqual(self.client.get(reverse('note-list'), {"view": "full"}).content, full.content)
+
+    def test_fields_override_the_view_and_unknown_views_are_rejected(self):
+        res = self.client.get(reverse('note-list'), {"view": "cards", "fields": "content"})
+        self.assertEqual(res.json()["results"], [{"content": self.note.content}])
+        res = self.client.get(reverse('note-list'), {"view": "tiles"})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(list(res.json()), ["view"])
+
+    def test_async_list_matches(self):
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        expected = self.client.get(reverse('note-list'), {"view": "cards"})
+        actual = self.client.get(reverse('async-note-list'), {"view": "cards"})
+        self.assertEqual(actual.content, expected.content)
+
+
+class ResponseCompressionTest(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="gzip@example.com", password="pass1234")
+        self.client.force_authenticate(user=self.user)
+        for index in range(20):
+            Note.objects.create(user=self.user, title=f"note {index}", content="the same words again " * 20)
+
+    def test_json_is_gzipped_for_clients_that_accept_it(self):
+        plain = self.client.get(reverse('note-list'))
+        self.assertFalse(plain.has_header("Content-Encoding"))
+        self.assertIn("Accept-Encoding", plain["Vary"])
+
+        res = self.client.get(reverse('note-list'), HTTP_ACCEPT_ENCODING="gzip;q=1, br;q=0")
+        self.assertEqual(res["Content-Encoding"], "gzip")
+        self.assertEqual(int(res["Content-Length"]), len(res.content))
+        self.assertLess(len(res.content), len(plain.content) / 5)
+        self.assertEqual(gzip.decompress(res.content), plain.content)
+        # the ETag names the list version, so a compressed read still revalidates
+        res = self.client.get(reverse('note-list'), HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=res["ETag"])
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @unittest.skipIf(compression.brotli is None, "brotli is not installed")
+    def test_brotli_is_preferred(self):
+        plain = self.client.get(reverse('note-list'))
+        res = self.client.get(reverse('note-list'), HTTP_ACCEPT_ENCODING="gzip, deflate, br")
+        self.assertEqual(res["Content-Encoding"], "br")
+        self.assertEqual(compression.brotli.decompress(res.content), plain.content)
+
+    def test_small_and_non_json_responses_are_sent_as_is(self):
+        res = self.client.get(reverse('health'), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(res.has_header("Content-Encoding"))
+        res = self.client.get(reverse('metrics'), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(res.has_header("Content-Encoding"))
+
+    def test_negotiation(self):
+        available = {"br": None, "gzip": None}
+        self.assertEqual(compression.negotiate("gzip, br", available), "br")
+        self.assertEqual(compression.negotiate("br;q=0.5, gzip", available), "gzip")
+        self.assertEqual(compression.negotiate("*", available), "br")
+        self.assertEqual(compression.negotiate("*;q=0, gzip;q=0.1", available), "gzip")
+        self.assertIsNone(compression.negotiate("identity, deflate", available))
+        self.assertIsNone(compression.negotiate("", available))
+
+
+class NoteExportTest(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="export@example.com", password="pass1234")
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('note-export')
+
+    def seed(self, count, batch_size=10000):
+        for start in range(0, count, batch_size):
+            Note.objects.bulk_create(
+                Note(user=self.user, title=f"Note {i}", content="Lorem ipsum dolor sit amet. " * 8)
+                for i in range(start, min(start + batch_size, count))
+            )
+
+    def test_ndjson_matches_the_list(self):
+        self.seed(3)
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res["Content-Type"].startswith("application/x-ndjson"))
+        lines = b"".join(res.streaming_content).decode().splitlines()
+        listed = self.client.get(reverse('note-list')).data["results"]
+        self.assertEqual([json.loads(line) for line in lines], json.loads(JSONRenderer().render(listed)))
+
+    def test_json_array_and_gzip(self):
+        self.seed(3)
+        res = self.client.get(self.url, {"output": "json", "gzip": "1"})
+        self.assertEqual(res["Content-Type"], "application/gzip")
+        self.assertIn('filename="notes.json.gz"', res["Content-Disposition"])
+        notes = json.loads(gzip.decompress(b"".join(res.streaming_content)))
+        self.assertEqual(len(notes), 3)
+
+
+    def test_streams_under_asgi(self):
+        self.seed(3)
+
+        async def export():
+            res = await self.async_client.get(
+                self.url, headers={"Authorization": f"Bearer {AccessToken.for_user(self.user)}"},
+            )
+            # a sync iterator would be read whole before the first byte is sent
+            self.assertTrue(res.is_async)
+            return b"".join([chunk async for chunk in res.streaming_content])
+
+        lines = async_to_sync(export)().decode().splitlines()
+        self.assertEqual(lines, b"".join(self.client.get(self.url).streaming_content).decode().splitlines())
+
+    def test_empty_json_export_is_an_empty_array(self):
+        res = self.client.get(self.url, {"output": "json"})
+        self.assertEqual(json.loads(b"".join(res.streaming_content)), [])
+
+    def test_rejects_unknown_output(self):
+        res = self.client.get(self.url, {"output": "xml"})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_peak_memory_is_flat_for_200k_notes(self):
+        self.seed(200000)
+        res = self.client.get(self.url)
+        streamed = 0
+        tracemalloc.start()
+        try:
+            for chunk in res.streaming_content:
+                streamed += len(chunk)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertGreater(streamed, 50 * 1024 * 1024)
+        self.assertLess(peak, 10 * 1024 * 1024)
+
+
+class JobTest(APITestCase):
+    """Jobs are queued through /api/jobs/, claimed by one worker at a time and retried with backoff."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="jobs@example.com", password="pass1234")
+        self.client.force_authenticate(user=self.user)
+        results = tempfile.TemporaryDirectory()
+        self.addCleanup(results.cleanup)
+        self.settings_override = override_settings(JOBS_RESULTS_DIR=results.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def work(self, worker="worker"):
+        """Claim and run every due job, the way run_jobs does, in this thread."""
+        return [jobs.run(pk, worker) for pk in jobs.claim(worker, limit=100)]
+
+    def test_export_job(self):
+        for i in range(3):
+            Note.objects.create(user=self.user, title=f"Note {i}")
+        res = self.client.post(reverse('job-list'), {"kind": "export", "gzip": True}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res.json()["status"], "queued")
+        job_url = res["Location"]
+        self.assertEqual(self.work(), ["succeeded"])
+
+        job = self.client.get(job_url).json()
+        self.assertEqual((job["status"], job["progress"], job["total"], job["attempts"]), ("succeeded", 3, 3, 1))
+        download = self.client.get(reverse('job-download', kwargs={"pk": job["id"]}))
+        self.assertEqual(download["Content-Type"], "application/gzip")
+        exported = gzip.decompress(b"".join(download.streaming_content))
+        streamed = gzip.decompress(b"".join(self.client.get(reverse('note-export'), {"gzip": "1"}).streaming_content))
+        self.assertEqual(exported, streamed)
+
+    def test_import_resumes_after_a_failed_batch(self):
+        items = [{"title": f"imported {i}"} for i in range(5)] + [{"title": "x" * 201}]
+        job = jobs.enqueue("import", self.user, notes=items)
+        real_create = bulk.create_notes
+        calls = []
+
+        def flaky_create(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError("database went away")
+            return real_create(*args)
+
+        with mock.patch.object(bulk, "MAX_BATCH_SIZE", 2), mock.patch.object(bulk, "create_notes", flaky_create):
+            with self.assertLogs("notes.jobs", "ERROR"):
+                self.assertEqual(self.work(), ["queued"])
+            job.refresh_from_db()
+            self.assertEqual((job.progress, job.attempts, job.error), (2, 1, "RuntimeError: database went away"))
+            # not due until the backoff has passed
+            self.assertEqual(self.work(), [])
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            self.assertEqual(self.work(), ["succeeded"])
+        job.refresh_from_db()
+        self.assertEqual(job.result, {
+            "created": 5, "failed": 1, "errors": {"5": {"title": ["Ensure this field has no more than 200 characters."]}},
+        })
+        self.assertEqual(Note.objects.filter(user=self.user).count(), 5)
+
+    def test_backoff_then_failure(self):
+        def broken(job):
+            raise ValueError("no good")
+
+        job = jobs.enqueue("export", self.user)
+        with mock.patch.dict(jobs.HANDLERS, export=broken):
+            delays = []
+            for _ in range(3):
+                Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+                before = timezone.now()
+                with self.assertLogs("notes.jobs", "ERROR"):
+                    self.work()
+                job.refresh_from_db()
+                delays.append(round((job.run_after - before).total_seconds()))
+        self.assertEqual(delays[:2], [10, 20])
+        self.assertEqual((job.status, job.attempts, job.error), ("failed", 3, "ValueError: no good"))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_claims_are_exclusive_and_abandoned_jobs_are_taken_back(self):
+        job = jobs.enqueue("reindex")
+        self.assertEqual(jobs.claim("first"), [job.pk])
+        self.assertEqual(jobs.claim("second"), [])
+
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - datetime.timedelta(hours=1))
+        self.assertEqual(jobs.claim("second"), [job.pk])
+        # the first worker has lost the job and cannot finish it
+        jobs.run(job.pk, "first")
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by, job.attempts), ("running", "second", 2))
+
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - datetime.timedelta(hours=1), attempts=3)
+        self.assertEqual(jobs.claim("third"), [])
+        job.refresh_from_db()
+        self.assertEqual(job.status, "failed")
+
+    def test_access(self):
+        other = get_user_model().objects.create_user(username="jobs-other@example.com", password="pass1234")
+        theirs = jobs.enqueue("export", other)
+        mine = jobs.enqueue("export", self.user)
+        self.assertEqual([job["id"] for job in self.client.get(reverse('job-list')).json()["results"]], [str(mine.id)])
+        self.assertEqual(self.client.get(reverse('job-detail', kwargs={"pk": theirs.id})).status_code, 404)
+        self.assertEqual(self.client.get(reverse('job-download', kwargs={"pk": mine.id})).status_code, 404)
+
+        res = self.client.post(reverse('job-list'), {"kind": "reindex"}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+        res = self.client.post(reverse('job-list'), {"kind": "import"}, format='json')
+        self.assertEqual(res.json(), {"notes": ["This field is required."]})
+        notes = [{"title": "t"}] * (bulk.MAX_IMPORT_SIZE + 1)
+        res = self.client.post(reverse('job-list'), {"kind": "import", "notes": notes}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("notes", res.json())
+
+
+
+class RunJobsCommandTest(TransactionTestCase):
+    """
+    The worker threads use their own connections, so the jobs they run must be
+    committed. One thread: the in-memory test database cannot take two writers.
+    """
+
+    def test_runs_due_jobs_then_exits_and_prunes(self):
+        user = get_user_model().objects.create_user(username="worker@example.com", password="pass1234")
+        for i in range(3):
+            jobs.enqueue("import", user, notes=[{"title": f"from the worker {i}"}])
+        out = io.StringIO()
+        call_command("run_jobs", "--burst", "--workers", "1", stdout=out)
+        self.assertEqual(out.getvalue().count("succeeded."), 3, out.getvalue())
+        self.assertEqual(Note.objects.filter(title__startswith="from the worker").count(), 3)
+
+        Job.objects.update(finished_at=timezone.now() - datetime.timedelta(days=30))
+        out = io.StringIO()
+        call_command("prune_jobs", stdout=out)
+        self.assertIn("Pruned 3 finished job(s).", out.getvalue())
+        self.assertFalse(Job.objects.exists())
+
+
+class CategoryListCacheTest(QueryCountAssertionsMixin, APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="cache@example.com", password="pass1234")
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('category-list')
+        self.work = Category.objects.create(user=self.user, name="Work")
+        self.home = Category.objects.create(user=self.user, name="Home")
+
+    def counts(self):
+        return {c["name"]: c["note_count"] for c in self.client.get(self.url).data}
+
+    def assertCached(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(self.url)
+        self.assertEqual(res["X-Cache"], "HIT")
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_repeat_reads_are_served_from_cache(self):
+        self.assertEqual(self.client.get(self.url)["X-Cache"], "MISS")
+        self.assertCached()
+
+    def test_note_writes_invalidate_counts(self):
+        note = Note.objects.create(user=self.user, category=self.work)
+        self.assertEqual(self.counts(), {"Work": 1, "Home": 0})
+
+        note.category = self.home
+        note.save()
+        self.assertEqual(self.counts(), {"Work": 0, "Home": 1})
+
+        loaded = Note.objects.get(pk=note.pk)
+        loaded.category = None
+        loaded.save()
+        self.assertEqual(self.counts(), {"Work": 0, "Home": 0})
+
+        note = Note.objects.create(user=self.user, category=self.work)
+        self.counts()
+        note.delete()
+        self.assertEqual(self.counts(), {"Work": 0, "Home": 0})
+
+    def test_edits_that_keep_the_category_keep_the_cache(self):
+        note = Note.objects.create(user=self.user, category=self.work)
+        self.counts()
+        Note.objects.get(pk=note.pk).save()
+        self.assertCached()
+
+    def test_category_writes_and_bulk_moves_invalidate(self):
+        self.counts()
+        self.client.patch(reverse('category-detail', kwargs={"pk": str(self.home.id)}), {"name": "House"}, format='json')
+        self.assertEqual(self.counts(), {"Work": 0, "House": 0})
+
+        note = Note.objects.create(user=self.user)
+        self.counts()
+        self.client.post(reverse('note-bulk-move'), {"ids": [str(note.id)], "category": str(self.work.id)}, format='json')
+        self.assertEqual(self.counts(), {"Work": 1, "House": 0})
+
+    def test_cache_stats_are_admin_only(self):
+        url = reverse('category-cache-stats')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        admin = get_user_model().objects.create_superuser(username="admin@example.com", password="pass1234")
+        self.client.force_authenticate(user=admin)
+        before = self.client.get(url).data
+        self.client.get(self.url)
+        self.client.get(self.url)
+        after = self.client.get(url).data
+        self.assertEqual((after["hits"] - before["hits"], after["misses"] - before["misses"]), (1, 1))
+
+
+class DefaultCategoryCacheTest(QueryCountAssertionsMixin, APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="default@example.com", password="pass1234")
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('note-list')
+        self.random = Category.objects.create(user=self.user, name="Random Thoughts")
+
+    def create_note(self):
+        res = self.client.post(self.url, {"title": "quick"}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        return res.data["category"]
+
+    def test_repeat_creates_skip_the_category_lookup(self):
+        self.create_note()
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.post(self.url, {"title": "quick"}, format='json')
+        self.assertEqual((res.data["category"], res.data["category_name"]), (self.random.id, "Random Thoughts"))
+        self.assertFalse(any(q["sql"].startswith('SELECT') and '"notes_category"' in q["sql"] for q in ctx.captured_queries))
+
+    def test_rename_and_delete_invalidate_the_default(self):
+        self.assertEqual(self.create_note(), self.random.id)
+        self.random.name = "Misc"
+        self.random.save()
+        self.assertIsNone(self.create_note())
+
+        inbox = Category.objects.create(user=self.user, name="random thoughts")
+        self.assertEqual(self.create_note(), inbox.id)
+        inbox.delete()
+        self.assertIsNone(self.create_note())
+
+
+class DefaultCategoryDeletedElsewhereTest(TransactionTestCase):
+    """The foreign key is checked on commit, so these run outside a test transaction."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="stale@example.com", password="pass1234")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.random = Category.objects.create(user=self.user, name="Random Thoughts")
+
+    def test_default_deleted_by_another_process_is_looked_up_again(self):
+        res = self.client.post(reverse('note-list'), {"title": "quick"}, format='json')
+        self.assertEqual(res.data["category"], self.random.id)
+        # another process's writes clear its own cache, not this one's
+        with mock.patch("notes.signals.invalidate_categories"):
+            self.random.delete()
+            inbox = Category.objects.create(user=self.user, name="Random Thoughts")
+        res = self.client.post(reverse('note-list'), {"title": "quick"}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data["category"], inbox.id)
+        self.assertEqual(Note.objects.get(pk=res.data["id"]).category_id, inbox.id)
+
+        with mock.patch("notes.signals.invalidate_categories"):
+            inbox.delete()
+        res = async_to_sync(self.async_client.post)(
+            reverse('async-note-list'), {"title": "quick"}, content_type='application/json',
+            headers={"Authorization": f"Bearer {AccessToken.for_user(self.user)}"},
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertIsNone(res.json()["category"])
+
+
+class AsyncEndpointsTest(APITestCase):
+    """The /api/async/ views must answer exactly like their DRF counterparts."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="async@example.com", password="pass1234")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        self.random = Category.objects.create(user=self.user, name="Random Thoughts", color="#A78BFA")
+        self.work = Category.objects.create(user=self.user, name="Work")
+        self.note = Note.objects.create(user=self.user, category=self.work, title="first", content="hello")
+        Note.objects.create(user=self.user, title="loose")
+
+    def assertSameResponse(self, sync_url, async_url, **params):
+        expected = self.client.get(sync_url, params)
+        actual = self.client.get(async_url, params)
+        self.assertEqual(actual.status_code, expected.status_code)
+        # next links point back at the endpoint that was asked
+        self.assertEqual(actual.content.replace(b"/api/async/", b"/api/"), expected.content)
+        return actual
+
+    def test_reads_match_the_drf_views(self):
+        res = self.assertSameResponse(reverse('note-list'), reverse('async-note-list'))
+        self.assertTrue(res.has_header("ETag"))
+        self.assertSameResponse(reverse('note-list'), reverse('async-note-list'), page_size=1)
+        self.assertSameResponse(reverse('note-list'), reverse('async-note-list'), category=str(self.work.id))
+        self.assertSameResponse(
+            reverse('note-detail', kwargs={"pk": self.note.id}), reverse('async-note-detail', kwargs={"pk": self.note.id}),
+        )
+        self.assertSameResponse(reverse('category-list'), reverse('async-category-list'))
+        self.assertSameResponse(
+            reverse('category-detail', kwargs={"pk": self.work.id}),
+            reverse('async-category-detail', kwargs={"pk": self.work.id}),
+        )
+
+    def test_list_revalidates_and_syncs_deltas(self):
+        url = reverse('async-note-list')
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        since = timezone.now()
+        gone_id = str(self.note.id)
+        self.note.delete()
+        res = self.client.get(url, {"updated_since": since.isoformat()})
+        self.assertEqual(res.json()["deleted"], [gone_id])
+
+    def test_create_and_update_notes(self):
+        url = reverse('async-note-list')
+        res = self.client.post(url, {"title": "quick"}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        created = res.json()
+        self.assertEqual(created["category"], str(self.random.id))
+        self.assertEqual(created["category_name"], "Random Thoughts")
+
+        detail = reverse('async-note-detail', kwargs={"pk": created["id"]})
+        res = self.client.patch(detail, {"content": "more", "category": str(self.work.id)}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        note = Note.objects.get(pk=created["id"])
+        self.assertEqual((note.title, note.content, note.category_id), ("quick", "more", self.work.id))
+
+        other = Category.objects.create(user=get_user_model().objects.create_user(username="x@example.com"), name="X")
+        res = self.client.patch(detail, {"category": str(other.id)}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_create_and_rename_categories(self):
+        url = reverse('async-category-list')
+        res = self.client.post(url, {"name": "Ideas", "color": "#10B981"}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.json()["note_count"], 0)
+        self.assertEqual(self.client.post(url, {"name": "Ideas"}, format='json').status_code, 400)
+
+        detail = reverse('async-category-detail', kwargs={"pk": self.work.id})
+        res = self.client.patch(detail, {"name": "Job"}, format='json')
+        self.assertEqual(res.json()["name"], "Job")
+        self.assertEqual(res.json()["note_count"], 1)
+        self.assertIn("Job", {c["name"] for c in self.client.get(url).json()})
+
+    def test_requires_a_valid_token_and_owns_the_note(self):
+        theirs = Note.objects.create(user=get_user_model().objects.create_user(username="y@example.com"))
+        self.assertEqual(
+            self.client.get(reverse('async-note-detail', kwargs={"pk": theirs.id})).status_code,
+            status.HTTP_404_NOT_FOUND,
+        )
+        self.client.credentials()
+        res = self.client.get(reverse('async-note-list'))
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertTrue(res.has_header("WWW-Authenticate"))
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer not-a-token")
+        self.assertEqual(self.client.get(reverse('async-note-list')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class NoteEventsTest(APITestCase):
+    """The change feed pushes every committed note and category write to the owner's streams."""
+
+    def setUp(self):
+        events.get_broker.cache_clear()
+        events.metrics.reset()
+        self.user = get_user_model().objects.create_user(username="feed@example.com", password="pass1234")
+        self.token = str(AccessToken.for_user(self.user))
+        self.client.force_authenticate(self.user)
+        self.work = Category.objects.create(user=self.user, name="Work")
+
+    def committed(self, fn):
+        def write():
+            with self.captureOnCommitCallbacks(execute=True):
+                return fn()
+        return sync_to_async(write)()
+
+    async def next_event(self, chunks):
+        chunk = await asyncio.wait_for(anext(chunks), 1)
+        name, data = chunk.decode().strip().split("\n")
+        return name.removeprefix("event: "), json.loads(data.removeprefix("data: "))
+
+    async def drain(self, subscription):
+        await asyncio.sleep(0)
+        items = []
+        while not subscription.queue.empty():
+            items.append(subscription.queue.get_nowait()[0])
+        return items
+
+    async def test_stream_pushes_note_and_category_changes(self):
+        response = await self.async_client.get(
+            reverse('async-events'), headers={"Authorization": f"Bearer {self.token}"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        chunks = aiter(response.streaming_content)
+        name, data = await self.next_event(chunks)
+        self.assertEqual(name, "ready")
+        self.assertIn("server_time", data)
+        self.assertEqual(events.metrics.snapshot()["connections"], 1)
+
+        res = await self.committed(lambda: self.client.post(reverse('note-list'), {"title": "hi"}, format='json'))
+        note_id = res.json()["id"]
+        self.assertEqual(await self.next_event(chunks), ("note.created", {
+            "type": "note.created", "id": note_id, "category": None, "updated_at": res.json()["updated_at"],
+        }))
+
+        detail = reverse('note-detail', kwargs={"pk": note_id})
+        await self.committed(lambda: self.client.patch(detail, {"category": str(self.work.id)}, format='json'))
+        name, data = await self.next_event(chunks)
+        self.assertEqual((name, data["category"]), ("note.updated", str(self.work.id)))
+
+        await self.committed(lambda: self.client.delete(detail))
+        name, data = await self.next_event(chunks)
+        self.assertEqual((name, data["id"]), ("note.deleted", note_id))
+
+        await self.committed(lambda: self.client.post(reverse('category-list'), {"name": "Ideas"}, format='json'))
+        name, data = await self.next_event(chunks)
+        self.assertEqual((name, data["name"]), ("category.created", "Ideas"))
+
+        stats = events.metrics.snapshot()
+        self.assertEqual((stats["events_published"], stats["events_delivered"]), (4, 4))
+        self.assertIsNotNone(stats["latency_ms"]["p99"])
+
+    async def test_stream_requires_a_token(self):
+        response = await self.async_client.get(reverse('async-events'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_events_reach_only_the_owner_and_only_after_commit(self):
+        other = await get_user_model().objects.acreate(username="other@example.com")
+        broker = events.get_broker()
+        mine, theirs = broker.subscribe(self.user.pk), broker.subscribe(other.pk)
+
+        def rolled_back():
+            with transaction.atomic():
+                Note.objects.create(user=self.user, title="never")
+                transaction.set_rollback(True)
+        await self.committed(rolled_back)
+        self.assertEqual(await self.drain(mine), [])
+
+        await self.committed(lambda: Note.objects.create(user=self.user, title="kept"))
+        self.assertEqual([event["type"] for event in await self.drain(mine)], ["note.created"])
+        self.assertEqual(await self.drain(theirs), [])
+
+        broker.unsubscribe(mine)
+        broker.unsubscribe(theirs)
+        self.assertEqual(events.metrics.snapshot()["connections"], 0)
+
+    async def test_batch_writes_publish_one_event_per_note(self):
+        subscription = events.get_broker().subscribe(self.user.pk)
+        res = await self.committed(lambda: self.client.post(
+            reverse('note-bulk-create'), [{"title": "a"}, {"title": "b"}], format='json',
+        ))
+        ids = [note["id"] for note in res.json()]
+        self.assertEqual([(e["type"], e["id"]) for e in await self.drain(subscription)], [("note.created", i) for i in ids])
+
+        await self.committed(lambda: self.client.post(
+            reverse('note-bulk-move'), {"ids": ids, "category": str(self.work.id)}, format='json',
+        ))
+        moved = await self.drain(subscription)
+        self.assertEqual({(e["type"], e["id"], e["category"]) for e in moved}, {("note.updated", i, str(self.work.id)) for i in ids})
+
+        await self.committed(lambda: self.client.post(reverse('note-bulk-delete'), {"ids": ids}, format='json'))
+        self.assertEqual({(e["type"], e["id"]) for e in await self.drain(subscription)}, {("note.deleted", i) for i in ids})
+
+    @override_settings(NOTES_EVENTS_QUEUE_SIZE=2)
+    async def test_a_slow_subscriber_is_told_to_resync(self):
+        subscription = events.get_broker().subscribe(self.user.pk)
+        events.get_broker().publish(self.user.pk, [{"type": "note.updated", "id": str(n)} for n in range(5)])
+        self.assertEqual(await self.drain(subscription), [events.RESYNC])
+        self.assertEqual(events.metrics.snapshot()["events_dropped"], 5)
+
+    def test_event_stats_are_admin_only(self):
+        url = reverse('note-event-stats')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(get_user_model().objects.create_user(username="admin", is_staff=True))
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json()["connections"], 0)
+
+
+class NoteConditionalWriteTest(APITestCase):
+    """Autosaves write only what changed, and If-Match turns lost updates into 412s."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="writer@example.com", password="pass1234")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        self.work = Category.objects.create(user=self.user, name="Work")
+        self.note = Note.objects.create(user=self.user, category=self.work, title="draft", content="hello")
+        self.url = reverse('note-detail', kwargs={"pk": self.note.id})
+
+    def updates(self, fn):
+        with CaptureQueriesContext(connection) as ctx:
+            response = fn()
+        return response, [q["sql"] for q in ctx.captured_queries if q["sql"].startswith('UPDATE "notes_note"')]
+
+    def test_unchanged_autosave_writes_nothing(self):
+        etag = self.client.get(self.url)["ETag"]
+        body = {"title": "draft", "content": "hello", "category": str(self.work.id)}
+        res, updates = self.updates(lambda: self.client.put(self.url, body, format='json'))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(updates, [])
+        self.assertEqual(res["ETag"], etag)
+        self.assertEqual(Note.objects.get(pk=self.note.pk).updated_at, self.note.updated_at)
+
+    def test_only_changed_columns_are_written(self):
+        res, updates = self.updates(lambda: self.client.put(
+            self.url, {"title": "draft", "content": "hello world", "category": str(self.work.id)}, format='json',
+        ))
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"content"', updates[0])
+        self.assertIn('"updated_at"', updates[0])
+        self.assertNotIn('"title"', updates[0])
+        self.assertNotIn('"category_id"', updates[0])
+        self.assertGreater(Note.objects.get(pk=self.note.pk).updated_at, self.note.updated_at)
+        self.assertEqual(self.client.get(reverse('note-search'), {"q": "world"}).json()["count"], 1)
+
+    def test_stale_if_match_is_rejected(self):
+        etag = self.client.get(self.url)["ETag"]
+        res = self.client.patch(self.url, {"content": "mine"}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res["ETag"], etag)
+        self.assertEqual(self.client.get(self.url)["ETag"], res["ETag"])
+
+        res = self.client.patch(self.url, {"content": "theirs"}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(Note.objects.get(pk=self.note.pk).content, "mine")
+        self.assertEqual(self.client.delete(self.url, HTTP_IF_MATCH=etag).status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(self.client.delete(self.url, HTTP_IF_MATCH=f'W/{etag}').status_code, status.HTTP_412_PRECONDITION_FAILED)
+
+        res = self.client.patch(self.url, {"content": "forced"}, format='json', HTTP_IF_MATCH="*")
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.delete(self.url, HTTP_IF_MATCH=res["ETag"]).status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_async_views_share_versions(self):
+        detail = reverse('async-note-detail', kwargs={"pk": self.note.id})
+        etag = self.client.get(self.url)["ETag"]
+        self.assertEqual(self.client.get(detail)["ETag"], etag)
+
+        res, updates = self.updates(lambda: self.client.patch(detail, {"title": "draft"}, format='json'))
+        self.assertEqual((res.status_code, res["ETag"], updates), (status.HTTP_200_OK, etag, []))
+
+        self.client.patch(self.url, {"title": "renamed"}, format='json')
+        res = self.client.patch(detail, {"content": "stale"}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(res.json()["detail"], str(sync.PreconditionFailed.default_detail))
+
+
+class NoteContentEditsTest(APITestCase):
+    """PATCH /api/notes/{id}/content/ applies splices to the version named by If-Match."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="editor@example.com", password="pass1234")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        self.note = Note.objects.create(user=self.user, title="long", content="The quick brown fox")
+        self.url = reverse('note-edit-content', kwargs={"pk": self.note.id})
+        self.etag = self.client.get(reverse('note-detail', kwargs={"pk": self.note.id}))["ETag"]
+
+    def edit(self, edits, etag=None):
+        return self.client.patch(self.url, {"edits": edits}, format='json', HTTP_IF_MATCH=etag or self.etag)
+
+    def test_applies_edits_and_answers_with_the_new_version(self):
+        res = self.edit([{"start": 4, "end": 9, "text": "slow"}, {"start": 19, "end": 19, "text": " jumps"}])
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        note = Note.objects.get(pk=self.note.pk)
+        self.assertEqual(note.content, "The slow brown fox jumps")
+        self.assertEqual(set(res.json()), {"id", "updated_at", "content_length"})
+        self.assertEqual(res.json()["content_length"], len(note.content))
+        self.assertEqual(res["ETag"], self.client.get(reverse('note-detail', kwargs={"pk": self.note.id}))["ETag"])
+
+        # the returned ETag is the base for the next edit; the old one is stale
+        self.assertEqual(self.edit([{"start": 0, "end": 3}], etag=res["ETag"]).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.edit([{"start": 0, "end": 3}]).status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(Note.objects.get(pk=self.note.pk).content, " slow brown fox jumps")
+
+    def test_offsets_count_utf16_code_units(self):
+        self.note.content = "a😀b é"
+        self.note.save()
+        etag = self.client.get(reverse('note-detail', kwargs={"pk": self.note.id}))["ETag"]
+        # in JavaScript "a😀b é".indexOf("b") is 3: the emoji takes two code units
+        res = self.edit([{"start": 3, "end": 4, "text": "B"}, {"start": 6, "end": 6, "text": "!"}], etag=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(Note.objects.get(pk=self.note.pk).content, "a😀B é!")
+        self.assertEqual(res.json()["content_length"], 7)
+
+        res = self.edit([{"start": 2, "end": 2, "text": "x"}], etag=res["ETag"])
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("surrogate", res.json()["edits"][0])
+
+    def test_rejects_edits_that_do_not_fit(self):
+        self.assertEqual(self.edit([{"start": 0, "end": 100, "text": ""}]).status_code, status.HTTP_400_BAD_REQUEST)
+        res = self.edit([{"start": 4, "end": 9}, {"start": 5, "end": 6}])
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("1", res.json()["edits"])
+        self.assertEqual(self.edit([{"start": 5, "end": 4}]).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.edit([]).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Note.objects.get(pk=self.note.pk).content, "The quick brown fox")
+
+    def test_requires_a_base_version(self):
+        res = self.client.patch(self.url, {"edits": [{"start": 0, "end": 0, "text": "x"}]}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_428_PRECONDITION_REQUIRED)
+        self.assertEqual(self.edit([{"start": 0, "end": 0, "text": "x"}], etag="*").status_code, 428)
+
+
+class NoteRevisionTest(APITestCase):
+    """Edits are kept as compressed deltas between keyframes, coalesced and pruned."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="history@example.com", password="pass1234")
+        self.client.force_authenticate(self.user)
+        self.note = Note.objects.create(user=self.user, title="v0", content=" ".join(["start"] * 1000))
+        self.url = reverse('note-revisions', kwargs={"pk": self.note.id})
+
+    def revision_url(self, number, note=None):
+        return reverse('note-revision', kwargs={"pk": (note or self.note).id, "number": number})
+
+    def edit(self, n):
+        content = self.note.content[:n * 7] + f"edit {n:02d}" + self.note.content[n * 7 + 7:]
+        self.note.title, self.note.content = f"v{n}", content
+        res = self.client.patch(
+            reverse('note-detail', kwargs={"pk": self.note.id}), {"title": f"v{n}", "content": content}, format='json',
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return content
+
+    def test_diff_round_trips(self):
+        cases = [("", "abc"), ("abc", ""), ("same", "same"), ("aaaa", "aa"), ("abcabc", "abXabc"), ("héllo 😀 wörld", "héllo 😃 wörld")]
+        for old, new in cases:
+            start, end, text = revisions.diff(old, new)
+            self.assertEqual(old[:start] + text + old[end:], new, (old, new))
+        self.assertEqual(revisions.diff("The quick fox", "The slow fox"), (4, 9, "slow"))
+
+    @override_settings(NOTE_REVISION_COALESCE_SECONDS=0, NOTE_REVISION_KEYFRAME_INTERVAL=5)
+    def test_every_edit_can_be_read_back(self):
+        contents = [self.note.content] + [self.edit(n) for n in range(1, 13)]
+        res = self.client.get(self.url)
+        self.assertEqual(res.json()["count"], 13)
+        self.assertEqual([r["number"] for r in res.json()["results"]], list(range(13, 0, -1)))
+        self.assertEqual(res.json()["results"][0]["title"], "v12")
+
+        stored = NoteRevision.objects.filter(note=self.note).order_by("number")
+        self.assertEqual([r.number for r in stored if r.keyframe], [1, 6, 11])
+        # a delta holds the edit, not the note
+        self.assertLess(max(len(r.data) for r in stored if not r.keyframe), 100)
+
+        for number, content in enumerate(contents, start=1):
+            with self.assertNumQueries(2):
+                res = self.client.get(self.revision_url(number))
+            self.assertEqual((res.json()["content"], res.json()["title"]), (content, f"v{number - 1}"))
+        self.assertEqual(self.client.get(self.revision_url(14)).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_rapid_autosaves_coalesce(self):
+        original = self.note.content
+        for n in range(1, 6):
+            latest = self.edit(n)
+        self.assertEqual(self.client.get(self.url).json()["count"], 1)
+        self.assertEqual(self.client.get(self.revision_url(1)).json()["content"], latest)
+
+        NoteRevision.objects.update(created_at=timezone.now() - datetime.timedelta(minutes=2))
+        newest = self.edit(6)
+        self.assertEqual(self.client.get(self.url).json()["count"], 2)
+        self.assertEqual(self.client.get(self.revision_url(1)).json()["content"], latest)
+        self.assertEqual(self.client.get(self.revision_url(2)).json()["content"], newest)
+        self.assertNotEqual(latest, original)
+
+        # saves that leave title and content alone record nothing
+        category = Category.objects.create(user=self.user, name="Work")
+        self.client.patch(reverse('note-detail', kwargs={"pk": self.note.id}), {"category": str(category.id)}, format='json')
+        self.assertEqual(NoteRevision.objects.filter(note=self.note).count(), 2)
+
+    @override_settings(NOTE_REVISION_COALESCE_SECONDS=0)
+    def test_batch_writes_record_revisions(self):
+        res = self.client.post(reverse('note-bulk-create'), [{"title": "a"}, {"title": "b"}], format='json')
+        ids = [note["id"] for note in res.json()]
+        self.client.post(reverse('note-bulk-update'), [{"id": ids[0], "content": "more"}], format='json')
+        first = Note.objects.get(pk=ids[0])
+        self.assertEqual(self.client.get(self.revision_url(2, first)).json()["content"], "more")
+        self.assertEqual(self.client.get(self.revision_url(1, first)).json()["content"], "")
+        self.assertEqual(NoteRevision.objects.filter(note_id=ids[1]).count(), 1)
+
+    @override_settings(NOTE_REVISION_COALESCE_SECONDS=0, NOTE_REVISION_KEYFRAME_INTERVAL=5)
+    def test_prune_keeps_recent_revisions_readable(self):
+        contents = [self.note.content] + [self.edit(n) for n in range(1, 30)]
+        old = timezone.now() - datetime.timedelta(days=200)
+        NoteRevision.objects.filter(note=self.note, number__lte=22).update(created_at=old)
+
+        self.assertEqual(revisions.prune(), 22)
+        kept = NoteRevision.objects.filter(note=self.note).order_by("number")
+        self.assertEqual(kept[0].number, 23)
+        self.assertTrue(kept[0].keyframe)
+        for number in range(23, 31):
+            self.assertEqual(self.client.get(self.revision_url(number)).json()["content"], contents[number - 1])
+
+        with override_settings(NOTE_REVISION_LIMIT=3):
+            call_command("prune_note_revisions", stdout=io.StringIO())
+        self.assertEqual([r.number for r in NoteRevision.objects.filter(note=self.note)], [30, 29, 28])
+        self.assertEqual(self.client.get(self.revision_url(28)).json()["content"], contents[27])
+
+    def test_history_is_private(self):
+        other = get_user_model().objects.create_user(username="peek@example.com")
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(self.revision_url(1)).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class RequestMetricsTest(APITestCase):
+    """Sampled requests land in the histograms served at /api/metrics/."""
+
+    def setUp(self):
+        metrics.clear()
+        # the test connection predates the handlers, so connection_created never saw it
+        metrics.install(connection)
+        self.user = get_user_model().objects.create_user(username="metrics@example.com", password="pass1234")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        Note.objects.create(user=self.user, title="measured")
+
+    def series(self, histogram, view, method="GET", status_code="200"):
+        return histogram.series.get((view, method, status_code))
+
+    def test_records_view_queries_render_time_and_size(self):
+        res = self.client.get(reverse('note-list'))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        _, seconds, count = self.series(metrics.REQUEST_SECONDS, 'note-list')
+        self.assertEqual(count, 1)
+        self.assertGreater(seconds, 0)
+        _, queries, _ = self.series(metrics.DB_QUERIES, 'note-list')
+        self.assertGreater(queries, 0)
+        self.assertGreater(self.series(metrics.DB_SECONDS, 'note-list')[1], 0)
+        self.assertGreater(self.series(metrics.RENDER_SECONDS, 'note-list')[1], 0)
+        self.assertEqual(self.series(metrics.RESPONSE_BYTES, 'note-list')[1], len(res.content))
+
+        self.client.get('/api/no-such-route/')
+        self.assertIsNotNone(self.series(metrics.REQUEST_SECONDS, 'unmatched', status_code="404"))
+
+    def test_async_views_count_queries_run_in_threads(self):
+        res = async_to_sync(self.async_client.get)(
+            reverse('async-note-list'), headers={"Authorization": f"Bearer {AccessToken.for_user(self.user)}"},
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertGreater(self.series(metrics.DB_QUERIES, 'async-note-list')[1], 0)
+        self.assertGreater(self.series(metrics.RENDER_SECONDS, 'async-note-list')[1], 0)
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_recorded(self):
+        self.client.get(reverse('note-list'))
+        self.assertIsNone(self.series(metrics.REQUEST_SECONDS, 'note-list'))
+
+    @override_settings(METRICS_TOKEN="scrape-me")
+    def test_endpoint_serves_prometheus_text(self):
+        self.client.get(reverse('note-list'))
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer scrape-me")
+        res = self.client.get(reverse('metrics'))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res["Content-Type"].startswith("text/plain; version=0.0.4"))
+        body = res.content.decode()
+        self.assertIn("# TYPE http_request_duration_seconds histogram", body)
+        self.assertIn('http_request_duration_seconds_count{view="note-list",method="GET",status="200"} 1', body)
+        self.assertIn('http_request_db_queries_bucket{view="note-list",method="GET",status="200",le="+Inf"} 1', body)
+
+    @override_settings(METRICS_TOKEN="scrape-me")
+    def test_endpoint_requires_the_token_when_set(self):
+        self.client.credentials()
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer wrong")
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer scrape-me")
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_200_OK)
+
+    @override_settings(METRICS_TOKEN=None)
+    def test_endpoint_is_closed_without_a_token(self):
+        self.client.credentials()
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
@@ -1,16 +1,30 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
-from .views import CategoryViewSet, NoteViewSet, HealthCheck
+from .async_views import (
+    AsyncCategoryDetailView, AsyncCategoryListView, AsyncNoteDetailView, AsyncNoteEventsView, AsyncNoteListView,
+)
+from .views import CategoryViewSet, JobViewSet, NoteViewSet, HealthCheck, Metrics
 
 router = DefaultRouter()
 router.register(r'categories', CategoryViewSet, basename='category')
 router.register(r'notes', NoteViewSet, basename='note')
+router.register(r'jobs', JobViewSet, basename='job')
 
 urlpatterns = [
     # Health
     path('health/', HealthCheck.as_view(), name='health'),
+    path('metrics/', Metrics.as_view(), name='metrics'),
 
     # API routes
     path('', include(router.urls)),
+
+    # Async (ASGI-native) versions of the list/retrieve/create/update routes
+    path('async/notes/', AsyncNoteListView.as_view(), name='async-note-list'),
+    path('async/notes/<uuid:pk>/', AsyncNoteDetailView.as_view(), name='async-note-detail'),
+    path('async/categories/', AsyncCategoryListView.as_view(), name='async-category-list'),
+    path('async/categories/<uuid:pk>/', AsyncCategoryDetailView.as_view(), name='async-category-detail'),
+
+    # Change feed (Server-Sent Events)
+    path('async/events/', AsyncNoteEventsView.as_view(), name='async-events'),
 ]
\ No newline at end of file
@@ -1,22 +1,79 @@
-from django.db import IntegrityError
+import hmac
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, transaction
+from django.http import FileResponse, HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
 from django.utils.decorators import method_decorator
-from rest_framework import viewsets, permissions, status
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework import mixins, viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated, AllowAny
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.views import APIView
-from drf_spectacular.utils import extend_schema, extend_schema_view
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter, extend_schema, extend_schema_view
+
+from config import metrics
+
+from . import bulk, caching, edits, events, exports, jobs, revisions, sync
+from .models import Category, Job, Note, NoteRevision
+from .pagination import JobPagination, NoteCursorPagination, NoteRevisionPagination, NoteSearchPagination
+from .search import SearchResults
+from .serializers import (
+    CategorySerializer,
+    JobCreateSerializer,
+    JobSerializer,
+    NoteBatchCreateSerializer,
+    NoteBatchDeleteSerializer,
+    NoteBatchMoveSerializer,
+    NoteBatchUpdateSerializer,
+    NoteContentEditsSerializer,
+    NoteContentVersionSerializer,
+    NoteRevisionDetailSerializer,
+    NoteRevisionSerializer,
+    NoteSerializer,
+    NoteValuesSerializer,
+    list_fields,
+    requested_fields,
+    save_changes,
+    select_fields,
+)
+
 
-from .models import Category, Note
-from .serializers import CategorySerializer, NoteSerializer
 
 
 
+def category_queryset(user):
+    # note_count is stored on the category, so no notes are counted here
+    return Category.objects.filter(user=user).order_by("name")
+
+
+def note_queryset(user, params):
+    qs = Note.objects.filter(user=user).select_related("category").order_by("-updated_at", "-id")
+    category_id = params.get("category") or params.get("category_id")
+    if category_id:
+        qs = qs.filter(category_id=category_id)
+    return qs
+
+
+FIELDS = OpenApiParameter(
+    'fields', OpenApiTypes.STR,
+    description='Comma-separated fields to return, e.g. id,title,updated_at; all fields when absent',
+)
+VIEW = OpenApiParameter(
+    'view', OpenApiTypes.STR, enum=['full', 'cards'],
+    description='cards: every field but content, for note cards (the preview stands in); ignored with fields',
+)
 
 
 @extend_schema(tags=['Categories'])
 @extend_schema_view(
-    list=extend_schema(summary='List categories'),
-    retrieve=extend_schema(summary='Retrieve category'),
+    list=extend_schema(summary='List categories', parameters=[FIELDS]),
+    retrieve=extend_schema(summary='Retrieve category', parameters=[FIELDS]),
     create=extend_schema(summary='Create category'),
     update=extend_schema(summary='Update category'),
     partial_update=extend_schema(summary='Partially update category'),
@@ -27,17 +84,38 @@ class CategoryViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Category.objects.filter(user=self.request.user).order_by("name")
+        return category_queryset(self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        # cached per user and dropped on writes; see notes.caching
+        data = caching.get_category_list(request.user.pk)
+        cache_status = "HIT"
+        if data is None:
+            data = super().list(request, *args, **kwargs).data
+            caching.set_category_list(request.user.pk, data)
+            cache_status = "MISS"
+        # the cache holds every field; a ?fields= selection is cut from it
+        fields = requested_fields(request, CategorySerializer.Meta.fields)
+        if fields is not None:
+            data = [select_fields(category, fields) for category in data]
+        response = Response(data)
+        response["X-Cache"] = cache_status
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        data = self.get_serializer(self.get_object()).data
+        return Response(select_fields(data, requested_fields(request, CategorySerializer.Meta.fields)))
+
+    @extend_schema(summary='Category list cache statistics')
+    @action(detail=False, methods=['get'], url_path='cache-stats', permission_classes=[IsAdminUser])
+    def cache_stats(self, request):
+        return Response(caching.stats())
 
     def perform_create(self, serializer):
-        # tie category to current user
-        try:
+        # tie category to current user; a savepoint keeps the surrounding
+        # transaction usable if the unique constraint fires
+        with transaction.atomic():
             serializer.save(user=self.request.user)
-        except IntegrityError:
-            return Response(
-                {"detail": "Category with this name already exists for this user."},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
 
     def create(self, request, *args, **kwargs):
         # override to handle unique constraint gracefully
@@ -54,37 +132,352 @@ class CategoryViewSet(viewsets.ModelViewSet):
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
 
+# detail writes that honour If-Match
+WRITE_ACTIONS = {"update", "partial_update", "destroy", "edit_content"}
+
+IF_MATCH = OpenApiParameter(
+    'If-Match', OpenApiTypes.STR, OpenApiParameter.HEADER,
+    description="ETag from the last read of the note; 412 if the note has changed since",
+)
+
+
 @extend_schema(tags=['Notes'])
 @extend_schema_view(
     list=extend_schema(summary='List notes'),
-    retrieve=extend_schema(summary='Retrieve note'),
+    retrieve=extend_schema(summary='Retrieve note', parameters=[FIELDS]),
     create=extend_schema(summary='Create note'),
-    update=extend_schema(summary='Update note'),
-    partial_update=extend_schema(summary='Partially update note'),
-    destroy=extend_schema(summary='Delete note'),
+    update=extend_schema(summary='Update note', parameters=[IF_MATCH]),
+    partial_update=extend_schema(summary='Partially update note', parameters=[IF_MATCH]),
+    destroy=extend_schema(summary='Delete note', parameters=[IF_MATCH]),
 )
 class NoteViewSet(viewsets.ModelViewSet):
     serializer_class = NoteSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = NoteCursorPagination
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('category', OpenApiTypes.UUID, description='Only list notes in this category'),
+            OpenApiParameter(
+                'updated_since', OpenApiTypes.DATETIME,
+                description='Delta sync: only notes changed after this time, plus ids of notes deleted since',
+            ),
+            FIELDS,
+            VIEW,
+        ],
+    )
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        fields = list_fields(request, NoteSerializer.Meta.fields)
+
+        # Revalidation is answered from a few small queries, before any note is loaded
+        etag, last_modified = sync.list_validators(request.user, request.query_params)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        since = sync.parse_since(request.query_params.get("updated_since"))
+        if since is not None:
+            if sync.is_beyond_retention(since):
+                return Response(
+                    {"detail": "updated_since is older than the deletion history; fetch the full list."},
+                    status=status.HTTP_410_GONE,
+                )
+            server_time = timezone.now()
+            queryset = sync.changed_since(queryset, since)
+
+        # rows come back as dicts and skip NoteSerializer; only the columns
+        # the requested fields need are read, see NoteValuesSerializer
+        page = self.paginate_queryset(queryset.values(*NoteValuesSerializer.columns(fields)))
+        serializer = NoteValuesSerializer(page, many=True, fields=fields, context=self.get_serializer_context())
+        response = self.get_paginated_response(serializer.data)
+        if since is not None and not request.query_params.get(self.paginator.cursor_query_param):
+            response.data["deleted"] = sync.deleted_since(request.user, since)
+            response.data["server_time"] = server_time.isoformat()
+
+        sync.set_validators(response, etag, last_modified)
+        return response
 
     def get_queryset(self):
-        qs = Note.objects.filter(user=self.request.user).select_related("category").order_by("-updated_at")
-        category_id = self.request.query_params.get("category") or self.request.query_params.get("category_id")
-        if category_id:
-            qs = qs.filter(category_id=category_id)
-        return qs
+        queryset = note_queryset(self.request.user, self.request.query_params)
+        if self.action in WRITE_ACTIONS:
+            # the row stays locked from the If-Match check until the write commits
+            queryset = queryset.select_for_update(of=("self",))
+        return queryset
+
+    def get_object(self):
+        note = super().get_object()
+        if self.action in WRITE_ACTIONS:
+            sync.check_if_match(self.request, sync.note_etag(note.updated_at))
+        return note
+
+    def retrieve(self, request, *args, **kwargs):
+        note = self.get_object()
+        fields = requested_fields(request, NoteSerializer.Meta.fields)
+        response = Response(select_fields(self.get_serializer(note).data, fields))
+        response["ETag"] = sync.note_etag(note.updated_at)
+        return response
+
+    def update(self, request, *args, **kwargs):
+        # only changed fields are written, and an unchanged note keeps its ETag
+        partial = kwargs.pop("partial", False)
+        with transaction.atomic():
+            note = self.get_object()
+            serializer = self.get_serializer(note, data=request.data, partial=partial)
+            serializer.is_valid(raise_exception=True)
+            self.perform_update(serializer)
+        response = Response(serializer.data)
+        response["ETag"] = sync.note_etag(note.updated_at)
+        return response
+
+    def destroy(self, request, *args, **kwargs):
+        with transaction.atomic():
+            return super().destroy(request, *args, **kwargs)
+
+    @extend_schema(
+        summary='Edit note content',
+        description='Apply text splices to the content version named by If-Match. Offsets count UTF-16 code units.',
+        parameters=[IF_MATCH],
+        request=NoteContentEditsSerializer,
+        responses=NoteContentVersionSerializer,
+    )
+    @action(detail=True, methods=['patch'], url_path='content')
+    def edit_content(self, request, pk=None):
+        # the edits only make sense against the exact text they were made on
+        if request.headers.get("If-Match", "*").strip() == "*":
+            raise sync.PreconditionRequired()
+        serializer = NoteContentEditsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            note = self.get_object()
+            try:
+                content = edits.apply_edits(note.content, serializer.validated_data["edits"])
+            except ValueError as exc:
+                raise ValidationError({"edits": [str(exc)]})
+            save_changes(note, {"content": content})
+        response = Response(NoteContentVersionSerializer(note).data)
+        response["ETag"] = sync.note_etag(note.updated_at)
+        return response
+
+    def get_note_id(self):
+        # ownership check only: the history actions never need the note's content
+        note_ids = Note.objects.filter(user=self.request.user, pk=self.kwargs["pk"]).values_list("pk", flat=True)
+        note_id = note_ids.first()
+        if note_id is None:
+            raise NotFound()
+        return note_id
+
+    @extend_schema(summary='List note revisions', responses=NoteRevisionSerializer(many=True))
+    @action(detail=True, methods=['get'], pagination_class=NoteRevisionPagination)
+    def revisions(self, request, pk=None):
+        queryset = NoteRevision.objects.filter(note_id=self.get_note_id()).defer("data")
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(NoteRevisionSerializer(page, many=True).data)
+
+    @extend_schema(summary='Retrieve note revision', responses=NoteRevisionDetailSerializer)
+    @action(detail=True, methods=['get'], url_path=r'revisions/(?P<number>[0-9]+)', pagination_class=None)
+    def revision(self, request, pk=None, number=None):
+        # rebuilt from the nearest keyframe; see notes.revisions
+        revision = revisions.load(self.get_note_id(), int(number))
+        if revision is None:
+            raise NotFound()
+        return Response(NoteRevisionDetailSerializer(revision).data)
 
     def perform_create(self, serializer):
-        # If no category provided, default to user's "Random Thoughts" if exists
-        category = serializer.validated_data.get("category")
-        if not category:
-            category = Category.objects.filter(user=self.request.user, name__iexact="Random Thoughts").first()
-        serializer.save(user=self.request.user, category=category)
+        # If no category provided, default to user's "Random Thoughts" if exists;
+        # the lookup is cached per user, see notes.caching
+        def save(category):
+            # a retried save creates the note afresh
+            serializer.instance = None
+            return serializer.save(user=self.request.user, category=category)
+
+        if serializer.validated_data.get("category"):
+            serializer.save(user=self.request.user)
+        else:
+            caching.save_with_default_category(self.request.user, save)
+
+    @extend_schema(
+        summary='Search notes',
+        parameters=[
+            OpenApiParameter('q', OpenApiTypes.STR, description='Words to match in note titles and contents'),
+            FIELDS,
+        ],
+    )
+    @action(detail=False, methods=['get'], pagination_class=NoteSearchPagination)
+    def search(self, request):
+        # ranked full-text search; see notes.search for the index backends
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            return Response({"detail": "The q parameter is required."}, status=status.HTTP_400_BAD_REQUEST)
+        fields = requested_fields(request, NoteSerializer.Meta.fields)
+        results = SearchResults(request.user, query)
+        page = self.paginate_queryset(results)
+        data = [select_fields(note, fields) for note in self.get_serializer(page, many=True).data]
+        return self.get_paginated_response(data)
+
+    @extend_schema(summary='Change feed statistics for this process')
+    @action(detail=False, methods=['get'], url_path='event-stats', permission_classes=[IsAdminUser], pagination_class=None)
+    def event_stats(self, request):
+        # open /api/async/events/ streams and delivery latency; see notes.events
+        return Response(events.metrics.snapshot())
+
+    @extend_schema(
+        summary='Export notes',
+        parameters=[
+            OpenApiParameter('category', OpenApiTypes.UUID, description='Only export notes in this category'),
+            OpenApiParameter('output', OpenApiTypes.STR, enum=[*exports.CONTENT_TYPES], description='ndjson (default) or json'),
+            OpenApiParameter('gzip', OpenApiTypes.BOOL, description='Gzip the export file'),
+        ],
+        responses={(200, content_type): OpenApiTypes.BINARY for content_type in exports.CONTENT_TYPES.values()},
+    )
+    @action(detail=False, methods=['get'], pagination_class=None)
+    def export(self, request):
+        # streamed straight from a database cursor; see notes.exports
+        output = request.query_params.get("output", "ndjson")
+        if output not in exports.CONTENT_TYPES:
+            return Response(
+                {"detail": f"output must be one of: {', '.join(exports.CONTENT_TYPES)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        compress = request.query_params.get("gzip", "").lower() in ("1", "true")
+        asynchronous = isinstance(request._request, ASGIRequest)
+        return exports.export_response(self.get_queryset(), output, compress, asynchronous)
+
+    # Batch writes; see notes.bulk. Each validates the whole batch, reports
+    # per-item errors by position and applies nothing unless every item is valid.
+    def get_batch_serializer(self, serializer_class, many=False, **context):
+        context = {**self.get_serializer_context(), **context}
+        if many:
+            return serializer_class(
+                data=self.request.data, many=True, allow_empty=False,
+                max_length=bulk.MAX_BATCH_SIZE, context=context,
+            )
+        return serializer_class(data=self.request.data, context=context)
+
+    def batch_note_ids(self):
+        """Ids of the notes a batch refers to: each item's ``id``, or the ``ids`` list."""
+        data = self.request.data
+        if isinstance(data, list):
+            values = [item.get("id") for item in data if isinstance(item, dict)]
+        else:
+            values = data.get("ids") if isinstance(data, dict) else None
+        return bulk.requested_ids(values if isinstance(values, list) else [])
+
+    @extend_schema(
+        summary='Create notes in bulk',
+        request=NoteBatchCreateSerializer(many=True),
+        responses={201: NoteSerializer(many=True)},
+    )
+    @action(detail=False, methods=['post'], url_path='bulk-create')
+    def bulk_create(self, request):
+        categories = bulk.user_categories(request.user)
+        serializer = self.get_batch_serializer(NoteBatchCreateSerializer, many=True, categories=categories)
+        serializer.is_valid(raise_exception=True)
+        notes = bulk.create_notes(request.user, serializer.validated_data, categories)
+        return Response(self.get_serializer(notes, many=True).data, status=status.HTTP_201_CREATED)
+
+    @extend_schema(
+        summary='Update notes in bulk',
+        request=NoteBatchUpdateSerializer(many=True),
+        responses={200: NoteSerializer(many=True)},
+    )
+    @action(detail=False, methods=['post'], url_path='bulk-update')
+    def bulk_update(self, request):
+        with transaction.atomic():
+            # locked from load to write, so the counts move from the categories the notes are in
+            notes = bulk.user_notes(request.user, self.batch_note_ids(), lock=True)
+            serializer = self.get_batch_serializer(
+                NoteBatchUpdateSerializer, many=True,
+                categories=bulk.user_categories(request.user), notes=notes,
+            )
+            serializer.is_valid(raise_exception=True)
+            edited = bulk.update_notes(serializer.validated_data, notes)
+        return Response(self.get_serializer(edited, many=True).data)
+
+    @extend_schema(summary='Move notes to a category in bulk', request=NoteBatchMoveSerializer)
+    @action(detail=False, methods=['post'], url_path='bulk-move')
+    def bulk_move(self, request):
+        note_ids = bulk.existing_note_ids(request.user, self.batch_note_ids())
+        serializer = self.get_batch_serializer(
+            NoteBatchMoveSerializer, categories=bulk.user_categories(request.user), note_ids=note_ids,
+        )
+        serializer.is_valid(raise_exception=True)
+        moved = bulk.move_notes(request.user, serializer.validated_data["ids"], serializer.validated_data["category"])
+        return Response({"moved": moved})
+
+    @extend_schema(summary='Delete notes in bulk', request=NoteBatchDeleteSerializer)
+    @action(detail=False, methods=['post'], url_path='bulk-delete')
+    def bulk_delete(self, request):
+        note_ids = bulk.existing_note_ids(request.user, self.batch_note_ids())
+        serializer = self.get_batch_serializer(NoteBatchDeleteSerializer, note_ids=note_ids)
+        serializer.is_valid(raise_exception=True)
+        bulk.delete_notes(request.user, serializer.validated_data["ids"])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+@extend_schema(tags=['Jobs'])
+@extend_schema_view(
+    list=extend_schema(summary='List jobs'),
+    retrieve=extend_schema(summary='Job status and progress'),
+)
+class JobViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """Background jobs of the current user; run by ``manage.py run_jobs``, see notes.jobs."""
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = JobPagination
+
+    def get_queryset(self):
+        return Job.objects.filter(user=self.request.user).defer("params")
+
+    @extend_schema(summary='Queue a job', request=JobCreateSerializer, responses={202: JobSerializer})
+    def create(self, request):
+        serializer = JobCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        kind = serializer.validated_data["kind"]
+        if kind == "reindex" and not request.user.is_staff:
+            raise PermissionDenied("Only staff can rebuild the search index.")
+        job = jobs.enqueue(kind, request.user, **serializer.validated_data["params"])
+        response = Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+        response["Location"] = reverse("job-detail", kwargs={"pk": job.pk}, request=request)
+        return response
+
+    @extend_schema(summary='Download the file an export job wrote', responses={(200, 'application/octet-stream'): OpenApiTypes.BINARY})
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if job.kind != "export" or job.status != Job.SUCCEEDED:
+            raise NotFound("This job has no file to download.")
+        try:
+            file = open(jobs.result_path(job), "rb")
+        except FileNotFoundError:
+            raise NotFound("The export file has been removed.")
+        response = FileResponse(
+            file, as_attachment=True, filename=job.result["file"], content_type=job.result["content_type"],
+        )
+        response["Cache-Control"] = "private, no-store"
+        return response
 
 
 class HealthCheck(APIView):
     permission_classes = [AllowAny]
+    # polled by load balancers and monitors
+    throttle_classes = []
 
     @extend_schema(tags=['Health'], summary='Health check')
     def get(self, request):
         return Response({"status": "ok"}, status=200)
+
+
+class Metrics(APIView):
+    """Request metrics in the Prometheus text format, for scrapers rather than users."""
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    throttle_classes = []
+
+    @extend_schema(tags=['Health'], summary='Request metrics (Prometheus)', responses={(200, 'text/plain'): OpenApiTypes.STR})
+    def get(self, request):
+        # closed until a token is configured, so the defaults expose nothing
+        token = getattr(settings, 'METRICS_TOKEN', None)
+        if not token or not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            raise PermissionDenied('A valid metrics token is required.')
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,106 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+
+class UserCache:
+    """
+    Small in-process LRU of users, with entries that expire after ``ttl`` seconds.
+
+    Entries are keyed by ``(user id, token issue time)``. Saving or deleting a
+    user drops all of that user's entries in this process (see users.signals);
+    other processes notice within ``ttl``.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, user = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+        # each request gets its own copy, so one cannot mutate another's user
+        return copy.copy(user)
+
+    def set(self, key, user):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, copy.copy(user))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        user_id = str(user_id)
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == user_id]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+user_cache = UserCache(
+    maxsize=getattr(settings, 'JWT_USER_CACHE_SIZE', 1024),
+    ttl=getattr(settings, 'JWT_USER_CACHE_TTL', 60),
+)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that skips the users-table lookup for recently seen tokens.
+
+    A cache miss goes through JWTAuthentication.get_user, so the active and
+    revoked-token checks run before a user is cached.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return super().get_user(validated_token)
+        key = (str(user_id), validated_token.get('iat'))
+        user = user_cache.get(key)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(key, user)
+        return user
+
+    async def aauthenticate(self, request):
+        """authenticate() for async views; only a cache miss leaves the event loop."""
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is not None:
+            user = user_cache.get((str(user_id), validated_token.get('iat')))
+            if user is not None:
+                return user
+        return await sync_to_async(self.get_user)(validated_token)
+
+
+class CachedJWTScheme(SimpleJWTScheme):
+    # document CachedJWTAuthentication like the JWTAuthentication it extends
+    target_class = 'users.authentication.CachedJWTAuthentication'
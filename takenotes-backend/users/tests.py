@@ -1,9 +1,17 @@
+from asgiref.sync import async_to_sync
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
 
 from notes.models import Category
+from users import throttling
+from users.authentication import UserCache
 from users.views import DEFAULT_CATEGORIES
 
 
@@ -42,3 +50,170 @@ class UsersAuthTest(APITestCase):
         res2 = self.client.post(url_refresh, {"refresh": res.data["refresh"]}, format='json')
         self.assertEqual(res2.status_code, status.HTTP_200_OK)
         self.assertIn("access", res2.data)
+
+
+class RegisterProvisioningTest(APITestCase):
+    url = reverse('register')
+
+    def test_register_is_one_transaction_with_one_category_insert(self):
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.post(self.url, {"username": "burst@example.com", "password": "pass1234"}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        inserts = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("INSERT")]
+        self.assertEqual(len(inserts), 2)
+        self.assertEqual(sum('"notes_category"' in sql for sql in inserts), 1)
+
+    @override_settings(DEFAULT_USER_CATEGORIES=[("Inbox", "#000000"), ("Work", "#10B981")])
+    def test_default_categories_are_configurable(self):
+        res = self.client.post(self.url, {"username": "custom@example.com", "password": "pass1234"}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        names = set(Category.objects.filter(user_id=res.data["id"]).values_list("name", flat=True))
+        self.assertEqual(names, {"Inbox", "Work"})
+
+class CachedJWTAuthenticationTest(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="jwt@example.com", password="pass1234")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        self.url = reverse('category-list')
+
+    def queries_for_request(self):
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(self.url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [q["sql"] for q in ctx.captured_queries]
+
+    def test_repeat_requests_skip_the_user_lookup(self):
+        first = self.queries_for_request()
+        self.assertTrue(any('"users_user"' in sql for sql in first))
+        again = self.queries_for_request()
+        self.assertFalse(any('"users_user"' in sql for sql in again))
+
+    def test_deactivating_a_user_takes_effect_immediately(self):
+        self.queries_for_request()
+        self.user.is_active = False
+        self.user.save()
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_cache_evicts_least_recently_used_and_expired_entries(self):
+        cache = UserCache(maxsize=2, ttl=60)
+        cache.set(("a", 1), self.user)
+        cache.set(("b", 1), self.user)
+        cache.get(("a", 1))
+        cache.set(("c", 1), self.user)
+        self.assertIsNone(cache.get(("b", 1)))
+        self.assertIsNotNone(cache.get(("a", 1)))
+
+        cache.ttl = -1
+        cache.set(("d", 1), self.user)
+        self.assertIsNone(cache.get(("d", 1)))
+
+
+def throttle_rates(**rates):
+    """override_settings for REST_FRAMEWORK with only the given throttle rates set."""
+    defaults = dict.fromkeys(settings.REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"])
+    return override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {**defaults, **rates}})
+
+
+class ThrottlingTest(APITestCase):
+    def setUp(self):
+        throttling.get_store.cache_clear()
+        self.addCleanup(throttling.get_store.cache_clear)
+        throttling.get_store().clear()
+        self.user = get_user_model().objects.create_user(username="busy@example.com", password="pass1234")
+
+    def login(self, ip="10.0.0.1"):
+        return self.client.post(
+            reverse('token_obtain_pair'), {"username": "busy@example.com", "password": "wrong"},
+            format='json', REMOTE_ADDR=ip,
+        )
+
+    def test_bucket_spends_and_refills_tokens(self):
+        allowed, wait, state = throttling.take_token(None, 100.0, 2, 1.0)
+        self.assertTrue(allowed)
+        allowed, wait, state = throttling.take_token(state, 100.0, 2, 1.0)
+        self.assertTrue(allowed)
+        allowed, wait, state = throttling.take_token(state, 100.5, 2, 1.0)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 0.5)
+        allowed, wait, state = throttling.take_token(state, 101.0, 2, 1.0)
+        self.assertTrue(allowed)
+        # never more than the burst, however long the key sat idle
+        _, _, state = throttling.take_token(state, 10_000.0, 2, 1.0)
+        self.assertEqual(state[0], 1)
+
+    @throttle_rates(login="3/min")
+    def test_login_attempts_are_limited_per_ip(self):
+        for _ in range(3):
+            self.assertEqual(self.login().status_code, status.HTTP_401_UNAUTHORIZED)
+        res = self.login()
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        # a token comes back every 20 s; the failed logins themselves took some of that
+        self.assertIn(int(res["Retry-After"]), range(15, 21))
+        self.assertEqual(self.login(ip="10.0.0.2").status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @throttle_rates(login="100/min", login_endpoint="2/min")
+    def test_endpoint_ceiling_holds_across_ips(self):
+        self.assertEqual(self.login(ip="10.0.0.1").status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.login(ip="10.0.0.2").status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.login(ip="10.0.0.3").status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @throttle_rates(login="3/min", login_endpoint="10/min")
+    def test_requests_refused_per_ip_leave_the_endpoint_bucket_alone(self):
+        for _ in range(20):
+            self.login(ip="10.0.0.1")
+        self.assertEqual(self.login(ip="10.0.0.2").status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @throttle_rates(login="1/min")
+    def test_forwarded_for_is_ignored_without_proxies(self):
+        self.assertEqual(self.login().status_code, status.HTTP_401_UNAUTHORIZED)
+        res = self.client.post(
+            reverse('token_obtain_pair'), {"username": "busy@example.com", "password": "wrong"},
+            format='json', REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR="203.0.113.9",
+        )
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @throttle_rates(register="1/hour")
+    def test_register_is_limited_per_ip(self):
+        url = reverse('register')
+        res = self.client.post(url, {"username": "one@example.com", "password": "pass1234"}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        res = self.client.post(url, {"username": "two@example.com", "password": "pass1234"}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(res["Retry-After"], "3600")
+
+    @throttle_rates(user="2/min")
+    def test_requests_are_limited_per_user_on_sync_and_async_views(self):
+        self.client.force_authenticate(self.user)
+        for _ in range(2):
+            self.assertEqual(self.client.get(reverse('category-list')).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(reverse('note-list')).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        # the async views spend from the same bucket
+        res = async_to_sync(self.async_client.get)(
+            reverse('async-note-list'), headers={"Authorization": f"Bearer {AccessToken.for_user(self.user)}"},
+        )
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(res["Retry-After"], "30")
+
+        other = get_user_model().objects.create_user(username="idle@example.com")
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(reverse('note-list')).status_code, status.HTTP_200_OK)
+        # health checks are never throttled
+        self.assertEqual(self.client.get(reverse('health')).status_code, status.HTTP_200_OK)
+
+    @override_settings(THROTTLE_STORE="users.throttling.CacheBucketStore")
+    @throttle_rates(login="2/min")
+    def test_cache_store_is_shared_between_processes(self):
+        throttling.get_store.cache_clear()
+        throttling.get_store().clear()
+        self.assertEqual(self.login().status_code, status.HTTP_401_UNAUTHORIZED)
+        # another worker's store sees the same bucket
+        other_worker = throttling.CacheBucketStore()
+        self.assertEqual(other_worker.take("throttle_bucket_login_10.0.0.1", 2, 2 / 60)[0], True)
+        self.assertEqual(self.login().status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_unset_rates_turn_throttles_off(self):
+        with throttle_rates():
+            for _ in range(20):
+                self.assertNotEqual(self.login().status_code, status.HTTP_429_TOO_MANY_REQUESTS)
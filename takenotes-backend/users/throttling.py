@@ -0,0 +1,200 @@
+"""
+Token-bucket request throttles.
+
+DRF's SimpleRateThrottle keeps a list of request times per key and trims it on
+every request, which is O(n) in the rate. A token bucket keeps two numbers per
+key instead: the tokens left and when they were counted. A key starts with
+``num_requests`` tokens, regains them at ``num_requests / period`` per second
+and spends one per request, so each decision is O(1) and short bursts up to
+the full rate are allowed.
+
+Rates come from ``REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"]``, looked up per
+request; a rate of None turns a throttle off. Buckets live in the store named
+by ``THROTTLE_STORE``: ``LocalBucketStore`` (per process, the default) or
+``CacheBucketStore``, which keeps them in the ``THROTTLE_CACHE`` cache so that
+all workers share them.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle, SimpleRateThrottle
+
+
+def take_token(state, now, capacity, rate):
+    """
+    Spend a token from a bucket in ``state`` (``(tokens, counted_at)``, or None
+    for a full bucket). Returns whether one was left, the seconds until one is,
+    and the new state.
+    """
+    tokens, counted_at = state or (capacity, now)
+    tokens = min(capacity, tokens + max(0.0, now - counted_at) * rate)
+    if tokens >= 1:
+        return True, 0.0, (tokens - 1, now)
+    return False, (1 - tokens) / rate, (tokens, now)
+
+
+class LocalBucketStore:
+    """
+    Buckets in this process, in an LRU of at most ``THROTTLE_LOCAL_MAX_KEYS`` keys.
+
+    An evicted key starts again with a full bucket, which only the least
+    recently seen clients can get.
+    """
+
+    def __init__(self):
+        self.maxsize = getattr(settings, 'THROTTLE_LOCAL_MAX_KEYS', 100_000)
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, key, capacity, rate):
+        now = time.monotonic()
+        with self.lock:
+            allowed, wait, self.buckets[key] = take_token(self.buckets.get(key), now, capacity, rate)
+            self.buckets.move_to_end(key)
+            if len(self.buckets) > self.maxsize:
+                self.buckets.popitem(last=False)
+        return allowed, wait
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+class CacheBucketStore:
+    """
+    Buckets in the ``THROTTLE_CACHE`` cache (default ``'default'``), shared by
+    every process that uses it.
+
+    Each decision is one get and one set, not an atomic update, so requests
+    racing on the same key from several workers can let a few extra through.
+    """
+
+    def __init__(self):
+        self.cache = caches[getattr(settings, 'THROTTLE_CACHE', 'default')]
+
+    def take(self, key, capacity, rate):
+        allowed, wait, state = take_token(self.cache.get(key), time.time(), capacity, rate)
+        # once the bucket has refilled the entry is no longer needed
+        self.cache.set(key, state, timeout=math.ceil(capacity / rate) + 1)
+        return allowed, wait
+
+    def clear(self):
+        self.cache.clear()
+
+
+@lru_cache(maxsize=None)
+def get_store():
+    path = getattr(settings, 'THROTTLE_STORE', 'users.throttling.LocalBucketStore')
+    return import_string(path)()
+
+
+class BucketThrottle(SimpleRateThrottle):
+    """SimpleRateThrottle with a token bucket per key in place of a request history."""
+    # not SimpleRateThrottle's keys, whose cache entries hold request histories
+    cache_format = 'throttle_bucket_%(scope)s_%(ident)s'
+
+    def __init__(self):
+        # the rate depends on the view for scoped throttles, so it is read in allow_request
+        self.retry_after = None
+
+    def get_scope(self, view):
+        return self.scope
+
+    def get_rate(self):
+        try:
+            return api_settings.DEFAULT_THROTTLE_RATES[self.scope]
+        except KeyError:
+            raise ImproperlyConfigured(f"No default throttle rate set for '{self.scope}' scope")
+
+    def allow_request(self, request, view):
+        self.scope = self.get_scope(view)
+        if self.scope is None:
+            return True
+        self.rate = self.get_rate()
+        if self.rate is None:
+            return True
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+        capacity, duration = self.parse_rate(self.rate)
+        allowed, self.retry_after = get_store().take(key, capacity, capacity / duration)
+        return allowed
+
+    def wait(self):
+        # rounded up, so a client that waits the Retry-After it is sent gets through
+        return math.ceil(self.retry_after)
+
+
+class UserThrottle(BucketThrottle):
+    """Requests per authenticated user."""
+    scope = 'user'
+
+    def get_cache_key(self, request, view):
+        if not request.user or not request.user.is_authenticated:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': request.user.pk}
+
+
+class AnonThrottle(BucketThrottle):
+    """Unauthenticated requests per client IP."""
+    scope = 'anon'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class ScopedIPThrottle(BucketThrottle):
+    """Requests per client IP to views sharing a ``throttle_scope``, signed in or not."""
+
+    def get_scope(self, view):
+        return getattr(view, 'throttle_scope', None)
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class EndpointThrottle(BucketThrottle):
+    """
+    All requests to views sharing a ``throttle_scope``, from every client, under
+    the ``<scope>_endpoint`` rate: a ceiling on what the endpoint costs overall,
+    such as the password hashing behind login, however many IPs a burst comes from.
+    Use it through ScopedThrottle, so requests refused per IP spend nothing here.
+    """
+
+    def get_scope(self, view):
+        scope = getattr(view, 'throttle_scope', None)
+        return f'{scope}_endpoint' if scope else None
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': 'all'}
+
+
+class ScopedThrottle(BaseThrottle):
+    """
+    ScopedIPThrottle, then EndpointThrottle for the requests it lets through.
+
+    DRF asks every throttle in ``throttle_classes`` even after one has refused,
+    so listing the two would let one client's refused requests drain the
+    endpoint's shared bucket and lock every other client out.
+    """
+    throttles = (ScopedIPThrottle, EndpointThrottle)
+
+    def allow_request(self, request, view):
+        for throttle_class in self.throttles:
+            self.throttle = throttle_class()
+            if not self.throttle.allow_request(request, view):
+                return False
+        return True
+
+    def wait(self):
+        return self.throttle.wait()
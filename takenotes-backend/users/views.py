@@ -1,4 +1,5 @@
-from django.db import IntegrityError
+from django.conf import settings
+from django.db import transaction
 from rest_framework import status
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
@@ -7,18 +8,27 @@ from drf_spectacular.utils import extend_schema
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
  
 from .serializers import UserRegisterSerializer
+from .throttling import ScopedThrottle
 from notes.models import Category
 
-# Default categories to auto-create for a new user
+# Default categories to auto-create for a new user; a deployment can replace
+# them with a DEFAULT_USER_CATEGORIES setting of (name, color) pairs
 DEFAULT_CATEGORIES = [
     ("Random Thoughts", "#A78BFA"),  # purple-400
     ("School", "#60A5FA"),           # blue-400
     ("Personal", "#F59E0B"),         # amber-500
 ]
 
+
+def default_categories():
+    return getattr(settings, "DEFAULT_USER_CATEGORIES", DEFAULT_CATEGORIES)
+
+
 @extend_schema(tags=['Auth'], summary='Obtain JWT token pair', operation_id='auth_token_obtain_pair')
 class TokenObtainPairPatchedView(TokenObtainPairView):
-    pass
+    # each attempt hashes a password, so cap attempts per IP and overall
+    throttle_classes = [ScopedThrottle]
+    throttle_scope = 'login'
 
 @extend_schema(tags=['Auth'], summary='Refresh JWT access token', operation_id='auth_token_refresh')
 class TokenRefreshPatchedView(TokenRefreshView):
@@ -27,19 +37,21 @@ class TokenRefreshPatchedView(TokenRefreshView):
 @extend_schema(tags=['Auth'], summary='Register new user')
 class RegisterView(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [ScopedThrottle]
+    throttle_scope = 'register'
 
     def post(self, request):
         serializer = UserRegisterSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        user = serializer.save()
-
-        # Create default categories for the new user
-        for name, color in DEFAULT_CATEGORIES:
-            try:
-                Category.objects.create(user=user, name=name, color=color)
-            except IntegrityError:
-                # In case of racing or duplicates, ignore
-                pass
+
+        # The user and their default categories are written in one transaction,
+        # the categories with a single INSERT
+        with transaction.atomic():
+            user = serializer.save()
+            Category.objects.bulk_create(
+                [Category(user=user, name=name, color=color) for name, color in default_categories()],
+                ignore_conflicts=True,
+            )
 
         # Issue JWT tokens
         try:
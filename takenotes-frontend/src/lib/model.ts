@@ -22,7 +22,8 @@ export interface Note {
 export type ApiNote = {
   id: string;
   title: string;
-  content: string;
+  content?: string; // left out of card lists (?view=cards)
+  preview?: string; // start of content, for note cards
   category: string | null;
   category_name?: string;
   category_color?: string;
@@ -32,6 +33,12 @@ export type ApiNote = {
   last_edited_label?: string;
 };
 
+// Cursor-paginated notes list response
+export type ApiNotePage = {
+  next: string | null;
+  results: ApiNote[];
+};
+
 // UI-augmented Note shape used by the app
 export type NoteWithExtras = Note & {
   category_name?: string;
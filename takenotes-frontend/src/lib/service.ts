@@ -4,7 +4,7 @@
 
 import axios, { AxiosError } from 'axios';
 import type { InternalAxiosRequestConfig, AxiosRequestHeaders } from 'axios';
-import { Category, CategoryId, Note, User, ApiNote, NoteWithExtras } from './model';
+import { Category, CategoryId, Note, User, ApiNote, ApiNotePage, NoteWithExtras } from './model';
 
 const BASE = 'http://localhost:8000';
 const AUTH = {
@@ -117,8 +117,7 @@ export async function getCategories(): Promise<Category[]> {
 
 export async function getCategoryCounts(_userId: string): Promise<Record<string, number>> {
   // Build counts by category_name from the notes list (server provides category_name on each note)
-  const { data } = await http.get('/api/notes/');
-  const apiNotes = data as ApiNote[];
+  const apiNotes = await listAllNotes('/api/notes/?fields=category_name');
   const counts: Record<string, number> = {};
   for (const noteDto of apiNotes) {
     const name = noteDto.category_name || 'Uncategorized';
@@ -128,12 +127,26 @@ export async function getCategoryCounts(_userId: string): Promise<Record<string,
 }
 
 // Notes
+// The notes list is cursor-paginated: follow `next` links until the last page
+async function listAllNotes(path: string): Promise<ApiNote[]> {
+  const notes: ApiNote[] = [];
+  let url: string | null = path;
+  while (url) {
+    const { data } = await http.get(url);
+    const page = data as ApiNotePage;
+    notes.push(...page.results);
+    url = page.next;
+  }
+  return notes;
+}
+
 function toNote(dto: ApiNote): NoteWithExtras {
   const base: NoteWithExtras = {
     id: dto.id,
     userId: 'me',
     title: dto.title ?? '',
-    content: dto.content ?? '',
+    // card lists carry only the preview; the editor loads the full note by id
+    content: dto.content ?? dto.preview ?? '',
     categoryId: (dto.category ?? 'random') as unknown as CategoryId,
     createdAt: dto.created_at,
     updatedAt: dto.updated_at,
@@ -146,8 +159,7 @@ function toNote(dto: ApiNote): NoteWithExtras {
 }
 
 export async function getNotes(_userId: string): Promise<NoteWithExtras[]> {
-  const { data } = await http.get('/api/notes/');
-  return (data as ApiNote[]).map(toNote);
+  return (await listAllNotes('/api/notes/?view=cards')).map(toNote);
 }
 
 export async function filterNotesByCategory(_userId: string, categoryId?: CategoryId): Promise<NoteWithExtras[]> {
@@ -164,8 +176,7 @@ export async function filterNotesByCategory(_userId: string, categoryId?: Catego
       (categoryId === 'personal' && nameLookup['personal']) ||
       (categoryId as string);
   }
-  const { data } = await http.get(`/api/notes/?category=${encodeURIComponent(resolvedCategoryId)}`);
-  return (data as ApiNote[]).map(toNote);
+  return (await listAllNotes(`/api/notes/?view=cards&category=${encodeURIComponent(resolvedCategoryId)}`)).map(toNote);
 }
 
 export async function getNoteById(_userId: string, noteId: string): Promise<Note | null> {